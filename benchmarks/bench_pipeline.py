@@ -0,0 +1,251 @@
+'''
+End-to-end benchmark of the pipeline's hot paths on synthetic data.
+
+    python benchmarks/bench_pipeline.py --rows 100000
+    python benchmarks/bench_pipeline.py --rows 1000000 --compare bench-old.json
+
+Everything runs in a scratch directory (``--workdir``, a temp dir by
+default) with its own ``data/`` and ``config/``, and the run fails if it
+wrote to the repository's ``data/`` instead:
+
+- generate: synthetic Thai/English tweets in ``scrape_tag`` output shape,
+  post times parsed with the real ``parse_post_time``;
+- store: ``update.store_tag`` in chunks of ``--chunk-rows``, like
+  consecutive scrape runs, then ``compact_tag``;
+- read: ``extraction.get_tweet_data`` over the whole tag;
+- extract: ``extraction.extract`` on a ``--extract-rows`` sample tag with
+  ``fake_genai.FakeClient`` and no rate limit;
+- lakefs_load / lakefs_sync: ``result_load.load_tweets`` and
+  ``lakefs_sync.sync_to_lakefs`` against a local S3 stand-in (a moto
+  server when moto is installed, a local directory otherwise);
+- dashboard: cold and warm ``faq_data.query_topic_counts`` (skipped when
+  streamlit is not installed).
+
+Every stage reports seconds, rows/s and the process's peak RSS so far. The
+results are written as JSON (``--output``); ``--compare`` prints the change
+per stage against an earlier result file.
+'''
+
+import argparse
+from importlib import metadata
+import json
+import logging
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime
+from pathlib import Path
+
+
+bench_dir = Path(__file__).resolve().parent
+repo_dir = bench_dir / ".."
+sys.path.append(str(repo_dir / "pipeline"))
+sys.path.append(str(repo_dir / "frontend"))
+
+from synthetic import synthetic_tweets, add_post_time
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / 1024 ** 2 if sys.platform == "darwin" else peak / 1024
+
+
+class Stages:
+    def __init__(self):
+        self.results = {}
+
+    def run(self, name: str, fn, rows: int = None):
+        start = time.perf_counter()
+        extra = fn() or {}
+        seconds = time.perf_counter() - start
+        result = {"seconds": round(seconds, 4), "peak_rss_mb": round(peak_rss_mb(), 1)}
+        rows = extra.pop("rows", rows)
+        if rows is not None:
+            result["rows"] = rows
+            result["rows_per_s"] = round(rows / max(seconds, 1e-9), 1)
+        result.update(extra)
+        self.results[name] = result
+        rate = f", {result['rows_per_s']:,.0f} rows/s" if "rows_per_s" in result else ""
+        print(f"{name:<14} {seconds:9.3f}s{rate}, peak RSS {result['peak_rss_mb']:,.0f} MB", flush=True)
+
+    def skip(self, name: str, reason: str):
+        self.results[name] = {"skipped": reason}
+        print(f"{name:<14} skipped: {reason}", flush=True)
+
+
+def local_s3(workdir: Path):
+    """A moto S3 server when moto is installed, else a local directory filesystem."""
+    try:
+        from moto.server import ThreadedMotoServer
+        import s3fs
+    except ImportError:
+        import fsspec
+        return fsspec.filesystem("file", auto_mkdir=True), "local-dir", None
+
+    server = ThreadedMotoServer(port=0)
+    server.start()
+    host, port = server.get_host_and_port()
+    fs = s3fs.S3FileSystem(key="bench", secret="bench", client_kwargs={"endpoint_url": f"http://{host}:{port}"})
+    return fs, "moto", server
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=repo_dir, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def data_files(roots) -> dict:
+    """Path -> mtime of everything under ``roots``, to catch writes outside the workdir."""
+    files = {}
+    for root in roots:
+        if root.exists():
+            files.update((path, path.stat().st_mtime_ns) for path in root.rglob("*"))
+    return files
+
+
+def compare(results: dict, baseline: dict, baseline_path: Path):
+    print(f"\ncompared with {baseline_path}:")
+    for name, result in results.items():
+        before = baseline.get(name, {})
+        if "seconds" not in result or "seconds" not in before:
+            continue
+        change = (result["seconds"] - before["seconds"]) / max(before["seconds"], 1e-9) * 100
+        print(f"{name:<14} {before['seconds']:9.3f}s -> {result['seconds']:9.3f}s ({change:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100_000, help="tweets to generate (10k to 10M)")
+    parser.add_argument("--chunk-rows", type=int, default=100_000, help="tweets per simulated scrape run")
+    parser.add_argument("--extract-rows", type=int, default=2_000, help="tweets sent through extract")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="seconds per fake Gemini call")
+    parser.add_argument("--days", type=int, default=30, help="post times are spread over this many days")
+    parser.add_argument("--mode", choices=["network", "dom"], default="network")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", type=Path, default=None)
+    parser.add_argument("--output", type=Path, default=Path(f"bench-pipeline-{datetime.now():%Y%m%d-%H%M%S}.json"))
+    parser.add_argument("--compare", type=Path, default=None, help="earlier result JSON to compare with")
+    args = parser.parse_args()
+
+    output = args.output.resolve()
+    # read the baseline first, so a wrong path fails before the run
+    baseline = json.loads(args.compare.read_text())["stages"] if args.compare else None
+    workdir = (args.workdir or Path(tempfile.mkdtemp(prefix="bench-pipeline-"))).resolve()
+    (workdir / "data").mkdir(parents=True, exist_ok=True)
+    # x_scrap only takes the working directory's data/ when config/ is there too
+    (workdir / "config").mkdir(exist_ok=True)
+    outside = [root for root in (repo_dir.resolve() / "data",) if workdir not in (root, *root.parents)]
+    outside_before = data_files(outside)
+    # the pipeline modules resolve ``data/`` relative to the working directory on import
+    os.chdir(workdir)
+
+    import update
+    import extraction
+    import result_load
+    import lakefs_sync
+    from llm_engine import RateLimiter
+    from fake_genai import FakeClient
+
+    logging.getLogger().setLevel(logging.WARNING)
+    data_dir = Path("data")
+    extraction.rate_limiter = RateLimiter(rpm=10 ** 9, tpm=10 ** 12)
+    fake_client = FakeClient(latency=args.llm_latency, seed=args.seed)
+    extraction.set_client(fake_client)
+
+    tag, sample_tag = "bench", "benchsample"
+    stages = Stages()
+    chunks = []
+
+    def generate():
+        start = 0
+        while start < args.rows:
+            rows = min(args.chunk_rows, args.rows - start)
+            chunk = synthetic_tweets(rows, tag=tag, seed=args.seed + len(chunks), days=args.days,
+                                     mode=args.mode, id_offset=start)
+            chunks.append(add_post_time(chunk))
+            start += rows
+        return {"rows": args.rows, "chunks": len(chunks)}
+
+    def store():
+        stored = 0
+        while chunks:
+            stored += update.store_tag(tag, chunks.pop(0))
+        return {"rows": args.rows, "stored": stored}
+
+    def compact():
+        return {"partitions": update.compact_tag(tag, min_files=2)}
+
+    def read():
+        df = extraction.get_tweet_data(tag, new_only=False)
+        return {"rows": len(df)}
+
+    def extract():
+        sample = add_post_time(synthetic_tweets(min(args.extract_rows, args.rows), tag=sample_tag, seed=args.seed,
+                                                days=args.days, mode=args.mode))
+        update.store_tag(sample_tag, sample)
+        calls = fake_client.calls
+        added = extraction.extract(sample_tag)
+        return {"rows": len(sample), "faq_rows": 0 if added is None else len(added),
+                "llm_calls": fake_client.calls - calls}
+
+    stages.run("generate", generate)
+    stages.run("store", store)
+    stages.run("compact", compact)
+    stages.run("read", read)
+    stages.run("extract", extract)
+
+    fs, s3_kind, server = local_s3(workdir)
+    if s3_kind == "moto":
+        fs.mkdir(result_load.repo)
+    result_load.set_fs(fs)
+    try:
+        stages.run("lakefs_load", lambda: {k: v for k, v in result_load.load_tweets().items() if k != "seconds"})
+        stages.run("lakefs_sync", lambda: lakefs_sync.sync_to_lakefs(fs=fs, commit=False))
+    finally:
+        if server is not None:
+            server.stop()
+
+    try:
+        # frontend/streamlit.py would shadow a missing streamlit package
+        metadata.version("streamlit")
+    except metadata.PackageNotFoundError:
+        stages.skip("dashboard_cold", "streamlit is not installed")
+    else:
+        import faq_data
+
+        tags = (sample_tag,)
+        first, last = faq_data.date_bounds(data_dir / "faq", data_dir / "faq_agg", tags) or (date.today(), date.today())
+        query = lambda: {"topics": len(faq_data.query_topic_counts(data_dir / "faq", data_dir / "faq_agg", tags, first, last))}
+        faq_data.clear_cache()
+        stages.run("dashboard_cold", query)
+        stages.run("dashboard_warm", query)
+
+    report = {
+        "meta": {
+            "rows": args.rows, "chunk_rows": args.chunk_rows, "extract_rows": args.extract_rows,
+            "llm_latency": args.llm_latency, "days": args.days, "mode": args.mode, "seed": args.seed,
+            "s3": s3_kind, "commit": git_commit(), "python": platform.python_version(),
+            "platform": platform.platform(), "cpus": os.cpu_count(), "time": datetime.now().isoformat(timespec="seconds"),
+            "workdir": str(workdir),
+        },
+        "stages": stages.results,
+    }
+    output.write_text(json.dumps(report, indent=2, ensure_ascii=False))
+    print(f"\nresults written to {output}")
+    if baseline:
+        compare(stages.results, baseline, args.compare)
+
+    written = sorted(str(path) for path, mtime in data_files(outside).items() if outside_before.get(path) != mtime)
+    assert not written, f"the benchmark wrote outside {workdir}: {written[:10]}"
+
+
+if __name__ == "__main__":
+    main()
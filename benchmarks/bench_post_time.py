@@ -0,0 +1,81 @@
+'''
+Benchmark the vectorized post-time parser against the row-wise one.
+
+    python benchmarks/bench_post_time.py --rows 100000
+
+Both parsers run over the same synthetic column of raw X post times
+("Jan 5, 2024", "May 3", "5h", "12m", "30s", ISO timestamps and some junk);
+the script fails if their outputs differ.
+'''
+
+import argparse
+import logging
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(str(Path(__file__).resolve().parent / ".." / "pipeline"))
+
+from x_scrap import parse_post_time, transform_post_time
+
+MONTHS = ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
+
+
+def synthetic_post_times(rows: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    kind = rng.choice(["full", "month_day", "h", "m", "s", "iso", "junk"], size=rows, p=[0.2, 0.3, 0.2, 0.15, 0.05, 0.08, 0.02])
+    month = rng.choice(MONTHS, size=rows)
+    day = rng.integers(1, 29, size=rows)
+    year = rng.integers(2020, 2026, size=rows)
+    amount = rng.integers(1, 60, size=rows)
+
+    raw = np.empty(rows, dtype=object)
+    for i in range(rows):
+        if kind[i] == "full":
+            raw[i] = f"{month[i]} {day[i]}, {year[i]}"
+        elif kind[i] == "month_day":
+            raw[i] = f"{month[i]} {day[i]}"
+        elif kind[i] in ("h", "m", "s"):
+            raw[i] = f"{amount[i]}{kind[i]}"
+        elif kind[i] == "iso":
+            raw[i] = f"{year[i]}-{MONTHS.index(month[i]) + 1:02d}-{day[i]:02d}T{amount[i] % 24:02d}:{amount[i]:02d}:00"
+        else:
+            raw[i] = "yesterday"
+
+    scrape_time = pd.Timestamp.now().floor("s") - pd.to_timedelta(rng.integers(0, 30 * 86400, size=rows), unit="s")
+    return pd.DataFrame({"postTimeRaw": raw, "scrapeTime": scrape_time})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    df = synthetic_post_times(args.rows, seed=args.seed)
+    # the row-wise parser logs every unparseable value
+    logging.getLogger("x_scrap").setLevel(logging.CRITICAL)
+
+    start = time.perf_counter()
+    row_wise = df.apply(lambda x: transform_post_time(x['postTimeRaw'], x['scrapeTime']), axis=1)
+    row_wise_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    vectorized = parse_post_time(df['postTimeRaw'], df['scrapeTime'])
+    vectorized_s = time.perf_counter() - start
+
+    pd.testing.assert_series_equal(
+        pd.to_datetime(row_wise), vectorized, check_names=False, check_dtype=False
+    )
+
+    print(f"rows:       {args.rows:,}")
+    print(f"row-wise:   {row_wise_s:.3f}s")
+    print(f"vectorized: {vectorized_s:.3f}s")
+    print(f"speedup:    {row_wise_s / vectorized_s:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+'''
+Offline evaluation of the extraction pre-filter against labelled FAQ output.
+
+    python benchmarks/eval_prefilter.py
+    python benchmarks/eval_prefilter.py DSI321 --thresholds 0.2 0.4 0.6 --all
+
+Labels come from ``extraction.labelled_tweets``: every tweet the extraction
+has processed (and Gemini saw) is an FAQ tweet or not. Each tag's tweets
+are run through ``prefilter.prefilter`` as one run with:
+
+- the rules alone;
+- the trained model at its calibrated threshold and at every
+  ``--thresholds`` value.
+
+Only the held-out fold the model was not fitted on is scored, unless
+``--all`` is given. For every setting the report has the tweets dropped
+(per reason), the FAQ tweets lost and the recall, and the prompt tokens of
+the planned Gemini requests with and without the pre-filter (estimated
+with ``llm_engine.estimate_tokens``, instruction and template included,
+topic list left out). Near-duplicates of an FAQ tweet are counted apart
+from the lost ones: an earlier copy of the question is still sent, only
+its repeat count goes down. The results are written as JSON (``--output``).
+'''
+
+import argparse
+import json
+import logging
+import sys
+from datetime import datetime
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent / ".." / "pipeline"))
+
+from batching import plan_batches, format_topics, format_message
+from extraction import labelled_tweets
+from llm_engine import estimate_tokens
+from prefilter import prefilter, rule_reasons, get_model, in_holdout
+from prompt_template import instruction, prompt_template
+from scheduler import load_tags
+
+
+def prompt_tokens(tweets) -> int:
+    """Estimated prompt tokens of the requests ``extract`` would plan for ``tweets``."""
+    rows = [{"index": i + 1, "tweetText": text} for i, text in enumerate(tweets["tweetText"])]
+    overhead = estimate_tokens(instruction)
+    return sum(
+        overhead + estimate_tokens(prompt_template.format(
+            faq_topic=format_topics([]), messages="\n".join(format_message(row) for row in batch),
+        ))
+        for batch in plan_batches(rows)
+    )
+
+
+def evaluate(labelled: dict, name: str, drop_reasons) -> dict:
+    """Score ``drop_reasons(tweets_df)`` (a drop reason per tweet, "" to send) over every tag."""
+    tweets = faq = lost = faq_duplicates = dropped_tweets = tokens_before = tokens_after = 0
+    reasons = {}
+    for tag, tweets_df in labelled.items():
+        drop_reason = drop_reasons(tweets_df)
+        dropped = drop_reason != ""
+        for reason, count in drop_reason[dropped].value_counts().items():
+            reasons[reason] = reasons.get(reason, 0) + int(count)
+        tweets += len(tweets_df)
+        dropped_tweets += int(dropped.sum())
+        faq += int(tweets_df["isFaq"].sum())
+        duplicate = drop_reason == "duplicate"
+        lost += int((tweets_df["isFaq"] & dropped & ~duplicate).sum())
+        faq_duplicates += int((tweets_df["isFaq"] & duplicate).sum())
+        tokens_before += prompt_tokens(tweets_df)
+        tokens_after += prompt_tokens(tweets_df[~dropped])
+
+    result = {
+        "setting": name, "tweets": tweets, "dropped": dropped_tweets, "dropped_by": reasons,
+        "faq_tweets": faq, "faq_lost": lost, "faq_duplicates_dropped": faq_duplicates, "recall": round(1 - lost / faq, 4) if faq else None,
+        "prompt_tokens": tokens_before, "prompt_tokens_after": tokens_after,
+        "tokens_saved": round(1 - tokens_after / tokens_before, 4) if tokens_before else None,
+    }
+    recall = f"{result['recall']:.3f}" if faq else "-"
+    saved = f"{result['tokens_saved']:.1%}" if tokens_before else "-"
+    print(f"{name:<18} dropped {dropped_tweets:>7} of {tweets:<7} lost {lost:>5} of {faq:<5} FAQ "
+          f"(recall {recall}, {faq_duplicates} repeats), prompt tokens {tokens_before:>9} -> {tokens_after:<9} ({saved} saved)", flush=True)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("tags", nargs="*", help="defaults to the tags in config/tags.json")
+    parser.add_argument("--thresholds", type=float, nargs="*", default=[], help="model thresholds to try")
+    parser.add_argument("--all", action="store_true", help="score every labelled tweet, not just the held-out fold")
+    parser.add_argument("--output", type=Path, default=Path(f"eval-prefilter-{datetime.now():%Y%m%d-%H%M%S}.json"))
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    labelled = {}
+    for tag in args.tags or load_tags():
+        tweets_df = labelled_tweets(tag)
+        if not args.all:
+            tweets_df = tweets_df[in_holdout(tweets_df["hash"].to_numpy())]
+        if not tweets_df.empty:
+            labelled[tag] = tweets_df.reset_index(drop=True)
+    if not labelled:
+        sys.exit("No processed tweets to evaluate on")
+
+    model = get_model()
+    results = [evaluate(labelled, "rules", rule_reasons)]
+    if model is None:
+        print("No trained model, run `python pipeline/prefilter.py train` first to evaluate one")
+    else:
+        for threshold in [model.threshold] + args.thresholds:
+            results.append(evaluate(
+                labelled, f"model@{threshold:.3f}",
+                lambda tweets_df: prefilter(tweets_df, model=model, threshold=threshold),
+            ))
+
+    report = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "tags": list(labelled),
+        "holdout_only": not args.all,
+        "model": None if model is None else {"threshold": model.threshold, "recall_target": model.recall},
+        "results": results,
+    }
+    args.output.write_text(json.dumps(report, indent=2, ensure_ascii=False))
+    print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
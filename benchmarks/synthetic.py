@@ -0,0 +1,143 @@
+'''
+Synthetic Thai/English tweets in the shape ``x_scrap.scrape_tag`` returns.
+
+``synthetic_tweets`` builds the raw scrape columns (username, tweetText,
+scrapeTime, tag, postTimeRaw and, in network mode, tweetId) with numpy so
+millions of rows take seconds; ``add_post_time`` then runs the real
+``parse_post_time`` to add postTime and the partition columns, exactly
+like ``build_tweet_df``. About a third of the tweets are questions, a few
+percent are retweets and near-duplicates of earlier tweets, so the
+dedup, pre-filter and extraction paths see realistic input.
+'''
+
+from string import Formatter
+
+import numpy as np
+import pandas as pd
+
+THAI_SUBJECTS = [
+    "การลงทะเบียนเรียน", "ค่าเทอม", "หอพักในมหาลัย", "ทุนการศึกษา", "รถตู้ไปรังสิต", "การสอบกลางภาค",
+    "ตารางเรียน", "ห้องสมุด", "กิจกรรมรับน้อง", "การถอนรายวิชา", "ใบรับรองนักศึกษา", "โรงอาหาร",
+]
+THAI_ASKS = ["ต้องทำยังไงคะ", "ยื่นได้ถึงวันไหนครับ", "ใช้เอกสารอะไรบ้าง", "เปิดกี่โมงคะ", "จ่ายที่ไหนได้บ้างครับ"]
+THAI_FEELINGS = ["ดีมาก", "วุ่นวายสุดๆ", "คนเยอะมาก", "สนุกมาก", "เหนื่อยแต่คุ้ม"]
+EN_SUBJECTS = [
+    "course registration", "tuition payment", "the dorm application", "the scholarship form",
+    "the shuttle to Rangsit", "midterm schedule", "the library card", "dropping a course",
+]
+EN_ASKS = ["Does anyone know how to handle", "Where do I submit", "When is the deadline for", "Who do I ask about"]
+EN_FEELINGS = ["so tired", "finally done", "pretty smooth", "chaos as usual"]
+HASHTAGS = ["#ธรรมศาสตร์ช้างเผือก", "#DSI321", "#TU", "#มธ"]
+FILLERS = ["นะ", "จ้า", "เลย", "มากๆ", "ด่วน", "ที", "หน่อย", "555", "T_T", "ขอบคุณค่ะ", "pls", "asap", "🙏", "😭", "✨", "🥲"]
+NAMES = ["ฟ้า", "มิ้นท์", "ต้นกล้า", "Ploy", "Bank", "น้ำหวาน", "Arm", "แพรว", "Top", "ใบเตย"]
+
+# (template, is_question)
+TEMPLATES = [
+    ("มีใครรู้ไหมว่า{th_subject}{th_ask} {hashtag}", True),
+    ("สอบถามเรื่อง{th_subject}หน่อยค่ะ {th_ask}", True),
+    ("{th_subject}{th_ask} ใครรู้ช่วยตอบที {hashtag}", True),
+    ("{en_ask} {en_subject}? {hashtag}", True),
+    ("วันนี้{th_subject}{th_feeling} {hashtag}", False),
+    ("Just finished {en_subject}, {en_feeling} {hashtag}", False),
+    ("{th_subject}ปีนี้{th_feeling} 555 {hashtag}", False),
+    ("ฝากแชร์ข่าว{th_subject} https://t.co/{link} {hashtag}", False),
+]
+FIELDS = {
+    "th_subject": THAI_SUBJECTS, "th_ask": THAI_ASKS, "th_feeling": THAI_FEELINGS,
+    "en_subject": EN_SUBJECTS, "en_ask": EN_ASKS, "en_feeling": EN_FEELINGS, "hashtag": HASHTAGS,
+}
+MONTHS = ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
+
+
+def _fill(template: str, rows: int, rng) -> pd.Series:
+    text = pd.Series([""] * rows, dtype=object)
+    for literal, field, _, _ in Formatter().parse(template):
+        text = text + literal
+        if field == "link":
+            text = text + pd.Series(np.char.mod("%08x", rng.integers(0, 2**31, size=rows)), dtype=object)
+        elif field:
+            text = text + pd.Series(np.asarray(FIELDS[field], dtype=object)[rng.integers(0, len(FIELDS[field]), size=rows)])
+    return text
+
+
+def synthetic_texts(rows: int, rng, question_share: float = 0.35, retweet_share: float = 0.05,
+                    near_dup_share: float = 0.05) -> pd.Series:
+    questions = [t for t, q in TEMPLATES if q]
+    others = [t for t, q in TEMPLATES if not q]
+    is_question = rng.random(rows) < question_share
+    choice = np.where(
+        is_question,
+        rng.integers(0, len(questions), size=rows),
+        len(questions) + rng.integers(0, len(others), size=rows),
+    )
+    templates = questions + others
+    text = pd.Series(np.empty(rows, dtype=object))
+    for i, template in enumerate(templates):
+        mask = choice == i
+        if mask.any():
+            text[mask] = _fill(template, int(mask.sum()), rng).to_numpy()
+
+    # the templates alone repeat a lot; real tweets rarely match exactly
+    fillers = np.asarray(FILLERS, dtype=object)
+    text = text + " " + fillers[rng.integers(0, len(fillers), size=rows)] \
+        + fillers[rng.integers(0, len(fillers), size=rows)]
+    mention = rng.random(rows) < 0.6
+    text[mention] = "@" + pd.Series(np.char.mod("user%d", rng.integers(0, max(rows, 1000), size=int(mention.sum()))),
+                                    dtype=object).to_numpy() + " " + text[mention].to_numpy()
+
+    # near-duplicates: an earlier tweet with a different tail
+    dup = np.flatnonzero(rng.random(rows) < near_dup_share)
+    if len(dup):
+        source = (dup * rng.random(len(dup))).astype(np.int64)
+        text[dup] = (text[source].to_numpy() + np.asarray([" !", " ?", " 🙏", " ค่ะ"], dtype=object)[dup % 4])
+    retweet = np.flatnonzero(rng.random(rows) < retweet_share)
+    if len(retweet):
+        text[retweet] = "RT @" + pd.Series(np.char.mod("user%d", rng.integers(0, 5000, size=len(retweet)))).to_numpy() \
+            + ": " + text[retweet].to_numpy()
+    return text
+
+
+def synthetic_tweets(rows: int, tag: str = "bench", seed: int = 0, days: int = 30, mode: str = "network",
+                     scrape_time=None, id_offset: int = 0) -> pd.DataFrame:
+    """
+    ``rows`` raw scraped tweets posted within ``days`` days before
+    ``scrape_time``. ``mode`` is "network" (tweetId and ISO postTimeRaw) or
+    "dom" (relative "5h" / "May 3" post times, no id).
+    """
+    rng = np.random.default_rng(seed)
+    scrape_time = pd.Timestamp(scrape_time or pd.Timestamp.now()).floor("s")
+    age = pd.to_timedelta(rng.integers(0, days * 86400, size=rows), unit="s")
+    post_time = scrape_time - age
+
+    handle = np.char.mod("user%d", rng.integers(0, max(rows // 20, 50), size=rows))
+    name = np.asarray(NAMES, dtype=object)[rng.integers(0, len(NAMES), size=rows)]
+    df = pd.DataFrame({
+        "username": pd.Series(name) + "@" + pd.Series(handle, dtype=object),
+        "tweetText": synthetic_texts(rows, rng),
+        "scrapeTime": scrape_time,
+        "tag": tag,
+    })
+    if mode == "network":
+        df["tweetId"] = pd.Series(np.arange(id_offset, id_offset + rows) + 1_800_000_000_000_000_000).astype(str)
+        df["postTimeRaw"] = post_time.strftime("%Y-%m-%dT%H:%M:%S")
+    else:
+        seconds = age.total_seconds().to_numpy()
+        relative = np.where(
+            seconds < 60, np.char.mod("%ds", seconds.astype(int)),
+            np.where(seconds < 3600, np.char.mod("%dm", (seconds // 60).astype(int)),
+                     np.char.mod("%dh", (seconds // 3600).astype(int))),
+        )
+        month_day = pd.Series(np.asarray(MONTHS, dtype=object)[post_time.month - 1]) + " " + pd.Series(post_time.day.astype(str))
+        df["postTimeRaw"] = np.where(seconds < 86400, relative, month_day.to_numpy())
+    return df
+
+
+def add_post_time(df: pd.DataFrame) -> pd.DataFrame:
+    """postTime and partition columns, as ``build_tweet_df`` adds them."""
+    from x_scrap import parse_post_time
+
+    df["postTime"] = parse_post_time(df["postTimeRaw"], df["scrapeTime"])
+    df["postYear"] = df["postTime"].dt.year
+    df["postMonth"] = df["postTime"].dt.month
+    df["postDay"] = df["postTime"].dt.day
+    return df
@@ -0,0 +1,164 @@
+'''
+Cached access to the FAQ parquet files for the dashboard.
+
+Streamlit reruns the whole script on every widget interaction, so anything
+read here is cached with ``st.cache_data``. The cache key contains the
+path, size and mtime of every file that is read, so a rewritten
+``part.parquet`` is picked up on the next rerun while unchanged files are
+never decoded twice; the TTL only bounds how long entries for files that
+no longer exist are kept around.
+
+Only the requested columns are read through pyarrow, and ``topic`` stays a
+native list column (legacy files that stored it as a string are converted
+once, inside the cached read). Charts use the per-day topic counts that
+extraction keeps under ``data/faq_agg`` instead of recounting FAQ rows, and
+are queried for a set of tags and a date range with the range pushed down
+into the ``pyarrow.dataset`` scan.
+'''
+
+from pathlib import Path
+import ast
+import os
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import streamlit as st
+
+FAQ_CACHE_TTL = int(os.getenv("FAQ_CACHE_TTL", 600))
+TAG_LIST_TTL = int(os.getenv("FAQ_TAG_LIST_TTL", 60))
+FAQ_CACHE_ENTRIES = int(os.getenv("FAQ_CACHE_ENTRIES", 64))
+
+DAY_PARTITIONING = ds.partitioning(
+    pa.schema([("postYear", pa.int32()), ("postMonth", pa.int32()), ("postDay", pa.int32())]),
+    flavor="hive",
+)
+
+
+def tag_dir(faq_dir: Path, tag: str) -> Path:
+    return Path(faq_dir) / f"tag={tag}"
+
+
+def file_fingerprints(directory: Path) -> tuple:
+    """``(path, size, mtime_ns)`` of every parquet file under ``directory``, sorted by path."""
+    fingerprints = []
+    for path in sorted(Path(directory).rglob("*.parquet")):
+        stat = path.stat()
+        fingerprints.append((str(path), stat.st_size, stat.st_mtime_ns))
+    return tuple(fingerprints)
+
+
+@st.cache_data(ttl=TAG_LIST_TTL, show_spinner=False)
+def list_tags(faq_dir: str) -> list:
+    """Tags that have an FAQ directory."""
+    if not Path(faq_dir).exists():
+        return []
+    return sorted(p.name.split("=", 1)[-1] for p in Path(faq_dir).iterdir() if p.name.startswith("tag="))
+
+
+def _topic_as_list(table: pa.Table) -> pa.Table:
+    index = table.schema.get_field_index("topic")
+    if index < 0 or not (pa.types.is_string(table.schema.field(index).type)
+                         or pa.types.is_large_string(table.schema.field(index).type)):
+        return table
+    # old files stored the topic list as its Python repr
+    parsed = [ast.literal_eval(value) if value else None for value in table.column(index).to_pylist()]
+    return table.set_column(index, "topic", pa.array(parsed, type=pa.list_(pa.string())))
+
+
+def day_filter(start, end):
+    """Rows whose postYear/postMonth/postDay fall in [start, end]."""
+    day = pc.add(pc.add(pc.multiply(ds.field("postYear"), 10000), pc.multiply(ds.field("postMonth"), 100)),
+                 ds.field("postDay"))
+    return (day >= start.year * 10000 + start.month * 100 + start.day) & \
+        (day <= end.year * 10000 + end.month * 100 + end.day)
+
+
+def _partition_base(path: str) -> str:
+    """The directory holding the ``tag=`` directory of ``path``."""
+    parts = Path(path).parts
+    return str(Path(*parts[:[p.startswith("tag=") for p in parts].index(True)]))
+
+
+def _scan(fingerprints: tuple, columns: list, filter=None) -> pa.Table:
+    # the file list only holds the selected tags, so other tags are never opened;
+    # FAQ files keep postYear/postMonth/postDay in the path, older ones in the file
+    paths = [path for path, _, _ in fingerprints]
+    dataset = ds.dataset(paths, format="parquet", partitioning=DAY_PARTITIONING,
+                         partition_base_dir=_partition_base(paths[0]))
+    columns = [c for c in columns if c in dataset.schema.names]
+    return dataset.to_table(columns=columns, filter=filter)
+
+
+def _sum_by_topic(table: pa.Table) -> pd.DataFrame:
+    totals = table.group_by("topic").aggregate([("count", "sum")]).rename_columns(["topic", "count"])
+    return totals.to_pandas()
+
+
+@st.cache_data(ttl=FAQ_CACHE_TTL, max_entries=FAQ_CACHE_ENTRIES, show_spinner=False)
+def _query_counts(agg_fingerprints: tuple, faq_fingerprints: tuple, start, end) -> pd.DataFrame:
+    tables = []
+    if agg_fingerprints:
+        in_range = (ds.field("postDate") >= start) & (ds.field("postDate") <= end)
+        tables.append(_scan(agg_fingerprints, ["topic", "count"], in_range))
+    if faq_fingerprints:
+        faqs = _topic_as_list(_scan(faq_fingerprints, ["topic"], day_filter(start, end)))
+        topics = pc.drop_null(pc.list_flatten(faqs.column("topic")))
+        tables.append(pa.table({"topic": topics, "count": pa.repeat(pa.scalar(1, pa.int64()), len(topics))}))
+    if not tables:
+        return pd.DataFrame(columns=["topic", "count"])
+    return _sum_by_topic(pa.concat_tables([t.cast(tables[0].schema) for t in tables]))
+
+
+@st.cache_data(ttl=FAQ_CACHE_TTL, max_entries=FAQ_CACHE_ENTRIES, show_spinner=False)
+def _date_bounds(agg_fingerprints: tuple, faq_fingerprints: tuple):
+    days = []
+    if agg_fingerprints:
+        days += pc.min_max(_scan(agg_fingerprints, ["postDate"]).column("postDate")).values()
+    if faq_fingerprints:
+        parts = _scan(faq_fingerprints, ["postYear", "postMonth", "postDay"]).to_pandas().dropna()
+        if not parts.empty:
+            parts = pd.to_datetime(parts.rename(columns={"postYear": "year", "postMonth": "month", "postDay": "day"}))
+            days += [parts.min().date(), parts.max().date()]
+    days = [d.as_py() if isinstance(d, pa.Scalar) else d for d in days]
+    days = [d for d in days if d is not None]
+    if not days:
+        return None
+    return min(days), max(days)
+
+
+def sources(faq_dir: Path, agg_dir: Path, tags) -> tuple:
+    """
+    Files the charts of ``tags`` are drawn from: the precomputed topic counts
+    where a tag has them, its FAQ rows otherwise. Changes whenever one of
+    those files changes, so it also serves as the data version.
+    """
+    agg_fingerprints, faq_fingerprints = (), ()
+    for tag in sorted(tags):
+        fingerprints = file_fingerprints(tag_dir(agg_dir, tag))
+        if fingerprints:
+            agg_fingerprints += fingerprints
+        else:
+            faq_fingerprints += file_fingerprints(tag_dir(faq_dir, tag))
+    return agg_fingerprints, faq_fingerprints
+
+
+def date_bounds(faq_dir: Path, agg_dir: Path, tags):
+    """First and last post date of ``tags``, None when there is no data."""
+    return _date_bounds(*sources(faq_dir, agg_dir, tags))
+
+
+def query_topic_counts(faq_dir: Path, agg_dir: Path, tags, start, end) -> pd.DataFrame:
+    """
+    ``topic``/``count`` totals over ``tags`` for posts dated ``start`` to
+    ``end``. Only the selected tags' files are scanned and the date range is
+    pushed down into the parquet scan.
+    """
+    return _query_counts(*sources(faq_dir, agg_dir, tags), start, end)
+
+
+def clear_cache():
+    list_tags.clear()
+    _query_counts.clear()
+    _date_bounds.clear()
@@ -5,15 +5,22 @@ from wordcloud import WordCloud
 import matplotlib.pyplot as plt
 import pandas as pd
 from pathlib import Path
-import ast
+import logging
+import io
+import re
+from datetime import timedelta
+
+from faq_data import list_tags, query_topic_counts, date_bounds, sources
+
+logger = logging.getLogger(__name__)
 # Constants and configurations
 file_dir = Path(__file__).resolve().parent
-print(f"Initial file_dir: {file_dir}")
+logger.debug(f"Initial file_dir: {file_dir}")
 
 # Set up paths based on environment
 # Docker detection - check if we're in Docker
 is_docker = Path("/data").exists() or os.path.exists("/.dockerenv")
-print(f"Detected Docker environment: {is_docker}")
+logger.debug(f"Detected Docker environment: {is_docker}")
 
 if is_docker:
     # Docker environment
@@ -21,36 +28,40 @@ if is_docker:
     config_dir = Path("/config")
     font_path = config_dir / "Sarabun-Regular.ttf"
     root_dir = Path(__file__).resolve().parent / ".."
-    print("Using Docker paths")
+    logger.debug("Using Docker paths")
 else:
     # Local environment
     root_dir = file_dir / ".."
     data_dir = root_dir / "data"
     font_path = root_dir / "config" / "Sarabun-Regular.ttf"
-    print("Using local paths")
+    logger.debug("Using local paths")
 
 faq_dir = data_dir / "faq"
+faq_agg_dir = data_dir / "faq_agg"
+
+# the date range preselected when tags are picked
+DEFAULT_RANGE_DAYS = int(os.getenv("DASHBOARD_DEFAULT_DAYS", 7))
 
 # Check if paths exist
-print(f"Root directory exists: {root_dir.exists()}")
-print(f"Data directory exists: {data_dir.exists()}")
-print(f"FAQ directory exists: {faq_dir.exists()}")
-print(f"Font path exists: {os.path.exists(font_path)}")
+logger.debug(f"Root directory exists: {root_dir.exists()}")
+logger.debug(f"Data directory exists: {data_dir.exists()}")
+logger.debug(f"FAQ directory exists: {faq_dir.exists()}")
+logger.debug(f"Font path exists: {os.path.exists(font_path)}")
 
 # Fallback for font path if it doesn't exist
 use_default_font = False
 if not os.path.exists(font_path):
-    print(f"Font not found at {font_path}, looking for alternatives...")
+    logger.debug(f"Font not found at {font_path}, looking for alternatives...")
     possible_font_paths = [
         Path("config")  / "Sarabun-Regular.ttf",
     ]
     for path in possible_font_paths:
         if path.exists():
             font_path = path
-            print(f"Found font at: {font_path}")
+            logger.debug(f"Found font at: {font_path}")
             break    
         else:
-            print("Font not found, will use default font")
+            logger.debug("Font not found, will use default font")
             use_default_font = True
 
 # Make matplotlib use the font from font_path if available
@@ -59,55 +70,29 @@ if not use_default_font and os.path.exists(font_path):
     fontManager.addfont(str(font_path))
     plt.rcParams["font.family"] = "Sarabun"
 else:
-    print("Using default matplotlib font")
+    logger.debug("Using default matplotlib font")
 
 # Debug information
-print(f"File directory: {file_dir}")
-print(f"Root directory: {root_dir}")
-print(f"Data directory: {data_dir}")
-print(f"FAQ directory: {faq_dir}")
-print(f"Font path: {font_path}")
-print(f"Current working directory: {os.getcwd()}")
-
-
-
-
-def load_faq_data(tag):
-    """Load FAQ data for the selected tag."""
-    faqs_dest = faq_dir / f"tag={tag}"
-    print(f"Loading data from: {faqs_dest}")
-    print(f"Current directory: {os.getcwd()}")
-    
-    # Debug information
-    print(f"Does faq_dir exist? {faq_dir.exists()}")
-    if faq_dir.exists():
-        print(f"Contents of faq_dir: {list(faq_dir.glob('*'))}")
-    
-    print(f"Does tag directory exist? {faqs_dest.exists()}")
-    if faqs_dest.exists():
-        print(f"Contents of tag directory: {list(faqs_dest.glob('*'))}")
-    
-    if not faqs_dest.exists():
-        st.warning(f"No data available for the selected tag. Path {faqs_dest} does not exist.")
-        return None
-
-    faqs_files = list(faqs_dest.glob("*.parquet"))
-    print(f"Found parquet files: {faqs_files}")
-    
-    if not faqs_files:
-        st.warning(f"No parquet files found in {faqs_dest}.")
-        return None
-
-    latest_file = sorted(faqs_files, key=lambda x: x.name)[-1]
-    print(f"Using latest file: {latest_file}")
-    return pd.read_parquet(latest_file)
-
-def generate_word_cloud(text, stop_words, title):
-    """Generate and display a word cloud."""
+logger.debug(f"File directory: {file_dir}")
+logger.debug(f"Root directory: {root_dir}")
+logger.debug(f"Data directory: {data_dir}")
+logger.debug(f"FAQ directory: {faq_dir}")
+logger.debug(f"Font path: {font_path}")
+logger.debug(f"Current working directory: {os.getcwd()}")
+
+
+
+
+@st.cache_data(ttl=3600, max_entries=32, show_spinner=False)
+def render_word_cloud(selection, version, stop_words, title, _frequencies):
+    """
+    Word cloud of ``_frequencies`` as PNG bytes. Cached per (selection, data
+    version), the frequencies themselves are not hashed.
+    """
     try:
         # Set up WordCloud parameters
         word_cloud_params = {
-            'stopwords': stop_words,
+            'stopwords': set(stop_words),
             'relative_scaling': 0.0,
             'min_font_size': 1,
             'background_color': "white",
@@ -115,8 +100,6 @@ def generate_word_cloud(text, stop_words, title):
             'colormap': "plasma",
             'scale': 10,
             'font_step': 1,
-            'collocations': False,
-            'regexp': r"[ก-๙a-zA-Z']+",
             'margin': 2,
         }
         
@@ -124,35 +107,38 @@ def generate_word_cloud(text, stop_words, title):
         if not use_default_font and os.path.exists(font_path):
             word_cloud_params['font_path'] = str(font_path)
             
-        word_cloud = WordCloud(**word_cloud_params).generate(text)
+        word_cloud = WordCloud(**word_cloud_params).generate_from_frequencies(_frequencies)
         
     except Exception as e:
         st.error(f"Error generating word cloud: {str(e)}")
-        print(f"WordCloud error: {str(e)}")
+        logger.warning(f"WordCloud error: {str(e)}")
         # Fallback to basic word cloud without custom font
         word_cloud = WordCloud(
             background_color="white",
             max_words=100,
-            stopwords=stop_words
-        ).generate(text)
+        ).generate_from_frequencies(_frequencies)
 
-    plt.figure(figsize=(10, 5))
+    fig = plt.figure(figsize=(10, 5))
     plt.imshow(word_cloud, interpolation="bilinear")
     plt.axis("off")
     plt.title(title)
-    st.pyplot(plt, clear_figure=True)
-
-def generate_bar_chart(data, column, title, xlabel, ylabel):
-    """Generate and display a bar chart."""
-    data_count = (
-        pd.DataFrame(data)
-        .value_counts()
-        .to_frame(name="count")
-        .reset_index()
-        .rename(columns={0: column})
-        .sort_values(by="count", ascending=False)
-        .head(10)
-    )
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="png", bbox_inches="tight")
+    plt.close(fig)
+    return buffer.getvalue()
+
+def generate_word_cloud(topic_counts, selection, stop_words, title):
+    """Display a word cloud of the topic counts for ``selection`` (tags, start, end)."""
+    if topic_counts.empty:
+        st.info("No topics to show.")
+        return
+    frequencies = dict(zip(topic_counts["topic"], topic_counts["count"]))
+    version = sources(faq_dir, faq_agg_dir, selection[0])
+    st.image(render_word_cloud(selection, version, tuple(stop_words), title, frequencies))
+
+def generate_bar_chart(data_count, column, title, xlabel, ylabel):
+    """Generate and display a bar chart of the 10 largest counts."""
+    data_count = data_count.nlargest(10, "count")
 
     fig, ax = plt.subplots(figsize=(10, 5))
     ax.barh(data_count[column], data_count["count"], color="skyblue")
@@ -169,43 +155,45 @@ def generate_bar_chart(data, column, title, xlabel, ylabel):
 def main():
     st.title("FAQ Data Visualization")
    
-    tags = [t.split("=")[-1] for t in os.listdir(faq_dir)]
-    tags = set(['เลือก Tag'] + tags)
-    tag = st.selectbox("เลือก Tag", tags)
-
-    if tag != "เลือก Tag":
-        with st.spinner("กำลังโหลดข้อมูล..."):
-            st.subheader("Word Cloud")
-
-            faqs_df = load_faq_data(tag)
-            if faqs_df is None:
-                return
-
-            stop_words = ["ธรรมศาสตร์", tag]
+    tags = st.multiselect("เลือก Tag", list_tags(str(faq_dir)))
+    if not tags:
+        return
+
+    bounds = date_bounds(faq_dir, faq_agg_dir, tags)
+    if bounds is None:
+        st.warning("No data available for the selected tags.")
+        return
+    first_day, last_day = bounds
+    date_range = st.date_input(
+        "ช่วงวันที่",
+        value=(max(first_day, last_day - timedelta(days=DEFAULT_RANGE_DAYS - 1)), last_day),
+        min_value=first_day,
+        max_value=last_day,
+    )
+    if len(date_range) != 2:
+        # the second day is still being picked
+        return
+    start, end = date_range
 
-            # Process topics
-            faqs_df['topic'] = faqs_df['topic'].apply(lambda x: ast.literal_eval(x) if isinstance(x, str) else x)
+    with st.spinner("กำลังโหลดข้อมูล..."):
+        st.subheader("Word Cloud")
 
-            topics = faqs_df["topic"].dropna().tolist()
+        topic_counts = query_topic_counts(faq_dir, faq_agg_dir, tags, start, end)
 
-            topics = [t for ele in topics for t in ele if not any(word in t for word in stop_words)]
-            topics_text = " ".join(topics)
+        stop_words = ["ธรรมศาสตร์"] + tags
 
-            # Process subtopics
-            # faqs_df['subtopic'] = faqs_df['subtopic'].apply(lambda x: ast.literal_eval(x) if isinstance(x, str) else x)
-            # subtopics = faqs_df["subtopic"].dropna().tolist()
-            # subtopics = [s for ele in subtopics for s in ele if s not in stop_words]
-            # subtopics_text = " ".join(subtopics)
+        # Process topics
+        keep = ~topic_counts["topic"].str.contains("|".join(map(re.escape, stop_words)))
+        topic_counts = topic_counts[keep]
 
-            # Generate word clouds
-            generate_word_cloud(topics_text, stop_words, "Word Cloud of FAQ Topics")
-            # generate_word_cloud(subtopics_text, stop_words, "Word Cloud of FAQ Subtopics")
+        # Generate word clouds
+        selection = (tuple(sorted(tags)), start, end)
+        generate_word_cloud(topic_counts, selection, stop_words, "Word Cloud of FAQ Topics")
 
-            st.subheader("Bar Chart")
+        st.subheader("Bar Chart")
 
-            # Generate bar charts
-            generate_bar_chart(topics, "topic", "Top 10 FAQ Topics", "Count", "Topic")
-            # generate_bar_chart(subtopics, "subtopic", "Top 10 FAQ Subtopics", "Count", "Subtopic")
+        # Generate bar charts
+        generate_bar_chart(topic_counts, "topic", "Top 10 FAQ Topics", "Count", "Topic")
 
 if __name__ == "__main__":
     main()
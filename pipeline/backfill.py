@@ -0,0 +1,246 @@
+'''
+Bulk backfill of the local parquet stores into LakeFS.
+
+``load_tweets`` / ``load_faqs`` decode every tag directory into pandas and
+encode it again just to move it. A backfill instead looks at each local
+file on its own:
+
+- files that already sit in the LakeFS layout
+  (``<collection>/tag=/postYear=/postMonth=/postDay=/``) and carry no
+  partition columns inside the file are uploaded byte for byte;
+- files in that layout that still embed a partition column (tweet and FAQ
+  files written before the store stopped storing ``tag``) are uploaded to
+  the same object with those columns dropped, since pyarrow refuses a
+  column that is also a hive key;
+- tweet / FAQ files outside that layout (the one-file-per-tag FAQ
+  snapshots) are read with pyarrow and re-written into it.
+
+Every other file (e.g. the ``faq_agg`` counts) is copied to the same
+relative path. ``lakefs_sync`` sends its files through ``send_file`` too,
+so a backfilled file and a synced one end up as the same object.
+
+Files are handled on a process pool. Every finished file is appended to a
+checkpoint (``data/state/backfill_<collection>.jsonl``) with its size and
+mtime, so an interrupted backfill resumes where it stopped and a file that
+changed since is sent again.
+'''
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+file_dir = Path(__file__).resolve().parent
+sys.path.append(str(file_dir))
+
+from result_load import data_dir, repo, branch, get_fs, set_fs
+
+logger = logging.getLogger(__name__)
+
+state_dir = data_dir / "state"
+
+LAKEFS_PARTITION_COLS = ["tag", "postYear", "postMonth", "postDay"]
+# collections whose files are re-written into LAKEFS_PARTITION_COLS when they are not in it
+REENCODE_COLLECTIONS = ("tweets", "faq")
+BACKFILL_WORKERS = int(os.getenv("BACKFILL_WORKERS", os.cpu_count() or 4))
+# s3fs switches to multipart uploads above this size
+MULTIPART_CHUNK = 8 * 1024 * 1024
+
+
+def checkpoint_path(collection: str) -> Path:
+    return state_dir / f"backfill_{collection}.jsonl"
+
+
+def load_checkpoint(collection: str) -> dict:
+    """Finished files of an earlier run: relative path -> (size, mtime_ns)."""
+    path = checkpoint_path(collection)
+    done = {}
+    if not path.exists():
+        return done
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # a crash mid-write leaves a torn last line
+                continue
+            done[entry["path"]] = (entry["size"], entry["mtime_ns"])
+    return done
+
+
+def _terminate_last_line(path: Path):
+    """End a torn last line, so the next entry appended does not join it."""
+    if not path.exists() or path.stat().st_size == 0:
+        return
+    with open(path, "rb+") as f:
+        f.seek(-1, os.SEEK_END)
+        if f.read(1) != b"\n":
+            f.write(b"\n")
+
+
+def hive_partitions(rel_path: str) -> dict:
+    """``key=value`` directory parts of ``rel_path``, in order."""
+    parts = {}
+    for part in Path(rel_path).parent.parts:
+        if "=" in part:
+            key, value = part.split("=", 1)
+            parts[key] = value
+    return parts
+
+
+def in_lakefs_layout(rel_path: str) -> bool:
+    """True when ``rel_path`` already has the LakeFS partition directories."""
+    return list(hive_partitions(rel_path)) == LAKEFS_PARTITION_COLS
+
+
+def embedded_partitions(rel_path: str, schema_names) -> list:
+    """Columns of the file that its path also holds as ``key=value``."""
+    return [col for col in hive_partitions(rel_path) if col in schema_names]
+
+
+def remote_path(rel_path: str, target: str = branch) -> str:
+    return f"{repo}/{target}/{rel_path}"
+
+
+def relative_key(path: str, target: str = branch) -> str:
+    """Inverse of ``remote_path`` for a path listed or written by ``fs``."""
+    return str(path).split(f"{repo}/{target}/", 1)[-1]
+
+
+def _reencode(source: Path, rel_path: str, collection: str, fs, target: str = branch) -> dict:
+    table = pq.read_table(source, partitioning=None)
+    # partition values from the path win over (possibly stale) copies in the file
+    for col, value in hive_partitions(rel_path).items():
+        if col not in LAKEFS_PARTITION_COLS:
+            continue
+        if col in table.column_names:
+            table = table.drop_columns([col])
+        table = table.append_column(col, pa.repeat(pa.scalar(value), len(table)))
+    missing = [col for col in LAKEFS_PARTITION_COLS if col not in table.column_names]
+    if missing:
+        raise ValueError(f"{rel_path} has no value for partition columns {missing}")
+
+    # a file directly under tag= is a whole-tag snapshot and replaces what is there
+    snapshot = len(hive_partitions(rel_path)) < len(LAKEFS_PARTITION_COLS)
+    written = []
+    pq.write_to_dataset(
+        table,
+        root_path=remote_path(collection, target),
+        partition_cols=LAKEFS_PARTITION_COLS,
+        filesystem=fs,
+        compression="snappy",
+        basename_template=f"{source.stem}-{{i}}.parquet",
+        existing_data_behavior="delete_matching" if snapshot else "overwrite_or_ignore",
+        file_visitor=written.append,
+    )
+    return {"objects": len(written), "bytes": sum(f.size or 0 for f in written),
+            "keys": [relative_key(f.path, target) for f in written]}
+
+
+def _strip(source: Path, rel_path: str, columns: list, fs, target: str = branch) -> dict:
+    table = pq.read_table(source, partitioning=None).drop_columns(columns)
+    sink = pa.BufferOutputStream()
+    pq.write_table(table, sink, compression="snappy")
+    data = sink.getvalue().to_pybytes()
+    fs.pipe_file(remote_path(rel_path, target), data)
+    return {"objects": 1, "bytes": len(data), "keys": [rel_path]}
+
+
+def send_file(rel_path: str, target: str = branch, fs=None) -> dict:
+    """
+    Send one local file to ``target``, copying it when the layout allows.
+
+    Returns:
+        The mode used ("copy", "strip" or "reencode"), the number of objects
+        and bytes written and their paths relative to ``target``.
+    """
+    source = data_dir / rel_path
+    collection = Path(rel_path).parts[0]
+    fs = fs or get_fs()
+    if collection in REENCODE_COLLECTIONS and not in_lakefs_layout(rel_path):
+        return {"path": rel_path, "mode": "reencode", **_reencode(source, rel_path, collection, fs, target)}
+    embedded = embedded_partitions(rel_path, pq.read_schema(source).names)
+    if embedded:
+        return {"path": rel_path, "mode": "strip", **_strip(source, rel_path, embedded, fs, target)}
+    fs.put_file(str(source), remote_path(rel_path, target), chunksize=MULTIPART_CHUNK)
+    return {"path": rel_path, "mode": "copy", "objects": 1, "bytes": source.stat().st_size, "keys": [rel_path]}
+
+
+def backfill_file(rel_path: str) -> dict:
+    """Send one local file to LakeFS ``branch``."""
+    return send_file(rel_path)
+
+
+def _init_worker(fs):
+    logging.basicConfig(level=logging.INFO)
+    if fs is not None:
+        set_fs(fs)
+
+
+def backfill(collection: str, max_workers: int = BACKFILL_WORKERS, reset: bool = False, fs=None) -> dict:
+    """
+    Backfill every parquet file under ``data/<collection>`` that is not in
+    the checkpoint yet (or changed since). ``fs`` replaces the LakeFS client
+    in the workers, it has to be picklable like any fsspec filesystem.
+
+    Returns:
+        Counts of copied / stripped / re-encoded / skipped files, bytes and seconds.
+    """
+    checkpoint = checkpoint_path(collection)
+    if reset and checkpoint.exists():
+        checkpoint.unlink()
+    done = load_checkpoint(collection)
+
+    todo = {}
+    skipped = 0
+    for path in sorted((data_dir / collection).rglob("*.parquet")):
+        rel_path = path.relative_to(data_dir).as_posix()
+        stat = path.stat()
+        if done.get(rel_path) == (stat.st_size, stat.st_mtime_ns):
+            skipped += 1
+            continue
+        todo[rel_path] = (stat.st_size, stat.st_mtime_ns)
+
+    summary = {"copy": 0, "strip": 0, "reencode": 0, "skipped": skipped, "objects": 0, "bytes": 0}
+    logger.info(f"Backfill {collection}: {len(todo)} files to send, {skipped} already done")
+    start = time.perf_counter()
+    checkpoint.parent.mkdir(parents=True, exist_ok=True)
+    _terminate_last_line(checkpoint)
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker, initargs=(fs,)) as pool, \
+            open(checkpoint, "a", encoding="utf-8") as log:
+        futures = [pool.submit(backfill_file, rel_path) for rel_path in todo]
+        for future in as_completed(futures):
+            result = future.result()
+            size, mtime_ns = todo[result["path"]]
+            log.write(json.dumps({"path": result["path"], "size": size, "mtime_ns": mtime_ns}) + "\n")
+            log.flush()
+            summary[result["mode"]] += 1
+            summary["objects"] += result["objects"]
+            summary["bytes"] += result["bytes"]
+
+    summary["seconds"] = time.perf_counter() - start
+    logger.info(
+        f"Backfill {collection}: copied {summary['copy']}, stripped {summary['strip']}, "
+        f"re-encoded {summary['reencode']} files, "
+        f"{summary['bytes'] / 1e6:.1f} MB in {summary['seconds']:.1f}s "
+        f"({summary['bytes'] / 1e6 / max(summary['seconds'], 1e-9):.1f} MB/s)"
+    )
+    return summary
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Bulk backfill local parquet stores into LakeFS")
+    parser.add_argument("collections", nargs="*", default=["tweets", "faq"])
+    parser.add_argument("--workers", type=int, default=BACKFILL_WORKERS)
+    parser.add_argument("--reset", action="store_true", help="ignore the checkpoint and send everything again")
+    args = parser.parse_args()
+    for collection in args.collections:
+        backfill(collection, max_workers=args.workers, reset=args.reset)
@@ -0,0 +1,58 @@
+'''
+Token-budget batch planning for topic extraction.
+
+Instead of a fixed 50 tweets per request, tweets are packed into batches by
+their estimated token count so long-tweet batches stay inside the context
+window and short-tweet batches do not waste the per-request prompt overhead.
+The topic list injected into the prompt is capped to the most frequent
+topics and rendered one per line instead of as a Python set repr.
+'''
+
+from collections import Counter
+import os
+
+from llm_engine import estimate_tokens
+
+# estimated tokens of tweet text per request
+EXTRACT_TOKEN_BUDGET = int(os.getenv("EXTRACT_TOKEN_BUDGET", 6000))
+# hard cap on tweets per request, keeps the JSON answer a manageable size
+EXTRACT_MAX_ROWS = int(os.getenv("EXTRACT_MAX_ROWS", 100))
+# how many existing topics go into the prompt
+EXTRACT_MAX_TOPICS = int(os.getenv("EXTRACT_MAX_TOPICS", 100))
+
+
+def format_message(row: dict) -> str:
+    return f"{row['index']}: {row['tweetText']}"
+
+
+def plan_batches(rows: list, token_budget: int = EXTRACT_TOKEN_BUDGET, max_rows: int = EXTRACT_MAX_ROWS) -> list:
+    """
+    Greedily pack ``rows`` (dicts with ``index`` and ``tweetText``) into
+    batches whose estimated message tokens stay within ``token_budget`` and
+    whose size stays within ``max_rows``. Order is preserved; a single row
+    larger than the budget gets a batch of its own.
+    """
+    batches = []
+    batch, batch_tokens = [], 0
+    for row in rows:
+        tokens = estimate_tokens(format_message(row)) + 1  # newline
+        if batch and (batch_tokens + tokens > token_budget or len(batch) >= max_rows):
+            batches.append(batch)
+            batch, batch_tokens = [], 0
+        batch.append(row)
+        batch_tokens += tokens
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def select_topics(topic_counts: Counter, max_topics: int = EXTRACT_MAX_TOPICS) -> list:
+    """The ``max_topics`` most frequent topics, ties broken alphabetically."""
+    ranked = sorted(topic_counts.items(), key=lambda item: (-item[1], item[0]))
+    return [topic for topic, _ in ranked[:max_topics]]
+
+
+def format_topics(topics: list) -> str:
+    if not topics:
+        return "-"
+    return "\n".join(f"- {topic}" for topic in topics)
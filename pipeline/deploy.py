@@ -4,7 +4,10 @@ from datetime import datetime, timedelta
 from prefect.schedules import Interval
 
 import logging 
+import os
 import sys
+import time
+import asyncio
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -19,24 +22,94 @@ logger.addHandler(console_handler)
 file_dir = Path(__file__).resolve().parent
 sys.path.append(str(file_dir))
 
-from update import update_tag
-from extraction import extract
+from update import update_tag_async, compact_tag, MAX_INCREMENTAL_SCROLLS
+from x_scrap import BrowserPool, SCRAPE_CONCURRENCY
+from extraction import extract, compact_faq
+from lakefs_sync import sync_to_lakefs
+from work_queue import drain, report_stats, get_queue
+from scheduler import load_tags, due_tags, record_run, SCHEDULE_MIN_MINUTES
+import run_metrics
+from prefect.cache_policies import NO_CACHE
 # site:x.com inurl:/hashtag/ ธรรมศาสตร์
+# tags are listed in config/tags.json
 
-tags = [
-    '#ธรรมศาสตร์ช้างเผือก',
-    '#DSI321'
-]
+# extraction workers draining the queue per extract_queue_flow run
+EXTRACT_QUEUE_WORKERS = int(os.getenv("EXTRACT_QUEUE_WORKERS", 2))
+
+
+@task(name="scrape_tag", cache_policy=NO_CACHE)
+async def scrape_tag_task(pool: BrowserPool, tag: str, max_scrolls: int = MAX_INCREMENTAL_SCROLLS):
+    logger.info(f"Starting scrape for tag: {tag}")
+    started_at = datetime.now()
+    new_count = await update_tag_async(pool, tag, max_scrolls=max_scrolls, incremental=True)
+    record_run(tag, new_count, started_at, max_scrolls)
+    logger.info(f"Finished scrape for tag: {tag}")
+    return new_count
+
+@task(name="extract_worker")
+def extract_worker_task(worker: str):
+    handled = drain(extract, worker=worker)
+    logger.info(f"{worker} finished after {handled} claims")
+    return handled
+
+
+@task(name="sync_lakefs")
+def sync_lakefs_task():
+    summary = sync_to_lakefs(message=f"scrape_tag_flow {datetime.now().isoformat(timespec='seconds')}")
+    logger.info(f"LakeFS sync: {summary}")
+    return summary
 
 
 @flow(name="scrape_tag_flow")
-def scrape_tag_flow() -> None:       
-    for tag in tags:
-        logger.info(f"Starting scrape for tag: {tag}")
-        update_tag(tag, max_scrolls=1)
-        logger.info(f"Finished scrape for tag: {tag}")  
-        extract(tag)
-        logger.info(f"Finished extract for tag: {tag}")
+async def scrape_tag_flow(concurrency: int = SCRAPE_CONCURRENCY) -> None:
+    """Scrape the tags that are due and queue the new tweets for extract_queue_flow."""
+    run_metrics.reset()
+    tags = load_tags()
+    due = due_tags(tags)
+    try:
+        logger.info(f"{len(due)} of {len(tags)} tags due: {[tag for tag, _ in due]}")
+        if due:
+            start = time.perf_counter()
+            async with BrowserPool(size=min(concurrency, len(due))) as pool:
+                await asyncio.gather(*[scrape_tag_task(pool, tag, max_scrolls) for tag, max_scrolls in due])
+            elapsed = time.perf_counter() - start
+            logger.info(
+                f"Scraped {len(due)} tags in {elapsed:.1f}s "
+                f"({len(due) / (elapsed / 60):.1f} tags/min, concurrency={concurrency})"
+            )
+
+        report_stats()
+        sync_lakefs_task()
+    finally:
+        run_metrics.export("scrape-tag-flow", description=f"Stage timings and counters for tags {[t for t, _ in due]}")
+
+
+@flow(name="extract_queue_flow")
+def extract_queue_flow(workers: int = EXTRACT_QUEUE_WORKERS) -> None:
+    """Drain the extract queue with ``workers`` workers, one tag per worker at a time."""
+    run_metrics.reset()
+    try:
+        report_stats()
+        handled = extract_worker_task.map([f"extract-{i}" for i in range(workers)]).result()
+        logger.info(f"Extracted {sum(handled)} queued tags")
+        get_queue().prune()
+        report_stats()
+    finally:
+        run_metrics.export("extract-queue-flow")
+
+
+@flow(name="compact_store_flow")
+def compact_store_flow() -> None:
+    """Merge the small append files the scrape and extraction runs leave in each partition."""
+    run_metrics.reset()
+    try:
+        for tag in load_tags():
+            compacted = compact_tag(tag)
+            logger.info(f"Compacted {compacted} partitions for tag: {tag}")
+            compacted = compact_faq(tag)
+            logger.info(f"Compacted {compacted} FAQ partitions for tag: {tag}")
+    finally:
+        run_metrics.export("compact-store-flow")
     
 if __name__ == "__main__":
     scrape_tag_flow.from_source(
@@ -45,8 +118,33 @@ if __name__ == "__main__":
     ).deploy(
         name="scrape_tag_flow",
         tags=["scrape", "tag"],
+        # only checks which tags are due, see scheduler.py
+        schedule=Interval(
+            timedelta(minutes=SCHEDULE_MIN_MINUTES),
+            timezone="Asia/Bangkok",
+        ),
+        work_pool_name= "default-agent-pool",
+    )
+    extract_queue_flow.from_source(
+        source=Path(__file__).parent, 
+        entrypoint="./deploy.py:extract_queue_flow",
+    ).deploy(
+        name="extract_queue_flow",
+        tags=["extract", "tag"],
+        schedule=Interval(
+            timedelta(minutes=5),
+            timezone="Asia/Bangkok",
+        ),
+        work_pool_name= "default-agent-pool",
+    )
+    compact_store_flow.from_source(
+        source=Path(__file__).parent, 
+        entrypoint="./deploy.py:compact_store_flow",
+    ).deploy(
+        name="compact_store_flow",
+        tags=["compact", "tag"],
         schedule=Interval(
-            timedelta(minutes=15),
+            timedelta(hours=6),
             timezone="Asia/Bangkok",
         ),
         work_pool_name= "default-agent-pool",
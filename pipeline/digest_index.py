@@ -0,0 +1,153 @@
+'''
+Compact persistent set of 64-bit digests, used as the "already processed"
+index for extraction.
+
+On disk an index is two raw little-endian uint64 files:
+
+- ``<name>.u64``: sorted, unique digests, memory-mapped on load;
+- ``<name>.log``: digests appended since the last compaction.
+
+Membership is checked for a whole NumPy array at once with ``searchsorted``
+against the sorted file and ``isin`` against the (small) log, behind an
+optional in-memory Bloom filter. Appends are a single ``O_APPEND`` write
+followed by fsync; ``compact`` folds the log into the sorted file via a
+temporary file and ``os.replace``.
+'''
+
+from pathlib import Path
+import os
+
+import numpy as np
+import pandas as pd
+
+DIGEST_DTYPE = np.dtype("<u8")
+# fixed siphash key so digests are stable across runs and machines
+HASH_KEY = "dsi321-digest-k1"
+# fold the log into the sorted file once it holds this many digests
+COMPACT_LOG_SIZE = 65536
+
+
+def text_digests(texts) -> np.ndarray:
+    """Vectorized 64-bit digests of a column of strings."""
+    values = pd.Series(texts, dtype=object).to_numpy()
+    return pd.util.hash_array(values, hash_key=HASH_KEY).astype(DIGEST_DTYPE)
+
+
+class BloomFilter:
+    """Bit-packed Bloom filter over uint64 digests using double hashing."""
+
+    def __init__(self, capacity: int, bits_per_key: int = 10, hashes: int = 7):
+        self.size = max(1024, int(capacity * bits_per_key))
+        self.hashes = hashes
+        self.bits = np.zeros((self.size + 7) // 8, dtype=np.uint8)
+
+    def _positions(self, digests: np.ndarray) -> np.ndarray:
+        digests = np.asarray(digests, dtype=np.uint64)
+        h1 = digests
+        h2 = (digests >> np.uint64(32)) | np.uint64(1)
+        steps = np.arange(self.hashes, dtype=np.uint64)
+        return ((h1[:, None] + steps[None, :] * h2[:, None]) % np.uint64(self.size)).astype(np.int64)
+
+    def add(self, digests: np.ndarray):
+        if len(digests) == 0:
+            return
+        positions = self._positions(digests).ravel()
+        np.bitwise_or.at(self.bits, positions >> 3, (1 << (positions & 7)).astype(np.uint8))
+
+    def might_contain(self, digests: np.ndarray) -> np.ndarray:
+        if len(digests) == 0:
+            return np.zeros(0, dtype=bool)
+        positions = self._positions(digests)
+        return ((self.bits[positions >> 3] >> (positions & 7)) & 1).all(axis=1).astype(bool)
+
+
+class DigestIndex:
+    def __init__(self, path_prefix, use_bloom: bool = True):
+        self.sorted_path = Path(f"{path_prefix}.u64")
+        self.log_path = Path(f"{path_prefix}.log")
+        self.sorted_path.parent.mkdir(parents=True, exist_ok=True)
+        self.use_bloom = use_bloom
+        self.load()
+
+    @property
+    def exists(self) -> bool:
+        return self.sorted_path.exists() or self.log_path.exists()
+
+    def _read_log(self) -> np.ndarray:
+        if not self.log_path.exists():
+            return np.zeros(0, dtype=DIGEST_DTYPE)
+        raw = self.log_path.read_bytes()
+        # a torn final append leaves a partial record, ignore it
+        raw = raw[: len(raw) - len(raw) % DIGEST_DTYPE.itemsize]
+        return np.frombuffer(raw, dtype=DIGEST_DTYPE)
+
+    def load(self):
+        if self.sorted_path.exists() and self.sorted_path.stat().st_size > 0:
+            self._sorted = np.memmap(self.sorted_path, dtype=DIGEST_DTYPE, mode="r")
+        else:
+            self._sorted = np.zeros(0, dtype=DIGEST_DTYPE)
+        self._log = np.unique(self._read_log())
+
+        self._bloom = None
+        if self.use_bloom:
+            self._bloom = BloomFilter(capacity=2 * (len(self._sorted) + len(self._log)) + 1024)
+            self._bloom.add(np.asarray(self._sorted))
+            self._bloom.add(self._log)
+
+    def __len__(self) -> int:
+        return len(self._sorted) + len(self._log)
+
+    def contains(self, digests) -> np.ndarray:
+        """Boolean mask: which of ``digests`` are in the index."""
+        digests = np.asarray(digests, dtype=DIGEST_DTYPE)
+        result = np.zeros(len(digests), dtype=bool)
+        candidates = np.arange(len(digests))
+        if self._bloom is not None:
+            candidates = candidates[self._bloom.might_contain(digests)]
+        if len(candidates) == 0:
+            return result
+
+        values = digests[candidates]
+        found = np.isin(values, self._log)
+        if len(self._sorted):
+            pos = np.searchsorted(self._sorted, values)
+            in_range = pos < len(self._sorted)
+            found[in_range] |= np.asarray(self._sorted[pos[in_range]]) == values[in_range]
+        result[candidates] = found
+        return result
+
+    def append(self, digests):
+        """Durably add ``digests`` that are not in the index yet."""
+        digests = np.unique(np.asarray(digests, dtype=DIGEST_DTYPE))
+        digests = digests[~self.contains(digests)]
+        if len(digests) == 0:
+            return 0
+
+        fd = os.open(self.log_path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        try:
+            os.write(fd, digests.tobytes())
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+        self._log = np.union1d(self._log, digests)
+        if self._bloom is not None:
+            self._bloom.add(digests)
+        if len(self._log) >= COMPACT_LOG_SIZE:
+            self.compact()
+        return len(digests)
+
+    def compact(self):
+        """Merge the append log into the sorted file."""
+        merged = np.union1d(np.asarray(self._sorted), self._log).astype(DIGEST_DTYPE)
+        tmp_path = self.sorted_path.with_suffix(".u64.tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(merged.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        # drop the memmap before replacing the file underneath it
+        self._sorted = np.zeros(0, dtype=DIGEST_DTYPE)
+        os.replace(tmp_path, self.sorted_path)
+        # a crash before this truncate only leaves duplicates in the log
+        open(self.log_path, "wb").close()
+        self.load()
@@ -13,19 +13,14 @@ import re
 load_dotenv()
 
 GEMINI_API_KEY  = os.getenv("GEMINI_API_KEY")
-os.environ["GEMINI_API_KEY"] = GEMINI_API_KEY 
+if GEMINI_API_KEY:
+    os.environ["GEMINI_API_KEY"] = GEMINI_API_KEY 
 
 from google import genai
 from google.genai import types
 
 
-file_dir = Path(__file__).resolve().parent
-# file_dir = Path(os.getcwd())
-root_dir = file_dir / '..'
-if Path("/data").exists():
-    data_dir = Path("/data")
-else:
-    data_dir = root_dir / "data" 
+from paths import data_dir
 
 tweets_dir = data_dir / "tweets"
 
@@ -35,81 +30,302 @@ hash_tag_dir.mkdir(parents=True, exist_ok=True)
 faq_dir = data_dir / "faq"
 faq_dir.mkdir(parents=True, exist_ok=True)
 
-client = genai.Client(api_key=GEMINI_API_KEY)
+faq_agg_dir = data_dir / "faq_agg"
+
+client = None
 logger = logging.getLogger(__name__)
 logging.basicConfig(
     level=logging.INFO,
     format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
 )
 
-from pipeline.lakefs_load import to_faqs
+from llm_engine import RateLimiter, call_with_backoff, run_batches, estimate_tokens, EXTRACT_WORKERS
+from batching import plan_batches, select_topics, format_topics, format_message
+from llm_cache import ResponseCache, prompt_version
+from digest_index import DigestIndex, text_digests
+from tag_state import extraction_since, advance_extraction_watermark
+from topic_agg import update_topic_counts, rebuild_topic_counts, read_topic_counts, agg_path
+from topic_vocab import TopicVocab, vocab_lock
+from extraction_log import ExtractionLog
+from run_metrics import span, inc, observe, observe_many, timed
+from prefilter import prefilter, near_duplicate_key
+from store import (
+    PARTITION_COLS, COMPACT_MIN_FILES, open_key_index, known_keys, rebuild_key_index, append_partitions,
+    compact_partitions,
+)
+import numpy as np
+import pyarrow.parquet as pq
+import pyarrow as pa
+import pyarrow.dataset as ds
+from collections import Counter
+import time
 
 # model = "gemini-2.5-flash-preview-04-17"
 # or this
 model = "gemini-2.0-flash"
 
 
+rate_limiter = RateLimiter()
+response_cache = None
+
+
+def get_client():
+    """The shared Gemini client, created on first use."""
+    global client
+    if client is None:
+        client = genai.Client(api_key=GEMINI_API_KEY)
+    return client
+
+def get_response_cache():
+    global response_cache
+    if response_cache is None:
+        response_cache = ResponseCache()
+    return response_cache
+
+def set_client(new_client):
+    """Swap the Gemini client, e.g. for ``fake_genai.FakeClient`` in offline runs."""
+    global client
+    client = new_client
+
+
 def hash_string(s):
     return sha256(s.encode()).hexdigest()
 
-def recall_processed(tag:str):
+def _migrate_legacy_hashes(tag: str, index: DigestIndex):
+    """
+    One-off conversion of the old ``<tag>.txt`` file of sha256 hex strings:
+    the tag's tweet texts are re-hashed once and the digests of the ones
+    listed there are added to ``index``.
+    """
+    legacy_path = hash_tag_dir / f"{tag}.txt"
+    with open(legacy_path, "r") as f:
+        legacy_hashes = set(line.strip() for line in f)
+
+    all_parquet = list((tweets_dir / f"tag={tag}").rglob("*.parquet"))
+    if all_parquet:
+        texts = pd.concat(
+            [pd.read_parquet(f, columns=['tweetText']) for f in all_parquet], ignore_index=True
+        )['tweetText'].drop_duplicates()
+        processed = texts[texts.map(hash_string).isin(legacy_hashes)]
+        index.append(text_digests(processed))
+    legacy_path.rename(legacy_path.with_suffix(".txt.migrated"))
+    logger.info(f"Migrated {len(index)} processed hashes for tag {tag} to the digest index")
+
+def recall_processed(tag:str) -> DigestIndex:
     tag = re.sub(r"[^a-zA-Z0-9ก-๙]", "", tag)
-    existing_hashes_path = hash_tag_dir/ f"{tag}.txt"
-    if existing_hashes_path.exists():
-        with open(existing_hashes_path, "r") as f:
-            existing_hashes = set(line.strip() for line in f)
-    else:
-        existing_hashes = set()
-    return existing_hashes
-
-def update_hash(tag:str, new_hashes:set, existing_hashes:set = None):
+    index = DigestIndex(hash_tag_dir / tag)
+    if not index.exists and (hash_tag_dir / f"{tag}.txt").exists():
+        _migrate_legacy_hashes(tag, index)
+    return index
+
+def update_hash(tag:str, new_hashes, existing_hashes: DigestIndex = None):
     tag = re.sub(r"[^a-zA-Z0-9ก-๙]", "", tag)
-    existing_hashes_path = hash_tag_dir/ f"{tag}.txt"
-    if not existing_hashes:
+    if existing_hashes is None:
         existing_hashes = recall_processed(tag)
-        
-    unique_new_hashes = [h for h in new_hashes if h not in existing_hashes]
+    existing_hashes.append(new_hashes)
 
-    with open(existing_hashes_path, "a") as f:
-        for h in unique_new_hashes:
-            f.write(f"{h}\n")
+def recall_prefiltered(tag:str) -> DigestIndex:
+    """Processed tweets the pre-filter kept from Gemini, a subset of ``recall_processed``."""
+    tag = re.sub(r"[^a-zA-Z0-9ก-๙]", "", tag)
+    return DigestIndex(hash_tag_dir / f"{tag}.prefiltered")
 
 
-def get_tweet_data(tag:str, new_only:bool = True):
-    tag = re.sub(r"[^a-zA-Z0-9ก-๙]", "", tag)
+TWEET_COLUMNS = ['tweetText', 'postTime', 'scrapeTime']
+TWEET_PARTITIONING = ds.partitioning(
+    pa.schema([("postYear", pa.int32()), ("postMonth", pa.int32()), ("postDay", pa.int32())]),
+    flavor="hive",
+)
+
+def since_filter(since):
+    """Partition filter keeping postYear/postMonth/postDay on or after ``since``."""
+    year, month, day = ds.field("postYear"), ds.field("postMonth"), ds.field("postDay")
+    return (
+        (year > since.year)
+        | ((year == since.year) & (month > since.month))
+        | ((year == since.year) & (month == since.month) & (day >= since.day))
+    )
 
+def iter_tweet_batches(tag: str, since=None, columns: list = TWEET_COLUMNS, batch_size: int = 65536):
+    """
+    Stream the tag's tweets as record batches, reading only ``columns`` and
+    only the partitions dated ``since`` or later.
+    """
     tweets_tag_dir = tweets_dir / f"tag={tag}"
-    all_parquet = list(tweets_tag_dir.rglob("*.parquet"))
-    print(tweets_tag_dir)
-    tweets_df = pd.concat([pd.read_parquet(f) for f in all_parquet], ignore_index=True)
+    if not tweets_tag_dir.exists():
+        return
+    dataset = ds.dataset(tweets_tag_dir, format="parquet", partitioning=TWEET_PARTITIONING)
+    scan_filter = since_filter(since) if since is not None else None
+    yield from dataset.to_batches(columns=columns, filter=scan_filter, batch_size=batch_size)
+
+def iter_new_tweets(tag: str, since=None, new_only: bool = True):
+    """
+    Yield DataFrames of the tag's tweets not yet processed (or all tweets
+    with ``new_only=False``), de-duplicated by text, one per record batch.
+    """
+    existing_hashes = recall_processed(tag) if new_only else None
+    seen = set()
+    for batch in iter_tweet_batches(tag, since=since):
+        df = batch.to_pandas()
+        df['hash'] = text_digests(df['tweetText'])
+        if existing_hashes is not None:
+            df = df[~existing_hashes.contains(df['hash'].to_numpy())]
+        df = df.drop_duplicates(subset='hash')
+        df = df[~df['hash'].isin(seen)]
+        if df.empty:
+            continue
+        seen.update(df['hash'].tolist())
+        yield df
 
-    tweets_df.sort_values(by=['postTime'], ascending=True, inplace=True)
-    tweets_df.drop_duplicates(subset="tweetText")
+@timed("extract.read")
+def get_tweet_data(tag:str, new_only:bool = True, since=None):
+    tag = re.sub(r"[^a-zA-Z0-9ก-๙]", "", tag)
+
+    frames = list(iter_new_tweets(tag, since=since, new_only=new_only))
+    if not frames:
+        return pd.DataFrame(columns=TWEET_COLUMNS + ['hash', 'index'])
+    tweets_df = pd.concat(frames, ignore_index=True)
+
+    tweets_df.sort_values(by=['postTime'], ascending=True, inplace=True, kind='stable')
+    tweets_df.reset_index(drop=True, inplace=True)
     tweets_df['index'] = tweets_df.index + 1
+    # the exact post time, for latency tracking; postTime itself becomes a day
+    tweets_df['postedAt'] = tweets_df['postTime']
     tweets_df['postTime'] = tweets_df['postTime'].dt.strftime('%Y-%m-%d')
-    
-    if new_only:
-        existing_hashes = recall_processed(tag)
-        tweets_df['hash'] = tweets_df['tweetText'].apply(hash_string)
-        new_tweets_df = tweets_df[~tweets_df['hash'].isin(existing_hashes)]
-        return new_tweets_df
-    
-    
     return tweets_df
 
+def record_latency(tweets_df: pd.DataFrame):
+    """Per-tweet time from posting and from scraping until its extraction was committed."""
+    now = pd.Timestamp.now()
+    observe_many("tweet.post_to_faq", (now - tweets_df['postedAt']).dt.total_seconds())
+    observe_many("tweet.scrape_to_faq", (now - pd.to_datetime(tweets_df['scrapeTime'])).dt.total_seconds())
+
+
+FAQ_KEY_COL = "faqKey"
+
+def faq_key(df: pd.DataFrame) -> pd.Series:
+    """Stable key per FAQ row: a 64-bit hash of its text."""
+    content_hash = pd.util.hash_pandas_object(df["text"], index=False).to_numpy()
+    return pd.Series(np.char.mod("h%016x", content_hash), index=df.index, dtype=object)
+
+def open_faq_index(tag: str):
+    """
+    The tag's FAQ key index, filled from the files on disk on first use.
+    An old single-file FAQ table is split into date partitions on the way.
+    """
+    faq_tag_dir = faq_dir / f"tag={tag}"
+    legacy_path = faq_tag_dir / "part.parquet"
+    # a leading underscore keeps dataset scans from picking it up
+    pending_path = faq_tag_dir / "_part.parquet.legacy"
+    # move the old file out of the way first, so the index is not built from it
+    if legacy_path.exists():
+        legacy_path.rename(pending_path)
+
+    conn = open_key_index("faq", tag)
+    if conn.execute("SELECT 1 FROM keys LIMIT 1").fetchone() is None:
+        rebuild_key_index(conn, faq_tag_dir, key_fn=faq_key, key_columns=("text",), key_col=FAQ_KEY_COL)
+    if pending_path.exists():
+        _migrate_legacy_faq(tag, conn, pending_path)
+    return conn
+
+def _migrate_legacy_faq(tag: str, conn, legacy_path: Path):
+    """Append the rows of the old single-file FAQ table as partitions, then remove it."""
+    legacy_df = pq.read_table(legacy_path, partitioning=None).to_pandas()
+    legacy_df = legacy_df.drop(columns=PARTITION_COLS, errors="ignore")
+    legacy_df = add_faq_partitions(legacy_df.drop_duplicates(subset=["text"]))
+    append_partitions(faq_dir / f"tag={tag}", legacy_df, conn, key_col=FAQ_KEY_COL)
+    legacy_path.unlink()
+    logger.info(f"Split {len(legacy_df)} FAQ rows of tag {tag} into date partitions")
+
+def add_faq_partitions(faq_df: pd.DataFrame) -> pd.DataFrame:
+    faq_df = faq_df.copy()
+    post_time = pd.to_datetime(faq_df['postTime'])
+    faq_df['postYear'] = post_time.dt.year
+    faq_df['postMonth'] = post_time.dt.month
+    faq_df['postDay'] = post_time.dt.day
+    faq_df[FAQ_KEY_COL] = faq_key(faq_df)
+    return faq_df
+
+def read_faq(tag: str, columns: list = None) -> pd.DataFrame:
+    """All stored FAQ rows of ``tag`` (only ``columns`` if given)."""
+    faq_tag_dir = faq_dir / f"tag={tag}"
+    if not any(faq_tag_dir.rglob("*.parquet")):
+        return pd.DataFrame(columns=columns)
+    dataset = ds.dataset(faq_tag_dir, format="parquet", partitioning=TWEET_PARTITIONING)
+    return dataset.to_table(columns=columns).to_pandas()
+
+def labelled_tweets(tag: str) -> pd.DataFrame:
+    """
+    The tag's processed tweets in posting order with ``isFaq``: whether the
+    tweet came back as an FAQ (matched on ``near_duplicate_key``, so FAQ
+    text that lost a link or an emoji still counts). Tweets the pre-filter
+    dropped are left out, Gemini never saw them.
+    """
+    tag = re.sub(r"[^a-zA-Z0-9ก-๙]", "", tag).lower()
+    processed, prefiltered = recall_processed(tag), recall_prefiltered(tag)
+    frames = []
+    for df in iter_new_tweets(tag, new_only=False):
+        digests = df['hash'].to_numpy()
+        frames.append(df[processed.contains(digests) & ~prefiltered.contains(digests)])
+    if not frames:
+        return pd.DataFrame(columns=TWEET_COLUMNS + ['hash', 'isFaq'])
+    tweets = pd.concat(frames, ignore_index=True).sort_values('postTime', kind='stable', ignore_index=True)
+    faq_keys = set(read_faq(tag, columns=["text"])["text"].map(near_duplicate_key))
+    tweets['isFaq'] = tweets['tweetText'].map(near_duplicate_key).isin(faq_keys)
+    return tweets
+
+def existing_topic_counts(tag: str) -> Counter:
+    """How often each topic was assigned so far, from the aggregates when they exist."""
+    if agg_path(faq_agg_dir, tag).exists():
+        counts = read_topic_counts(faq_agg_dir, tag, columns=["topic", "count"])
+        return Counter(dict(zip(counts["topic"], counts["count"])))
+    return Counter(read_faq(tag, columns=["topic"])["topic"].explode().dropna())
+
+def compact_faq(tag: str, min_files: int = COMPACT_MIN_FILES) -> int:
+    """
+    Merge the small files extraction runs leave in each FAQ partition and
+    recount the tag's topic aggregates, by canonical topic, from the
+    compacted store.
+    """
+    tag = re.sub(r"[^a-zA-Z0-9ก-๙]", "", tag).lower()
+    compacted = compact_partitions(faq_dir / f"tag={tag}", min_files=min_files, key_fn=faq_key, key_col=FAQ_KEY_COL)
+    # an extract run holds the lock until its topics and counts are committed
+    with vocab_lock(tag):
+        recount_topics(tag)
+    return compacted
+
+def recount_topics(tag: str):
+    """Rebuild the topic counts from the FAQ store; the caller holds ``vocab_lock``."""
+    vocab = TopicVocab.load(tag)
+
+    def all_faq():
+        # rows written before the topic dictionary (or before a later merge) are counted under their canonical topic
+        faq = read_faq(tag, columns=["postTime", "topic"])
+        faq["topic"] = faq["topic"].map(vocab.canonical)
+        return faq
+
+    rebuild_topic_counts(faq_agg_dir, tag, all_faq)
+    vocab.save()
+
 
 from prompt_template import instruction, prompt_template
 
+PROMPT_VERSION = prompt_version(instruction, prompt_template)
+
 def topic_extraction(
     tweets_dicts: list,
-    faq_topic: set  = set()
+    faq_topic: list = []
     ) -> dict:
     
     prompt_formatted = prompt_template.format(
-        faq_topic = faq_topic,
-        messages="\n".join([f"{row['index']}: {row['tweetText']}" for row in tweets_dicts]),
+        faq_topic = format_topics(faq_topic),
+        messages="\n".join([format_message(row) for row in tweets_dicts]),
     )
-    response = client.models.generate_content(
+    estimated_tokens = estimate_tokens(instruction) + estimate_tokens(prompt_formatted)
+    with span("extract.rate_limit_wait"):
+        rate_limiter.acquire(estimated_tokens)
+    start = time.perf_counter()
+    response = call_with_backoff(
+        get_client().models.generate_content,
         model=model,
         contents=prompt_formatted,
         config=types.GenerateContentConfig(
@@ -117,53 +333,193 @@ def topic_extraction(
             temperature=0.2, # low temperature for more deterministic output kub
         ),
     )
+    latency = time.perf_counter() - start
+
+    usage = getattr(response, "usage_metadata", None)
+    prompt_tokens = getattr(usage, "prompt_token_count", None) or estimated_tokens
+    output_tokens = getattr(usage, "candidates_token_count", None) or 0
+    observe("extract.llm_call", latency)
+    inc("llm_calls")
+    inc("llm_tokens", prompt_tokens, kind="prompt")
+    inc("llm_tokens", output_tokens, kind="output")
+    logger.info(
+        f"Batch of {len(tweets_dicts)} tweets: {prompt_tokens} prompt + {output_tokens} output tokens "
+        f"(estimated {estimated_tokens}), {latency:.2f}s, "
+        f"{(prompt_tokens + output_tokens) / max(len(tweets_dicts), 1):.0f} tokens/tweet"
+    )
+
     response_text = response.text
     response_json = response_text[response_text.index("{"): response_text.rindex("}") + 1]
     response_json = response_json.replace("{{", "{").replace("}}", "}")
     response_json = json.loads(response_json, strict=False)
     return response_json
 
-def extract(tag:str):
+def with_hashes(faq: list, tweets_dicts: list) -> list:
+    """FAQ items keyed by tweet hash instead of the run-specific ``index``."""
+    hash_of = {row['index']: row['hash'] for row in tweets_dicts}
+    return [
+        {**{k: v for k, v in item.items() if k != 'index'}, 'hash': hash_of[item['index']]}
+        for item in faq if item.get('index') in hash_of
+    ]
+
+def with_indexes(faq: list, tweets_dicts: list) -> list:
+    """Inverse of ``with_hashes`` for the tweets of this run."""
+    index_of = {row['hash']: row['index'] for row in tweets_dicts}
+    return [
+        {**{k: v for k, v in item.items() if k != 'hash'}, 'index': index_of[item['hash']]}
+        for item in faq if item.get('hash') in index_of
+    ]
+
+def cached_topic_extraction(tweets_dicts: list, faq_topic: list = []):
+    """
+    ``topic_extraction`` behind the response cache. Cached answers are stored
+    against tweet hashes rather than the run-specific ``index`` so they can be
+    mapped back onto whatever index the tweets get in a later run.
+
+    Returns:
+        (response, hit) where ``hit`` tells whether the cache answered.
+    """
+    cache = get_response_cache()
+    key = cache.key(model, PROMPT_VERSION, [row['hash'] for row in tweets_dicts])
+
+    cached = cache.get(key)
+    inc("llm_cache_lookups", result="hit" if cached is not None else "miss")
+    if cached is not None:
+        return {'faq': with_indexes(cached['faq'], tweets_dicts)}, True
+
+    response = topic_extraction(tweets_dicts, faq_topic=faq_topic)
+    cache.put(key, {'faq': with_hashes(response['faq'], tweets_dicts)})
+    return response, False
+
+def commit_run(tag: str, log: ExtractionLog, new_faq: pd.DataFrame, hashes, dropped_hashes=(),
+               processed_through=None, dirty_since=None) -> pd.DataFrame:
+    """
+    Write a run's FAQ rows, topic counts, processed hashes and watermark.
+    Everything is logged first and every step after that is idempotent, so
+    a crash anywhere below is repaired by ``replay_commit``. Returns the FAQ
+    rows that were new.
+    """
+    faq_tag_dir = faq_dir / f"tag={tag}"
+    conn = open_faq_index(tag)
+    try:
+        if log.committed_keys is None:
+            known = known_keys(conn, new_faq[FAQ_KEY_COL])
+            log.begin_commit(sorted(set(new_faq[FAQ_KEY_COL]) - known), new_faq, hashes, dropped_hashes,
+                             processed_through, dirty_since)
+        added_keys = set(log.committed_keys)
+        append_partitions(faq_tag_dir, new_faq, conn, key_col=FAQ_KEY_COL)
+    finally:
+        conn.close()
+    added_faq = new_faq[new_faq[FAQ_KEY_COL].isin(added_keys)].drop_duplicates(subset=[FAQ_KEY_COL])
+    logger.info(f"Appended {len(added_faq)} new FAQ rows for tag: {tag}")
+    inc("rows_written", len(added_faq), collection="faq", tag=tag)
+
+    def faq_before_run():
+        stored = read_faq(tag, columns=["postTime", "topic", FAQ_KEY_COL])
+        return stored[~stored[FAQ_KEY_COL].isin(added_keys)]
+
+    update_topic_counts(faq_agg_dir, tag, added_faq, existing_faq=faq_before_run, run_id=log.run_id)
+    recall_prefiltered(tag).append(dropped_hashes)
+    update_hash(tag, hashes)
+    advance_extraction_watermark(tag, processed_through, dirty_since)
+    log.finish()
+    return added_faq
+
+def replay_commit(tag: str, log: ExtractionLog):
+    """Finish the commit of a run that died while committing, exactly as that run started it."""
+    new_faq = log.committed_faq()
+    if new_faq is None:
+        # logged before the rows were kept with the commit: recount the topics from the store instead
+        logger.warning(f"Run {log.run_id} of tag {tag} died while committing; recounting its topics")
+        recount_topics(tag)
+        log.finish()
+        return
+    logger.info(f"Finishing the commit of interrupted run {log.run_id} for tag {tag}")
+    commit = log.commit
+    commit_run(
+        tag, log, new_faq, np.asarray(commit["hashes"], dtype=np.uint64),
+        np.asarray(commit["dropped"], dtype=np.uint64), commit["processedThrough"], commit["dirtySince"],
+    )
+
+@timed("extract")
+def extract(tag:str, max_workers: int = EXTRACT_WORKERS):
     tag = re.sub(r"[^a-zA-Z0-9ก-๙]", "", tag)
     tag = tag.lower()
+    # the run's topic dictionary is only saved at commit, compaction waits for it
+    with vocab_lock(tag):
+        return _extract(tag, max_workers)
+
+def _extract(tag: str, max_workers: int):
     faq_tag_dir = faq_dir / f"tag={tag}"
     faq_tag_dir.mkdir(parents=True, exist_ok=True)
-    
-    faq_tag_dest = faq_tag_dir / f"part.parquet"
+    # splits an old single-file FAQ table into partitions before anything reads it
+    open_faq_index(tag).close()
 
-    tweets_df = get_tweet_data(tag)
+    # a run that died while committing is finished first, its run id and keys are its own
+    log = ExtractionLog.open(tag)
+    if log.committed_keys is not None:
+        replay_commit(tag, log)
+        log = ExtractionLog.open(tag)
+
+    since, dirty_since = extraction_since(tag)
+    tweets_df = get_tweet_data(tag, since=since)
     if tweets_df.empty:
         logger.info(f"No new tweets found for tag: {tag}")
+        advance_extraction_watermark(tag, None, dirty_since)
         return None
     
-    existing_faq_topics = set()
-    if faq_tag_dest.exists():
-        existing_faq_df = pd.read_parquet(faq_tag_dest)
-        existing_faq_topics = set(existing_faq_df['topic'].explode().unique())
+    vocab = TopicVocab.load(tag)
+    topic_counts = Counter(vocab.canonical_counts(existing_topic_counts(tag)))
     
     tweets_dicts:list = tweets_df.to_dict(orient="records")
-    step = 50
-    prev_stop = 0
     all_response = []
-    # new_topic = set(existing_faq_topics)
 
-    for ind in tqdm(range(step, len(tweets_dicts) + step, step)):
-        start = prev_stop
-        stop = ind
-        prev_stop = stop
-        rows = tweets_dicts[start:stop]
-        
-        response = topic_extraction(rows, faq_topic=existing_faq_topics)
-        
-        for row in response['faq']:
-            for topic in row['topic']:
-                existing_faq_topics.add(topic)
+    def absorb(faq_items):
+        for row in faq_items:
+            row['topicId'] = vocab.resolve_all(row['topic'])
+            row['topic'] = [vocab.labels[topic_id] for topic_id in row['topicId']]
+            topic_counts.update(row['topic'])
+        all_response.append(faq_items)
 
+    # batches a previous, interrupted run already got answers for
+    for _, faq in log.batches:
+        absorb(with_indexes(faq, tweets_dicts))
+    done_hashes = log.done_hashes
+    # obvious non-questions, retweets and near-duplicates never reach Gemini
+    drop_reason = prefilter(tweets_df)
+    dropped_hashes = tweets_df['hash'][drop_reason != ""].to_numpy()
+    skipped = done_hashes | set(dropped_hashes.tolist())
+    pending = [row for row in tweets_dicts if row['hash'] not in skipped]
+
+    batches = plan_batches(pending)
+    logger.info(f"Planned {len(batches)} batches for {len(pending)} of {len(tweets_dicts)} tweets")
+    cache_hits = cache_misses = 0
+
+    def run_batch(rows, wave_topics):
+        response, hit = cached_topic_extraction(rows, faq_topic=wave_topics)
+        log.add_batch([row['hash'] for row in rows], with_hashes(response['faq'], rows))
+        return response, hit
+
+    # Batches run ``max_workers`` at a time. Every batch in a wave sees the
+    # same topic list, and topics found in a wave are added in batch order
+    # before the next wave starts, so the result does not depend on timing.
+    for wave_start in tqdm(range(0, len(batches), max_workers)):
+        wave = batches[wave_start:wave_start + max_workers]
+        wave_topics = select_topics(topic_counts)
+        responses = run_batches(
+            wave,
+            lambda rows: run_batch(rows, wave_topics),
+            max_workers=max_workers,
+        )
+
+        for response, hit in responses:
+            cache_hits += hit
+            cache_misses += not hit
+            absorb(response['faq'])
         
-        all_response.append(response['faq'])
-        
+    logger.info(f"LLM cache for tag {tag}: {cache_hits} hits, {cache_misses} misses")
     flatten_response =[ele for lst in all_response for ele in lst]
-    new_faq = pd.DataFrame(flatten_response)\
+    new_faq = pd.DataFrame(flatten_response, columns=None if flatten_response else ['index', 'text', 'topic', 'topicId'])\
             .merge(
                 tweets_df[['index',  'postTime', 'scrapeTime']],
                 on='index',
@@ -171,28 +527,19 @@ def extract(tag:str):
             )\
             .drop(columns=['index'])
     
-    if faq_tag_dest.exists():
-        existing_faq_df = pd.read_parquet(faq_tag_dest)
-        existing_faq_df = existing_faq_df
-        new_faq = pd.concat([existing_faq_df, new_faq], ignore_index=True)
-        new_faq.drop_duplicates(subset=["text"], inplace=True)
-        new_faq.reset_index(drop=True, inplace=True)
     new_faq['tag'] = tag
-    new_faq['postDay'] = pd.to_datetime(new_faq['postTime']).dt.day
-    new_faq['postMonth'] = pd.to_datetime(new_faq['postTime']).dt.month
-    new_faq['postYear'] = pd.to_datetime(new_faq['postTime']).dt.year
-    new_faq.to_parquet(
-        path=faq_tag_dest,
-        engine="pyarrow",
-        compression="snappy",
-        index=False,
-    )
+    new_faq = add_faq_partitions(new_faq)
 
-    new_hashes = set(tweets_df['tweetText'].apply(hash_string))
-    update_hash(tag, new_hashes)
+    # Topic ids must be on disk before any row refers to them.
+    commit_start = time.perf_counter()
+    vocab.save()
+    added_faq = commit_run(
+        tag, log, new_faq, tweets_df['hash'].to_numpy(), dropped_hashes, tweets_df['postTime'].max(), dirty_since,
+    )
+    observe("extract.commit", time.perf_counter() - commit_start)
+    record_latency(tweets_df)
     logger.info(f"Updated hash for tag: {tag}")
-    to_faqs(new_faq)
-    return new_faq
+    return added_faq
 
 if __name__ == "__main__":
     extract("DSI321")
\ No newline at end of file
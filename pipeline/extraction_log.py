@@ -0,0 +1,127 @@
+'''
+Write-ahead log of one extraction run, so a run that dies halfway does not
+lose (or pay again for) the batches it already finished.
+
+``data/wal/<tag>.jsonl`` starts with a header naming the run. Every batch
+that comes back from the LLM is appended as one line holding the hashes of
+the batch's tweets and its FAQ items (keyed by tweet hash), and fsynced.
+Before the results are written to the FAQ store the run's FAQ rows are
+saved next to the log (``<tag>.commit.parquet``) and a commit line records
+the keys of the rows it adds, the hashes of its tweets and its watermark.
+That is everything the commit needs and every step after it is
+idempotent, so a run that dies during commit is replayed as it was by the
+next one, before that one starts any work of its own. The log is deleted
+once the commit is complete.
+'''
+
+from pathlib import Path
+from uuid import uuid4
+import json
+import logging
+import os
+import threading
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+from paths import data_dir
+
+wal_dir = data_dir / "wal"
+
+
+class ExtractionLog:
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.run_id = None
+        self.batches = []        # (hashes, faq items) in the order they completed
+        self.committed_keys = None
+        self.commit = None       # the commit record, once the run started committing
+        self._lock = threading.Lock()
+
+    @classmethod
+    def open(cls, tag: str) -> "ExtractionLog":
+        """The unfinished run of ``tag`` if there is one, else a new run."""
+        log = cls(wal_dir / f"{tag}.jsonl")
+        if log.path.exists():
+            log._read()
+        if log.run_id is None:
+            log.run_id = uuid4().hex
+            log._write({"run": log.run_id}, truncate=True)
+        elif log.batches or log.committed_keys is not None:
+            logger.info(
+                f"Resuming extraction run {log.run_id} for tag {tag}: "
+                f"{len(log.batches)} batches already done"
+            )
+        return log
+
+    def _read(self):
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # only the last line can be torn, by a crash mid-write
+                    break
+                if "run" in record:
+                    self.run_id = record["run"]
+                elif "batch" in record:
+                    self.batches.append((record["batch"], record["faq"]))
+                elif "commit" in record:
+                    self.committed_keys = record["commit"]
+                    self.commit = record
+
+    def _write(self, record: dict, truncate: bool = False):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._lock, open(self.path, "w" if truncate else "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    @property
+    def done_hashes(self) -> set:
+        return {h for hashes, _ in self.batches for h in hashes}
+
+    def add_batch(self, hashes: list, faq: list):
+        """Durably record a finished batch; ``faq`` items carry ``hash`` instead of ``index``."""
+        hashes = [int(h) for h in hashes]
+        self._write({"batch": hashes, "faq": faq})
+        with self._lock:
+            self.batches.append((hashes, faq))
+
+    @property
+    def faq_path(self) -> Path:
+        return self.path.with_suffix(".commit.parquet")
+
+    def begin_commit(self, keys: list, faq_df: pd.DataFrame, hashes, dropped_hashes=(), processed_through=None,
+                     dirty_since=None):
+        """
+        Durably record what the run is about to commit: its FAQ rows, the
+        keys of the ones that are new, the hashes of all its tweets (and of
+        those the pre-filter dropped) and its watermark arguments.
+        """
+        tmp_path = self.faq_path.with_suffix(".tmp")
+        faq_df.to_parquet(tmp_path, engine="pyarrow", index=False)
+        with open(tmp_path, "rb") as f:
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.faq_path)
+        record = {
+            "commit": list(keys),
+            "hashes": [int(h) for h in hashes],
+            "dropped": [int(h) for h in dropped_hashes],
+            "processedThrough": processed_through,
+            "dirtySince": dirty_since,
+        }
+        self._write(record)
+        self.committed_keys = list(keys)
+        self.commit = record
+
+    def committed_faq(self):
+        """The FAQ rows saved by ``begin_commit``; None for a log written before they were saved."""
+        if not self.faq_path.exists():
+            return None
+        return pd.read_parquet(self.faq_path, engine="pyarrow")
+
+    def finish(self):
+        self.path.unlink(missing_ok=True)
+        self.faq_path.unlink(missing_ok=True)
@@ -0,0 +1,89 @@
+'''
+Offline stand-in for ``google.genai.Client`` used to exercise extraction
+without calling Gemini.
+
+``FakeClient().models.generate_content(...)`` reads the "<index>: <text>"
+lines out of the prompt and answers with canned FAQ JSON for them after a
+configurable latency. It can also raise 429s to exercise the backoff path.
+'''
+
+import json
+import random
+import re
+import threading
+import time
+from types import SimpleNamespace
+
+MESSAGE_LINE = re.compile(r"^(\d+): (.*)$", re.MULTILINE)
+
+DEFAULT_TOPICS = ["การลงทะเบียน", "ทุนการศึกษา", "หอพัก", "การสอบ", "รถรับส่ง"]
+
+
+class FakeAPIError(Exception):
+    def __init__(self, code: int, message: str = "fake api error"):
+        super().__init__(f"{code} {message}")
+        self.code = code
+
+
+class _FakeModels:
+    def __init__(self, owner):
+        self.owner = owner
+
+    def generate_content(self, model: str, contents: str, config=None):
+        return self.owner._respond(model, contents)
+
+
+class FakeClient:
+    """
+    Args:
+        latency: Seconds to sleep per call (a float, or a (low, high) range).
+        topics: Topic labels to hand out.
+        faq_ratio: Share of messages answered as FAQs.
+        error_rate: Probability that a call raises ``FakeAPIError(429)``.
+        seed: Seed for the deterministic pseudo-random choices.
+    """
+
+    def __init__(self, latency=0.0, topics=DEFAULT_TOPICS, faq_ratio: float = 0.5,
+                 error_rate: float = 0.0, seed: int = 0):
+        self.latency = latency
+        self.topics = list(topics)
+        self.faq_ratio = faq_ratio
+        self.error_rate = error_rate
+        self.seed = seed
+        self.calls = 0
+        self._lock = threading.Lock()
+        self._errors = random.Random(seed)
+        self.models = _FakeModels(self)
+
+    def _sleep(self):
+        latency = self.latency
+        if isinstance(latency, (tuple, list)):
+            latency = random.uniform(*latency)
+        if latency:
+            time.sleep(latency)
+
+    def _respond(self, model: str, contents: str):
+        with self._lock:
+            self.calls += 1
+            fail = self._errors.random() < self.error_rate
+        self._sleep()
+        if fail:
+            raise FakeAPIError(429, "resource exhausted")
+
+        faq = []
+        for index, text in MESSAGE_LINE.findall(contents):
+            # seeded per message so the answer does not depend on call order
+            rng = random.Random(f"{self.seed}:{text}")
+            if rng.random() >= self.faq_ratio:
+                continue
+            faq.append({
+                "index": int(index),
+                "text": text,
+                "topic": rng.sample(self.topics, k=min(2, len(self.topics))),
+            })
+        body = json.dumps({"faq": faq}, ensure_ascii=False)
+        usage = SimpleNamespace(
+            prompt_token_count=len(contents) // 3,
+            candidates_token_count=len(body) // 3,
+        )
+        return SimpleNamespace(text=f"```json\n{body}\n```", usage_metadata=usage)
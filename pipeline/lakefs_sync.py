@@ -0,0 +1,183 @@
+'''
+Incremental sync of the local parquet stores to LakeFS.
+
+Instead of re-writing whole DataFrames through ``to_lakefs`` on every run,
+``sync_to_lakefs`` compares the files under ``data/<collection>/`` with a
+local manifest of what was synced last time (size, mtime and md5 per file),
+uploads only new or changed files to a staging branch, removes files that
+disappeared locally (e.g. after compaction), and then makes one commit on
+staging and merges it into ``main``. The manifest is only written after the
+merge succeeds, so a failed run is simply retried. Staging is deleted and
+branched from ``main`` again at the start of every sync, so nothing a
+failed run left there (uncommitted changes or an unmerged commit) is ever
+merged.
+
+Files go through ``backfill.send_file``: byte for byte when they are in the
+hive layout, without the columns their path already holds otherwise, so
+the synced collections read back with ``pd.read_parquet``. The first sync
+(no manifest yet) also deletes every remote object of the collections that
+it did not write itself, such as the ones ``result_load.to_lakefs`` wrote
+under other names, which would otherwise be read twice.
+
+Pass ``commit=False`` and an ``fs`` to sync to any S3-compatible store
+(e.g. moto) without the LakeFS commit step.
+'''
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from hashlib import md5
+from pathlib import Path
+import json
+import logging
+import os
+
+import lakefs
+from lakefs.client import Client
+from lakefs.exceptions import NotFoundException
+
+from backfill import send_file, relative_key
+from result_load import (
+    data_dir, lakefs_endpoint, access_key, secret_key, repo, branch, get_fs,
+)
+from run_metrics import inc, observe
+
+logger = logging.getLogger(__name__)
+
+staging_branch = os.getenv("LAKEFS_STAGING_BRANCH", "staging")
+manifest_path = data_dir / "state" / "lakefs_manifest.json"
+
+SYNC_COLLECTIONS = ("tweets", "faq", "faq_agg")
+UPLOAD_WORKERS = int(os.getenv("LAKEFS_UPLOAD_WORKERS", 8))
+
+
+def file_md5(path: Path) -> str:
+    digest = md5()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def load_manifest() -> dict:
+    if not manifest_path.exists():
+        return {}
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_manifest(manifest: dict):
+    manifest_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = manifest_path.with_suffix(".json.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(tmp_path, manifest_path)
+
+
+def scan_local(collections=SYNC_COLLECTIONS, manifest: dict = None) -> dict:
+    """
+    Current manifest entries for every parquet file of ``collections``.
+    The md5 is only recomputed when size or mtime differ from ``manifest``.
+    """
+    manifest = manifest or {}
+    current = {}
+    for collection in collections:
+        root = data_dir / collection
+        if not root.exists():
+            continue
+        for path in root.rglob("*.parquet"):
+            rel_path = path.relative_to(data_dir).as_posix()
+            stat = path.stat()
+            previous = manifest.get(rel_path)
+            if previous and previous["size"] == stat.st_size and previous["mtime_ns"] == stat.st_mtime_ns:
+                current[rel_path] = previous
+            else:
+                current[rel_path] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "md5": file_md5(path)}
+    return current
+
+
+def diff_manifest(previous: dict, current: dict):
+    """Relative paths to upload and to delete."""
+    changed = sorted(p for p, entry in current.items() if previous.get(p, {}).get("md5") != entry["md5"])
+    deleted = sorted(p for p in previous if p not in current)
+    return changed, deleted
+
+
+def remote_objects(fs, target: str, collections=SYNC_COLLECTIONS) -> set:
+    """Paths relative to ``target`` of every object under ``collections``."""
+    objects = set()
+    for collection in collections:
+        root = f"{repo}/{target}/{collection}"
+        if fs.exists(root):
+            objects.update(relative_key(path, target) for path in fs.find(root))
+    return objects
+
+
+def lakefs_client() -> Client:
+    return Client(host=lakefs_endpoint, username=access_key, password=secret_key)
+
+
+def sync_to_lakefs(collections=SYNC_COLLECTIONS, message: str = None, fs=None, commit: bool = True,
+                   max_workers: int = UPLOAD_WORKERS) -> dict:
+    """
+    Push local changes since the last sync as one LakeFS commit.
+
+    Returns:
+        A summary dict with the uploaded/deleted counts, bytes and commit id.
+    """
+    previous = load_manifest()
+    current = scan_local(collections, previous)
+    changed, deleted = diff_manifest(previous, current)
+    summary = {"uploaded": len(changed), "deleted": len(deleted),
+               "bytes": sum(current[p]["size"] for p in changed), "commit": None}
+    if not changed and not deleted:
+        logger.info("LakeFS sync: nothing changed since last sync")
+        return summary
+
+    fs = fs or get_fs()
+    target = branch
+    if commit:
+        repository = lakefs.Repository(repo, client=lakefs_client())
+        staging = repository.branch(staging_branch)
+        try:
+            staging.delete()
+        except NotFoundException:
+            pass
+        staging = staging.create(source_reference=branch)
+        target = staging_branch
+
+    # without a manifest nothing on the remote side is known to be ours
+    leftovers = remote_objects(fs, target, collections) if not previous else set()
+
+    def upload(rel_path):
+        return send_file(rel_path, target, fs)["keys"]
+
+    start = datetime.now()
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for keys in pool.map(upload, changed):
+            leftovers.difference_update(keys)
+    leftovers.difference_update(current)
+    if leftovers:
+        logger.info(f"LakeFS sync: removing {len(leftovers)} objects the first sync did not write")
+    summary["deleted"] += len(leftovers)
+    if deleted or leftovers:
+        remote = [f"{repo}/{target}/{rel_path}" for rel_path in sorted(set(deleted) | leftovers)]
+        existing = [path for path in remote if fs.exists(path)]
+        if existing:
+            fs.rm(existing)
+    elapsed = (datetime.now() - start).total_seconds()
+    observe("lakefs.sync_upload", elapsed)
+    inc("bytes_uploaded", summary["bytes"], collection="sync")
+    logger.info(
+        f"LakeFS sync: uploaded {len(changed)} files ({summary['bytes'] / 1e6:.1f} MB) "
+        f"and deleted {summary['deleted']} in {elapsed:.1f}s"
+    )
+
+    if commit:
+        message = message or f"sync {len(changed)} changed, {summary['deleted']} deleted files"
+        ref = staging.commit(message=message, metadata={"uploaded": str(len(changed)), "deleted": str(summary["deleted"])})
+        staging.merge_into(repository.branch(branch))
+        summary["commit"] = ref.get_commit().id
+        logger.info(f"LakeFS sync: committed {summary['commit']} and merged {staging_branch} into {branch}")
+
+    save_manifest(current)
+    return summary
@@ -0,0 +1,85 @@
+'''
+Content-addressed on-disk cache of LLM responses.
+
+A batch's response is stored under a key made of the model name, the prompt
+version (a digest of the instruction and prompt template) and the sorted
+hashes of the tweets in the batch. Re-running a tag after a lost hash file
+or a crash therefore only pays for batches that never completed. The cache
+is a single SQLite file trimmed back to ``max_bytes`` by least-recent use.
+'''
+
+from hashlib import sha256
+from pathlib import Path
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from paths import data_dir
+
+cache_path = data_dir / "cache" / "llm.sqlite"
+
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_MB", 256)) * 1024 * 1024
+
+
+def prompt_version(*parts: str) -> str:
+    """Short digest identifying the exact prompt text in use."""
+    return sha256("\x1f".join(parts).encode()).hexdigest()[:12]
+
+
+class ResponseCache:
+    def __init__(self, path: Path = cache_path, max_bytes: int = LLM_CACHE_MAX_BYTES):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+        self._conn.commit()
+
+    @staticmethod
+    def key(model: str, version: str, tweet_hashes) -> str:
+        payload = "\n".join([model, version] + sorted(str(h) for h in tweet_hashes))
+        return sha256(payload.encode()).hexdigest()
+
+    def get(self, key: str):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            with self._conn:
+                self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+        return json.loads(row[0])
+
+    def put(self, key: str, value):
+        data = json.dumps(value, ensure_ascii=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, last_access) VALUES (?, ?, ?, ?)",
+                (key, data, len(data.encode()), time.time()),
+            )
+            self._evict()
+
+    def _evict(self):
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # drop least recently used entries until back under the limit
+        excess = total - self.max_bytes
+        freed = 0
+        doomed = []
+        for key, size in self._conn.execute("SELECT key, size FROM responses ORDER BY last_access"):
+            doomed.append((key,))
+            freed += size
+            if freed >= excess:
+                break
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", doomed)
+
+    def close(self):
+        self._conn.close()
@@ -0,0 +1,110 @@
+'''
+Concurrent LLM calls under requests-per-minute / tokens-per-minute limits.
+
+``run_batches`` fans a list of batches out over a thread pool and returns
+the results in batch order, so whatever is merged from them afterwards does
+not depend on which call happened to finish first. Every call goes through
+a shared ``RateLimiter`` and is retried with exponential backoff when the
+API answers 429 or 5xx.
+'''
+
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+import logging
+import os
+import random
+import re
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+GEMINI_RPM = int(os.getenv("GEMINI_RPM", 15))
+GEMINI_TPM = int(os.getenv("GEMINI_TPM", 1_000_000))
+EXTRACT_WORKERS = int(os.getenv("EXTRACT_WORKERS", 4))
+MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", 5))
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+THAI_CHAR = re.compile("[\u0e00-\u0e7f]")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Rough token count without a tokenizer: Thai script runs at about two
+    characters per token, Latin text at about four.
+    """
+    thai = len(THAI_CHAR.findall(text))
+    return thai // 2 + (len(text) - thai) // 4 + 1
+
+
+class RateLimiter:
+    """
+    Thread-safe sliding one-minute window over requests and tokens.
+
+    ``acquire`` blocks until one more request of ``tokens`` tokens fits
+    under both limits.
+    """
+
+    def __init__(self, rpm: int = GEMINI_RPM, tpm: int = GEMINI_TPM, clock=time.monotonic, sleep=time.sleep):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.clock = clock
+        self.sleep = sleep
+        self._lock = threading.Lock()
+        self._calls = deque()  # (timestamp, tokens)
+        self._tokens = 0
+
+    def _expire(self, now: float):
+        while self._calls and now - self._calls[0][0] >= 60:
+            _, tokens = self._calls.popleft()
+            self._tokens -= tokens
+
+    def acquire(self, tokens: int = 0):
+        # a single request larger than the whole budget would wait forever
+        tokens = min(tokens, self.tpm)
+        while True:
+            with self._lock:
+                now = self.clock()
+                self._expire(now)
+                if len(self._calls) < self.rpm and self._tokens + tokens <= self.tpm:
+                    self._calls.append((now, tokens))
+                    self._tokens += tokens
+                    return
+                wait = 60 - (now - self._calls[0][0])
+            self.sleep(max(wait, 0.01))
+
+
+def status_code(exc: Exception):
+    """HTTP status of an API error, for google-genai and similar clients."""
+    for attr in ("code", "status_code"):
+        code = getattr(exc, attr, None)
+        if isinstance(code, int):
+            return code
+    return None
+
+
+def call_with_backoff(fn, *args, max_retries: int = MAX_RETRIES, base_delay: float = 2.0, max_delay: float = 60.0,
+                      sleep=time.sleep, **kwargs):
+    """Call ``fn``, retrying 429/5xx errors with jittered exponential backoff."""
+    for attempt in range(max_retries + 1):
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            if status_code(e) not in RETRYABLE_STATUS or attempt == max_retries:
+                raise
+            delay = min(max_delay, base_delay * 2 ** attempt) * random.uniform(0.5, 1.0)
+            logger.warning(f"LLM call failed with {status_code(e)}, retry {attempt + 1}/{max_retries} in {delay:.1f}s")
+            sleep(delay)
+
+
+def run_batches(batches: list, fn, max_workers: int = EXTRACT_WORKERS) -> list:
+    """
+    Run ``fn(batch)`` for every batch on up to ``max_workers`` threads and
+    return the results in the order of ``batches``.
+    """
+    if max_workers <= 1 or len(batches) <= 1:
+        return [fn(batch) for batch in batches]
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        return list(pool.map(fn, batches))
@@ -0,0 +1,25 @@
+'''
+Where the pipeline keeps its data and config.
+
+Every module takes ``data_dir`` from here, so the scraper, the store, the
+extraction and the LakeFS sync all read and write one tree: ``data/`` in
+the working directory when there is one (tests and benchmarks run from a
+scratch directory that has it), the repository's ``data/`` otherwise.
+``config/`` is resolved the same way.
+'''
+
+from pathlib import Path
+
+file_dir = Path(__file__).resolve().parent
+root_dir = file_dir / ".."
+
+
+def resolve_dir(name: str) -> Path:
+    """``name/`` in the working directory if it exists, else the repository's."""
+    if Path(name).exists():
+        return Path(name)
+    return root_dir / name
+
+
+data_dir = resolve_dir("data")
+config_dir = resolve_dir("config")
@@ -0,0 +1,371 @@
+'''
+Cheap local pre-filter in front of topic extraction.
+
+The instruction tells Gemini to skip tweets that are not questions or
+problems, but every tweet sent is still billed. ``prefilter`` decides per
+tweet, before batching, whether it is worth sending:
+
+- retweets ("RT @user: ...") are dropped;
+- obvious non-questions are dropped: tweets shorter than
+  ``PREFILTER_SHORT_CHARS`` letters once links, mentions and hashtags are
+  removed, and without any Thai or English question/problem marker
+  ("ไหม", "ยังไง", "ช่วย", "?", "how", "can't", ...);
+- near-duplicates are dropped: of the tweets whose letters and digits are
+  the same once links, mentions, hashtags, punctuation and spacing are
+  removed, only the oldest in the run is kept. Digits stay in the key, so
+  "ข้อ 20" and "ข้อ 21" or two course codes are different questions, and
+  keys shorter than ``PREFILTER_DUPLICATE_MIN_CHARS`` (emoji-, link- or
+  "?"-only tweets) are never treated as copies of each other;
+- once a model has been trained, the rest are scored by a logistic
+  regression over hashed character 2-4-grams (with the markers as extra
+  features) and dropped below its threshold.
+
+The model learns from already-labelled output: a tweet the extraction
+processed is positive when its text came back as an FAQ and negative
+otherwise. The threshold is not set by hand; training picks the highest
+one that still keeps ``PREFILTER_RECALL`` of the FAQ tweets that pass the
+rules in a held-out fold. ``python prefilter.py train`` writes
+``data/prefilter/model.npz``; ``benchmarks/eval_prefilter.py`` measures the
+prompt tokens saved against the FAQs lost.
+
+Dropped tweets are marked processed like the others. Their digests are
+also kept apart so that training never learns from tweets Gemini did not
+see.
+'''
+
+from pathlib import Path
+import argparse
+import logging
+import math
+import os
+import re
+import sys
+import unicodedata
+
+import numpy as np
+import pandas as pd
+
+file_dir = Path(__file__).resolve().parent
+sys.path.append(str(file_dir))
+
+from batching import format_message
+from llm_engine import estimate_tokens
+from run_metrics import inc
+
+logger = logging.getLogger(__name__)
+
+from paths import data_dir
+
+model_path = data_dir / "prefilter" / "model.npz"
+
+PREFILTER_ENABLED = os.getenv("PREFILTER_ENABLED", "1").lower() not in ("0", "false", "no", "off")
+# share of FAQ tweets the trained threshold has to keep
+PREFILTER_RECALL = float(os.getenv("PREFILTER_RECALL", 0.98))
+# overrides the trained threshold when set
+PREFILTER_THRESHOLD = os.getenv("PREFILTER_THRESHOLD")
+PREFILTER_SHORT_CHARS = int(os.getenv("PREFILTER_SHORT_CHARS", 15))
+# near-duplicate keys shorter than this say too little to call two tweets copies
+PREFILTER_DUPLICATE_MIN_CHARS = int(os.getenv("PREFILTER_DUPLICATE_MIN_CHARS", 8))
+
+NGRAMS = (2, 3, 4)
+FEATURE_BITS = 18
+HASH_KEY = "dsi321-prefilter"
+# tweets whose digest falls in fold 0 of 5 are held out of training
+HOLDOUT_FOLDS = 5
+
+_URL = re.compile(r"https?://\S+|www\.\S+|pic\.x\.com/\S+|\S+\.(?:com|co|ly)/\S*")
+_MENTION = re.compile(r"@\w+")
+_HASHTAG = re.compile(r"#\S+")
+_ZERO_WIDTH = re.compile("[\u200b\u200c\u200d\u2060\ufeff]")
+_SPACES = re.compile(r"\s+")
+# Thai consonants, vowels and tone marks; no digits or punctuation
+_NOT_LETTER = re.compile("[^a-z\u0e01-\u0e3a\u0e40-\u0e4e]")
+# the same plus Arabic and Thai digits
+_NOT_KEY_CHAR = re.compile("[^a-z0-9\u0e01-\u0e3a\u0e40-\u0e4e\u0e50-\u0e59]")
+_RETWEET = re.compile(r"^\s*RT @\w+")
+
+# Thai has no word breaks, its markers are matched anywhere in the text
+THAI_QUESTION = [
+    "ไหม", "มั้ย", "มั๊ย", "ไม๊", "หรอ", "เหรอ", "หรือเปล่า", "รึเปล่า", "ป่าว", "ป่ะ", "หรือไม่", "หรือยัง",
+    "ยังไง", "ยังงัย", "อย่างไร", "ทำไม", "อะไร", "ที่ไหน", "ตรงไหน", "เมื่อไหร่", "เมื่อไร", "กี่", "ใคร", "บ้าง",
+    "สอบถาม", "ขอถาม", "ถามหน่อย",
+]
+THAI_PROBLEM = ["ช่วย", "รบกวน", "ปัญหา", "ไม่ได้", "ล่ม", "ไม่ผ่าน", "พัง", "ติดต่อ", "ร้องเรียน"]
+ENGLISH_QUESTION = [
+    "how", "what", "when", "where", "why", "which", "who", "whom", "anyone", "anybody", "is there", "are there",
+    "can i", "can we", "should i",
+]
+ENGLISH_PROBLEM = [
+    "help", "problem", "issue", "error", "cannot", "can't", "cant", "unable", "not working", "broken", "refund",
+    "complain",
+]
+
+
+def _markers(thai: list, english: list):
+    words = "|".join(re.escape(word) for word in english)
+    return re.compile("|".join(re.escape(word) for word in thai) + rf"|\b(?:{words})\b")
+
+
+QUESTION_MARKER = re.compile(_markers(THAI_QUESTION, ENGLISH_QUESTION).pattern + r"|[?？]")
+PROBLEM_MARKER = _markers(THAI_PROBLEM, ENGLISH_PROBLEM)
+
+
+def normalize_text(text: str) -> str:
+    """``text`` without links, mentions, hashtags and zero-width characters, case and spacing folded."""
+    text = unicodedata.normalize("NFC", str(text)).casefold()
+    text = _ZERO_WIDTH.sub("", text)
+    text = _HASHTAG.sub(" ", _MENTION.sub(" ", _URL.sub(" ", text)))
+    return _SPACES.sub(" ", text).strip()
+
+
+def _letters(normalized: str) -> str:
+    return _NOT_LETTER.sub("", normalized)
+
+
+def _key_chars(normalized: str) -> str:
+    return _NOT_KEY_CHAR.sub("", normalized)
+
+
+def near_duplicate_key(text: str) -> str:
+    """Only the Thai and Latin letters and the digits of the normalized text; copies that differ in anything else match."""
+    return _key_chars(normalize_text(text))
+
+
+def is_retweet(text: str) -> bool:
+    return bool(_RETWEET.match(str(text)))
+
+
+def marker_features(text: str) -> list:
+    """Rule outcomes of a normalized text, as pseudo n-grams for the model."""
+    features = []
+    if QUESTION_MARKER.search(text):
+        features.append("\x00question")
+    if PROBLEM_MARKER.search(text):
+        features.append("\x00problem")
+    features.append(f"\x00len{min(len(text) // 20, 10)}")
+    return features
+
+
+def has_marker(text: str) -> bool:
+    return bool(QUESTION_MARKER.search(text) or PROBLEM_MARKER.search(text))
+
+
+def featurize(texts, bits: int = FEATURE_BITS):
+    """
+    Hashed character n-gram features of raw tweet texts as sparse
+    coordinates ``(rows, cols, values)``; each row is scaled to unit norm.
+    """
+    rows, grams = [], []
+    for row, text in enumerate(texts):
+        text = normalize_text(text)
+        padded = f" {text} "
+        doc = {padded[i:i + n] for n in NGRAMS for i in range(len(padded) - n + 1)}
+        doc.update(marker_features(text))
+        rows.extend([row] * len(doc))
+        grams.extend(doc)
+    rows = np.asarray(rows, dtype=np.int64)
+    cols = pd.util.hash_array(np.asarray(grams, dtype=object), hash_key=HASH_KEY) % np.uint64(1 << bits)
+    lengths = np.bincount(rows, minlength=len(texts)) if len(rows) else np.zeros(len(texts))
+    values = 1 / np.sqrt(lengths[rows])
+    return rows, cols.astype(np.int64), values
+
+
+def in_holdout(hashes) -> np.ndarray:
+    """Mask of tweets (by their uint64 digest) that belong to the held-out fold."""
+    return np.asarray(hashes, dtype=np.uint64) % np.uint64(HOLDOUT_FOLDS) == 0
+
+
+class PrefilterModel:
+    """Logistic regression over ``featurize`` output."""
+
+    def __init__(self, weights: np.ndarray, bias: float, threshold: float = 0.5, recall: float = None,
+                 bits: int = FEATURE_BITS):
+        self.weights = weights
+        self.bias = bias
+        self.threshold = threshold
+        self.recall = recall
+        self.bits = bits
+
+    @classmethod
+    def fit(cls, texts, labels, bits: int = FEATURE_BITS, epochs: int = 300, learning_rate: float = 0.1,
+            l2: float = 1e-5) -> "PrefilterModel":
+        """
+        Full-batch Adam on the log loss, with the classes weighted to equal
+        total weight so rare FAQ tweets are not drowned out.
+        """
+        labels = np.asarray(labels, dtype=float)
+        rows, cols, values = featurize(texts, bits)
+        n, dims = len(labels), 1 << bits
+        positives = max(labels.sum(), 1)
+        sample_weight = np.where(labels == 1, n / (2 * positives), n / (2 * max(n - positives, 1))) / n
+
+        params = np.zeros(dims + 1)
+        moment, velocity = np.zeros(dims + 1), np.zeros(dims + 1)
+        for step in range(1, epochs + 1):
+            logits = np.bincount(rows, weights=params[cols] * values, minlength=n) + params[-1]
+            error = (_sigmoid(logits) - labels) * sample_weight
+            grad = np.empty(dims + 1)
+            grad[:-1] = np.bincount(cols, weights=error[rows] * values, minlength=dims) + l2 * params[:-1]
+            grad[-1] = error.sum()
+            moment = 0.9 * moment + 0.1 * grad
+            velocity = 0.999 * velocity + 0.001 * grad ** 2
+            params -= learning_rate * (moment / (1 - 0.9 ** step)) / (np.sqrt(velocity / (1 - 0.999 ** step)) + 1e-8)
+        return cls(params[:-1], float(params[-1]), bits=bits)
+
+    def scores(self, texts) -> np.ndarray:
+        """Probability per text that it is an FAQ tweet."""
+        rows, cols, values = featurize(texts, self.bits)
+        logits = np.bincount(rows, weights=self.weights[cols] * values, minlength=len(texts)) + self.bias
+        return _sigmoid(logits)
+
+    def save(self, path: Path = model_path):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(path.stem + ".tmp.npz")
+        np.savez_compressed(
+            tmp_path, weights=self.weights.astype(np.float32), bias=self.bias, threshold=self.threshold,
+            recall=np.nan if self.recall is None else self.recall, bits=self.bits,
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: Path = model_path) -> "PrefilterModel":
+        with np.load(path) as saved:
+            recall = float(saved["recall"])
+            return cls(saved["weights"].astype(float), float(saved["bias"]), float(saved["threshold"]),
+                       None if math.isnan(recall) else recall, int(saved["bits"]))
+
+
+def _sigmoid(x: np.ndarray) -> np.ndarray:
+    return 1 / (1 + np.exp(-np.clip(x, -30, 30)))
+
+
+_model = None
+_model_mtime = None
+
+
+def get_model():
+    """The trained model, reloaded when the file changes; None when there is none."""
+    global _model, _model_mtime
+    if not model_path.exists():
+        return None
+    mtime = model_path.stat().st_mtime
+    if mtime != _model_mtime:
+        _model, _model_mtime = PrefilterModel.load(model_path), mtime
+        logger.info(f"Loaded pre-filter model (threshold {_model.threshold:.3f}, recall target {_model.recall})")
+    return _model
+
+
+def rule_reasons(tweets_df: pd.DataFrame) -> pd.Series:
+    """
+    Drop reason per tweet from the rules alone ("retweet", "short" or
+    "duplicate"), "" for tweets they keep. ``tweets_df`` must be in
+    posting order, the first copy of a near-duplicate is the one kept.
+    """
+    texts = tweets_df["tweetText"].astype(str)
+    normalized = texts.map(normalize_text)
+    reasons = pd.Series("", index=tweets_df.index, dtype=object)
+    reasons[texts.map(is_retweet)] = "retweet"
+
+    keys = normalized.map(_letters)
+    short = (keys.str.len() < PREFILTER_SHORT_CHARS) & ~normalized.map(has_marker)
+    reasons[(reasons == "") & short] = "short"
+
+    duplicate_keys = normalized.map(_key_chars)
+    candidates = duplicate_keys[(reasons == "") & (duplicate_keys.str.len() >= PREFILTER_DUPLICATE_MIN_CHARS)]
+    duplicate = candidates.duplicated()
+    reasons[duplicate[duplicate].index] = "duplicate"
+    return reasons
+
+
+def prefilter(tweets_df: pd.DataFrame, model: PrefilterModel = None, threshold: float = None) -> pd.Series:
+    """
+    Drop reason per tweet of ``tweets_df`` ("retweet", "short", "duplicate"
+    or "model"), "" for the tweets to send. The model is the trained one
+    unless given; ``threshold`` defaults to ``PREFILTER_THRESHOLD`` and
+    then to the model's own.
+    """
+    if not PREFILTER_ENABLED or tweets_df.empty:
+        return pd.Series("", index=tweets_df.index, dtype=object)
+    reasons = rule_reasons(tweets_df)
+
+    model = model or get_model()
+    if model is not None:
+        if threshold is None:
+            threshold = float(PREFILTER_THRESHOLD) if PREFILTER_THRESHOLD else model.threshold
+        candidates = reasons[reasons == ""].index
+        if len(candidates):
+            scores = model.scores(tweets_df.loc[candidates, "tweetText"].astype(str).tolist())
+            reasons[candidates[scores < threshold]] = "model"
+
+    dropped = reasons != ""
+    counts = {reason: int(count) for reason, count in reasons[dropped].value_counts().items()}
+    for reason, count in counts.items():
+        inc("prefilter_tweets", count, result=reason)
+    inc("prefilter_tweets", int((~dropped).sum()), result="kept")
+    saved_tokens = sum(estimate_tokens(format_message({"index": 0, "tweetText": text}))
+                       for text in tweets_df.loc[dropped, "tweetText"])
+    inc("prefilter_tokens_saved", saved_tokens)
+    logger.info(
+        f"Pre-filter: sending {int((~dropped).sum())} of {len(tweets_df)} tweets, dropped "
+        f"{counts}, about {saved_tokens} prompt tokens saved"
+    )
+    return reasons
+
+
+def calibrate_threshold(scores: np.ndarray, labels: np.ndarray, recall: float) -> float:
+    """The highest threshold that keeps at least ``recall`` of the positive examples."""
+    positive_scores = np.sort(np.asarray(scores)[np.asarray(labels, dtype=bool)])[::-1]
+    if not len(positive_scores):
+        raise ValueError("no FAQ tweets to calibrate the threshold on")
+    return float(positive_scores[math.ceil(recall * len(positive_scores)) - 1])
+
+
+def train(labelled: pd.DataFrame, recall: float = PREFILTER_RECALL, **fit_args) -> PrefilterModel:
+    """
+    Fit a model on ``labelled`` (tweetText, hash, isFaq, in posting order)
+    outside the held-out fold and calibrate its threshold on that fold.
+    """
+    holdout = in_holdout(labelled["hash"].to_numpy())
+    fit_df, holdout_df = labelled[~holdout], labelled[holdout]
+    if fit_df["isFaq"].nunique() < 2:
+        raise ValueError("training needs both FAQ and non-FAQ tweets")
+    model = PrefilterModel.fit(fit_df["tweetText"].astype(str).tolist(), fit_df["isFaq"], **fit_args)
+
+    # the model only ever sees what the rules let through
+    candidates = holdout_df[(rule_reasons(holdout_df) == "").to_numpy()]
+    scores = model.scores(candidates["tweetText"].astype(str).tolist())
+    labels = candidates["isFaq"].to_numpy(dtype=bool)
+    model.threshold = calibrate_threshold(scores, labels, recall)
+    model.recall = recall
+
+    kept = scores >= model.threshold
+    logger.info(
+        f"Trained on {len(fit_df)} tweets ({int(fit_df['isFaq'].sum())} FAQ); of {len(candidates)} held-out "
+        f"tweets past the rules, threshold {model.threshold:.3f} keeps {int((kept & labels).sum())} of "
+        f"{int(labels.sum())} FAQ tweets and drops {int((~kept).sum())}"
+    )
+    return model
+
+
+def load_labelled(tags: list) -> pd.DataFrame:
+    from extraction import labelled_tweets
+
+    frames = [labelled_tweets(tag) for tag in tags]
+    frames = [frame for frame in frames if not frame.empty]
+    if not frames:
+        raise ValueError(f"no processed tweets for tags {tags}")
+    return pd.concat(frames, ignore_index=True)
+
+
+if __name__ == "__main__":
+    from scheduler import load_tags
+
+    parser = argparse.ArgumentParser(description="Train the extraction pre-filter on labelled FAQ output.")
+    parser.add_argument("command", choices=["train"])
+    parser.add_argument("tags", nargs="*", help="defaults to the tags in config/tags.json")
+    parser.add_argument("--recall", type=float, default=PREFILTER_RECALL, help="share of FAQ tweets to keep")
+    args = parser.parse_args()
+    model = train(load_labelled(args.tags or load_tags()), recall=args.recall)
+    model.save()
+    print(f"Wrote {model_path} (threshold {model.threshold:.3f} for recall {model.recall})")
@@ -13,21 +13,18 @@ import sys
 file_dir = Path(__file__).resolve().parent
 sys.path.append(str(file_dir))
 
-if Path('data/').exists():
-    data_dir = Path('data/')
-else:
-    data_dir = file_dir / ".." / "data"
+from paths import data_dir
     
     
 
 import os
 
 # LakeFS settings
-lakefs_endpoint = "http://lakefsdb:8000" 
-access_key = "access_key" 
-secret_key = "secret_key"
-repo = "social-listening"
-branch = "main"
+lakefs_endpoint = os.getenv("LAKEFS_ENDPOINT", "http://lakefsdb:8000")
+access_key = os.getenv("LAKEFS_ACCESS_KEY", "access_key")
+secret_key = os.getenv("LAKEFS_SECRET_KEY", "secret_key")
+repo = os.getenv("LAKEFS_REPO", "social-listening")
+branch = os.getenv("LAKEFS_BRANCH", "main")
 
 local_dir = data_dir
 
@@ -39,55 +36,126 @@ storage_options = {
     }
 }
 import pandas as pd 
+import s3fs
+import threading
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from run_metrics import inc, observe
+
+logger = logging.getLogger(__name__)
+
+S3_MAX_POOL_CONNECTIONS = int(os.getenv("S3_MAX_POOL_CONNECTIONS", 32))
+S3_MAX_CONCURRENCY = int(os.getenv("S3_MAX_CONCURRENCY", 8))
+LOAD_WORKERS = int(os.getenv("LAKEFS_LOAD_WORKERS", 4))
+
+_fs = None
+_fs_lock = threading.Lock()
+
+def get_fs():
+    """
+    Module-wide S3 filesystem for LakeFS, created once so every write reuses
+    the same keep-alive connection pool instead of building a new client.
+    """
+    global _fs
+    with _fs_lock:
+        if _fs is None:
+            _fs = s3fs.S3FileSystem(
+                **storage_options,
+                config_kwargs={
+                    "max_pool_connections": S3_MAX_POOL_CONNECTIONS,
+                    "tcp_keepalive": True,
+                },
+                max_concurrency=S3_MAX_CONCURRENCY,
+            )
+        return _fs
+
+def set_fs(fs):
+    """Use ``fs`` instead of the LakeFS S3 client, e.g. a moto-backed or local filesystem."""
+    global _fs
+    with _fs_lock:
+        _fs = fs
 
 def to_lakefs(df, collection):
     """
     Save DataFrame to LakeFS S3 with partitioning.
+    Returns the number of objects and bytes written.
     """
-    lakefs_s3_tweets_path = f"s3://{repo}/{branch}/{collection}/"
+    lakefs_s3_tweets_path = f"{repo}/{branch}/{collection}/"
+    written = []
     df.to_parquet(
         lakefs_s3_tweets_path,
-        storage_options=storage_options,
+        filesystem=get_fs(),
         engine="pyarrow",
         existing_data_behavior="delete_matching",
         partition_cols=["tag", "postYear", "postMonth", "postDay"],
+        file_visitor=written.append,
     )
+    total_bytes = sum(f.size or 0 for f in written)
+    inc("bytes_uploaded", total_bytes, collection=collection)
+    return {"objects": len(written), "bytes": total_bytes}
     
 def to_tweets(df):
     """
     Save DataFrame to local tweets directory with partitioning.
     """    
-    to_lakefs(df, "tweets")
+    return to_lakefs(df, "tweets")
+
+def read_tag_dir(path) -> pd.DataFrame:
+    """All rows under one ``tag=`` directory, with ``tag`` from the directory name (the files do not hold it)."""
+    df = pd.read_parquet(path)
+    df["tag"] = Path(path).name.split("=", 1)[-1]
+    return df
+
+def _load_dirs(paths, to_collection):
+    """Upload every path in ``paths`` through ``to_collection`` on a bounded worker pool."""
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=LOAD_WORKERS) as pool:
+        stats = list(pool.map(lambda p: to_collection(read_tag_dir(p)), paths))
+    elapsed = time.perf_counter() - start
+    observe("lakefs.load", elapsed)
+    objects = sum(s["objects"] for s in stats)
+    total_bytes = sum(s["bytes"] for s in stats)
+    logger.info(
+        f"Uploaded {len(paths)} tag directories: {objects} objects, {total_bytes / 1e6:.1f} MB "
+        f"in {elapsed:.1f}s ({total_bytes / 1e6 / max(elapsed, 1e-9):.1f} MB/s)"
+    )
+    return {"objects": objects, "bytes": total_bytes, "seconds": elapsed}
     
-def load_tweets():
+def load_tweets(bulk: bool = False):
     """
     Load tweets from the local directory and save to LakeFS.
+    ``bulk`` hands over to the resumable, byte-copying ``backfill``.
     """
+    if bulk:
+        from backfill import backfill
+        return backfill("tweets")
     tweets_dir = data_dir / "tweets"
     all_tag_dirs = os.listdir(tweets_dir)
     all_tag_dirs = [os.path.join(tweets_dir, tag) for tag in all_tag_dirs]
     
-    for tag_dir in all_tag_dirs:
-        tag_df = pd.read_parquet(tag_dir)
-        to_tweets(tag_df)
+    return _load_dirs(all_tag_dirs, to_tweets)
         
 def to_faqs(df):
     """
     Save DataFrame to LakeFS S3 with partitioning for FAQs.
     """
-    to_lakefs(df, "faq")
+    return to_lakefs(df, "faq")
     
-def load_faqs():
+def load_faqs(bulk: bool = False):
     """
     Load FAQs from the local directory and save to LakeFS.
+    ``bulk`` hands over to the resumable, byte-copying ``backfill``.
     """
+    if bulk:
+        from backfill import backfill
+        return backfill("faq")
     faqs_dir = data_dir / "faq"
     all_faqs_files = os.listdir(faqs_dir)
     all_faqs_files = [os.path.join(faqs_dir, faq) for faq in all_faqs_files]
     
-    for faq_file in all_faqs_files:
-        faq_df = pd.read_parquet(faq_file)
-        to_faqs(faq_df)    
+    return _load_dirs(all_faqs_files, to_faqs)
 
 
 # if __name__ == "__main__":
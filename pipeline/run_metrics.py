@@ -0,0 +1,295 @@
+'''
+Stage timers and counters for one pipeline run.
+
+``span("extract.llm_call")`` times a block (sync or async), ``timed`` does
+the same for every call of a function, ``observe`` records a duration
+measured by hand, ``inc("rows_written", n, collection="faq")`` adds to a
+counter and ``gauge`` sets a current value such as a queue depth. Stage
+timings keep their most recent ``METRICS_SAMPLES`` durations, from which
+the median and tail quantiles are reported. Everything is kept in process
+memory; a flow calls ``reset`` when it starts and ``export`` when it ends,
+which writes the numbers as ``data/metrics/<flow>.prom`` in the Prometheus
+text format (for node_exporter's textfile collector) and publishes them as
+a Prefect table artifact.
+
+With ``PIPELINE_METRICS=0`` ``span`` returns a shared no-op object, ``timed``
+returns the function unchanged and ``inc``/``observe`` return on their first
+line, so the instrumented code pays next to nothing.
+'''
+
+from collections import defaultdict, deque
+from pathlib import Path
+import functools
+import inspect
+import logging
+import math
+import os
+import threading
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+from paths import data_dir
+
+METRICS_ENABLED = os.getenv("PIPELINE_METRICS", "1").lower() not in ("0", "false", "no", "off")
+METRICS_DIR = Path(os.getenv("PIPELINE_METRICS_DIR", data_dir / "metrics"))
+METRICS_SAMPLES = int(os.getenv("PIPELINE_METRICS_SAMPLES", 1024))
+METRIC_PREFIX = "pipeline"
+QUANTILES = (0.5, 0.9, 0.99)
+
+_lock = threading.Lock()
+_counters = defaultdict(float)  # (name, labels) -> value
+_gauges = {}                     # (name, labels) -> value
+_stages = {}                     # (stage, labels) -> [count, total seconds, max seconds]
+_samples = {}                    # (stage, labels) -> most recent durations
+
+
+def _key(name: str, labels: dict) -> tuple:
+    return name, tuple(sorted(labels.items()))
+
+
+def inc(name: str, value: float = 1, **labels):
+    """Add ``value`` to the counter ``name`` with ``labels``."""
+    if not METRICS_ENABLED or not value:
+        return
+    with _lock:
+        _counters[_key(name, labels)] += value
+
+
+def gauge(name: str, value: float, **labels):
+    """Set the gauge ``name`` with ``labels`` to ``value``."""
+    if not METRICS_ENABLED:
+        return
+    with _lock:
+        _gauges[_key(name, labels)] = value
+
+
+def observe(stage: str, seconds: float, **labels):
+    """Record one run of ``stage`` that took ``seconds``."""
+    if not METRICS_ENABLED:
+        return
+    with _lock:
+        key = _key(stage, labels)
+        stats = _stages.setdefault(key, [0, 0.0, 0.0])
+        stats[0] += 1
+        stats[1] += seconds
+        stats[2] = max(stats[2], seconds)
+        _samples.setdefault(key, deque(maxlen=METRICS_SAMPLES)).append(seconds)
+
+
+def observe_many(stage: str, seconds, **labels):
+    """Record one run of ``stage`` per value in ``seconds``, e.g. a latency per tweet."""
+    if not METRICS_ENABLED:
+        return
+    seconds = np.asarray(seconds, dtype=float)
+    seconds = seconds[~np.isnan(seconds)]
+    if not len(seconds):
+        return
+    with _lock:
+        key = _key(stage, labels)
+        stats = _stages.setdefault(key, [0, 0.0, 0.0])
+        stats[0] += len(seconds)
+        stats[1] += float(seconds.sum())
+        stats[2] = max(stats[2], float(seconds.max()))
+        _samples.setdefault(key, deque(maxlen=METRICS_SAMPLES)).extend(seconds[-METRICS_SAMPLES:].tolist())
+
+
+def _quantiles(samples) -> dict:
+    values = np.quantile(np.asarray(samples), QUANTILES)
+    return dict(zip(QUANTILES, values.tolist()))
+
+
+class _Span:
+    __slots__ = ("stage", "labels", "start")
+
+    def __init__(self, stage: str, labels: dict):
+        self.stage = stage
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe(self.stage, time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+class _NoSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+def span(stage: str, **labels):
+    """Context manager timing the block it wraps as ``stage``."""
+    if not METRICS_ENABLED:
+        return _NO_SPAN
+    return _Span(stage, labels)
+
+
+def timed(stage: str):
+    """Decorator timing every call of a function or coroutine function as ``stage``."""
+    def decorate(fn):
+        if not METRICS_ENABLED:
+            return fn
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with _Span(stage, {}):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with _Span(stage, {}):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _gauges.clear()
+        _stages.clear()
+        _samples.clear()
+
+
+def snapshot() -> dict:
+    """Current counters and stage timings as plain rows."""
+    with _lock:
+        counters = [{"name": name, **dict(labels), "value": value} for (name, labels), value in sorted(_counters.items())]
+        gauges = [{"name": name, **dict(labels), "value": value} for (name, labels), value in sorted(_gauges.items())]
+        stages = []
+        for (stage, labels), (count, total, peak) in sorted(_stages.items()):
+            quantiles = _quantiles(_samples[(stage, labels)])
+            stages.append({
+                "stage": stage, **dict(labels), "count": count, "seconds": round(total, 4),
+                "p50_seconds": round(quantiles[0.5], 4), "p99_seconds": round(quantiles[0.99], 4),
+                "max_seconds": round(peak, 4),
+            })
+    return {"counters": counters, "gauges": gauges, "stages": stages}
+
+
+def _format_labels(labels) -> str:
+    if not labels:
+        return ""
+    escaped = (
+        f'{k}="' + str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+        for k, v in labels
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+def _format_value(value) -> str:
+    """A sample value without rounding: whole numbers as integers, others at full precision."""
+    value = float(value)
+    if math.isnan(value):
+        return "NaN"
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def to_prometheus(extra_labels: dict = None) -> str:
+    """The metrics in the Prometheus text exposition format, every series carrying ``extra_labels``."""
+    extra = tuple(sorted((extra_labels or {}).items()))
+    with _lock:
+        counters = [((name, extra + labels), value) for (name, labels), value in sorted(_counters.items())]
+        gauges = [((name, extra + labels), value) for (name, labels), value in sorted(_gauges.items())]
+        stages = [((stage, extra + labels), stats, _quantiles(_samples[(stage, labels)]))
+                  for (stage, labels), stats in sorted(_stages.items())]
+
+    lines = []
+    for values, kind, suffix in ((counters, "counter", "_total"), (gauges, "gauge", "")):
+        by_name = defaultdict(list)
+        for (name, labels), value in values:
+            by_name[name].append((labels, value))
+        for name, series in by_name.items():
+            metric = f"{METRIC_PREFIX}_{name}{suffix}"
+            lines.append(f"# TYPE {metric} {kind}")
+            lines += [f"{metric}{_format_labels(labels)} {_format_value(value)}" for labels, value in series]
+
+    if stages:
+        metric = f"{METRIC_PREFIX}_stage_seconds"
+        lines.append(f"# TYPE {metric} summary")
+        for (stage, labels), (count, total, _), quantiles in stages:
+            for quantile, value in quantiles.items():
+                lines.append(f"{metric}{_format_labels((('stage', stage),) + labels + (('quantile', quantile),))} {value:.6f}")
+            label_text = _format_labels((("stage", stage),) + labels)
+            lines.append(f"{metric}_sum{label_text} {total:.6f}")
+            lines.append(f"{metric}_count{label_text} {count}")
+        lines.append(f"# TYPE {metric}_max gauge")
+        for (stage, labels), (_, _, peak), _ in stages:
+            lines.append(f"{metric}_max{_format_labels((('stage', stage),) + labels)} {peak:.6f}")
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus(path: Path, extra_labels: dict = None):
+    """Atomically write the metrics to ``path``, so a scraper never reads half a file."""
+    if not METRICS_ENABLED:
+        return None
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    tmp_path.write_text(to_prometheus(extra_labels), encoding="utf-8")
+    os.replace(tmp_path, path)
+    return path
+
+
+STAGE_FIELDS = ("stage", "count", "seconds", "p50_seconds", "p99_seconds", "max_seconds")
+
+
+def _label_text(row: dict, skip: tuple) -> str:
+    return ", ".join(f"{k}={v}" for k, v in row.items() if k not in skip)
+
+
+def publish_artifact(key: str, description: str = None):
+    """Publish the stage timings and counters as a Prefect table artifact."""
+    if not METRICS_ENABLED:
+        return None
+    values = snapshot()
+    rows = [
+        {"metric": f"stage {row['stage']}", "labels": _label_text(row, STAGE_FIELDS),
+         "count": row["count"], "value": row["seconds"], "p50": row["p50_seconds"], "p99": row["p99_seconds"],
+         "max": row["max_seconds"]}
+        for row in values["stages"]
+    ] + [
+        {"metric": row["name"], "labels": _label_text(row, ("name", "value")), "count": None, "value": row["value"],
+         "p50": None, "p99": None, "max": None}
+        for row in values["counters"] + values["gauges"]
+    ]
+    try:
+        from prefect.artifacts import create_table_artifact
+        return create_table_artifact(table=rows, key=key, description=description)
+    except Exception as e:
+        # metrics must never fail the run they describe
+        logger.warning(f"Could not publish metrics artifact {key}: {e}")
+        return None
+
+
+def export(flow: str, description: str = None):
+    """
+    Write ``<flow>.prom`` (series labelled ``flow``) and publish the
+    ``<flow>-metrics`` Prefect artifact for this run.
+    """
+    if not METRICS_ENABLED:
+        return
+    try:
+        path = write_prometheus(METRICS_DIR / f"{flow}.prom", {"flow": flow})
+        logger.info(f"Wrote run metrics to {path}")
+    except OSError as e:
+        logger.warning(f"Could not write metrics file: {e}")
+    publish_artifact(f"{flow}-metrics", description)
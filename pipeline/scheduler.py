@@ -0,0 +1,173 @@
+'''
+Per-tag scrape scheduling from observed tweet velocity.
+
+The tags to collect are listed in ``config/tags.json``::
+
+    {"tags": ["#DSI321", {"tag": "#old_tag", "enabled": false}]}
+
+After every scrape ``record_run`` turns the number of new tweets and the
+time since the tag's previous run into an arrival rate, folded into a
+moving average whose weight decays with a half-life of
+``SCHEDULE_HALF_LIFE_HOURS``. The next run is planned so that about
+``SCHEDULE_TARGET_TWEETS`` new tweets will be waiting, between
+``SCHEDULE_MIN_MINUTES`` and ``SCHEDULE_MAX_MINUTES`` from now, with a
+scroll cap sized for that many tweets. A run that hit its scroll cap only
+gives a lower bound on the rate, so the estimate never drops after one; a
+failed run is retried with a growing back-off.
+
+scrape_tag_flow runs every ``SCHEDULE_MIN_MINUTES`` and scrapes the tags
+``due_tags`` returns. The schedule is kept in ``data/state/schedule.json``;
+the flows of several workers update it, so ``record_run`` holds the same
+kind of file lock as ``tag_state.update_state`` while it does.
+'''
+
+from datetime import datetime, timedelta
+from pathlib import Path
+from uuid import uuid4
+import json
+import logging
+import math
+import os
+
+from paths import config_dir
+from tag_state import state_dir, clean_tag, file_lock, INITIAL_LOOKBACK
+from run_metrics import gauge
+
+logger = logging.getLogger(__name__)
+
+TAGS_FILE = Path(os.getenv("TAGS_FILE", config_dir / "tags.json"))
+schedule_path = state_dir / "schedule.json"
+
+SCHEDULE_MIN_MINUTES = float(os.getenv("SCHEDULE_MIN_MINUTES", 5))
+SCHEDULE_MAX_MINUTES = float(os.getenv("SCHEDULE_MAX_MINUTES", 240))
+SCHEDULE_TARGET_TWEETS = float(os.getenv("SCHEDULE_TARGET_TWEETS", 20))
+SCHEDULE_HALF_LIFE_HOURS = float(os.getenv("SCHEDULE_HALF_LIFE_HOURS", 6))
+# the same safety cap as update.MAX_INCREMENTAL_SCROLLS
+SCHEDULE_MAX_SCROLLS = int(os.getenv("MAX_INCREMENTAL_SCROLLS", 30))
+# new tweets one scroll of the search timeline loads, roughly
+TWEETS_PER_SCROLL = int(os.getenv("TWEETS_PER_SCROLL", 20))
+
+
+def load_tags(path: Path = TAGS_FILE) -> list:
+    """Enabled tags from the tags file, in file order."""
+    with open(path, "r", encoding="utf-8") as f:
+        entries = json.load(f)["tags"]
+    tags = []
+    for entry in entries:
+        if isinstance(entry, str):
+            entry = {"tag": entry}
+        if entry.get("enabled", True) and entry["tag"] not in tags:
+            tags.append(entry["tag"])
+    return tags
+
+
+def load_schedule() -> dict:
+    if not schedule_path.exists():
+        return {}
+    with open(schedule_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_schedule(schedule: dict):
+    schedule_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = schedule_path.with_suffix(f".json.{uuid4().hex}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(schedule, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, schedule_path)
+
+
+def scroll_cap(expected_tweets: float) -> int:
+    """Scrolls needed for ``expected_tweets``, with headroom for a burst."""
+    return min(SCHEDULE_MAX_SCROLLS, max(1, math.ceil(expected_tweets * 1.5 / TWEETS_PER_SCROLL)))
+
+
+def plan_interval(rate: float) -> float:
+    """Minutes until about ``SCHEDULE_TARGET_TWEETS`` tweets arrive at ``rate`` tweets/minute."""
+    if not rate:
+        return SCHEDULE_MAX_MINUTES
+    return min(SCHEDULE_MAX_MINUTES, max(SCHEDULE_MIN_MINUTES, SCHEDULE_TARGET_TWEETS / rate))
+
+
+def due_tags(tags: list, now: datetime = None) -> list:
+    """``(tag, max_scrolls)`` of every tag in ``tags`` whose next run is due; new tags are always due."""
+    now = now or datetime.now()
+    schedule = load_schedule()
+    due = []
+    for tag in tags:
+        entry = schedule.get(clean_tag(tag))
+        if entry is None:
+            due.append((tag, SCHEDULE_MAX_SCROLLS))
+        elif datetime.fromisoformat(entry["nextRun"]) <= now:
+            due.append((tag, entry["maxScrolls"]))
+    return due
+
+
+def record_run(tag: str, new_count, started_at: datetime, max_scrolls: int, now: datetime = None) -> dict:
+    """
+    Update ``tag``'s rate estimate from a scrape that started at
+    ``started_at`` and found ``new_count`` new tweets (None if it failed),
+    and plan its next run. Returns the tag's schedule entry.
+    """
+    key = clean_tag(tag)
+    with file_lock(schedule_path.with_suffix(".json.lock")):
+        schedule = load_schedule()
+        entry = schedule.get(key, {"rate": None, "failures": 0})
+        now = now or datetime.now()
+
+        if new_count is None:
+            entry["failures"] = entry.get("failures", 0) + 1
+            minutes = min(SCHEDULE_MAX_MINUTES, SCHEDULE_MIN_MINUTES * 2 ** entry["failures"])
+        else:
+            entry["failures"] = 0
+            last_run = entry.get("lastRun")
+            elapsed = (started_at - datetime.fromisoformat(last_run)) if last_run else INITIAL_LOOKBACK
+            elapsed_minutes = max(elapsed.total_seconds() / 60, 1.0)
+            observed = new_count / elapsed_minutes
+            if entry.get("rate") is None:
+                rate = observed
+            else:
+                weight = 1 - 0.5 ** (elapsed_minutes / 60 / SCHEDULE_HALF_LIFE_HOURS)
+                rate = entry["rate"] + weight * (observed - entry["rate"])
+            saturated = new_count >= max_scrolls * TWEETS_PER_SCROLL
+            if saturated:
+                # the scroll cap cut the run short, the real rate is at least this
+                rate = max(rate, observed)
+            entry["rate"] = rate
+            entry["lastRun"] = started_at.isoformat(timespec="seconds")
+            entry["lastNew"] = new_count
+            minutes = SCHEDULE_MIN_MINUTES if saturated else plan_interval(rate)
+
+        rate = entry.get("rate") or 0.0
+        entry["maxScrolls"] = scroll_cap(rate * minutes)
+        entry["nextRun"] = (now + timedelta(minutes=minutes)).isoformat(timespec="seconds")
+        schedule[key] = entry
+        save_schedule(schedule)
+
+    gauge("tag_rate_per_minute", rate, tag=key)
+    gauge("tag_interval_minutes", minutes, tag=key)
+    logger.info(
+        f"Tag {tag}: {new_count} new tweets, {rate:.2f} tweets/min, "
+        f"next run in {minutes:.0f} min with up to {entry['maxScrolls']} scrolls"
+    )
+    return entry
+
+
+def planned_interval_seconds(tag: str) -> float:
+    """The interval the schedule currently plans for ``tag``, in seconds."""
+    entry = load_schedule().get(clean_tag(tag))
+    if entry is None:
+        return SCHEDULE_MIN_MINUTES * 60
+    return plan_interval(entry.get("rate") or 0.0) * 60
+
+
+if __name__ == "__main__":
+    schedule = load_schedule()
+    for tag in load_tags():
+        entry = schedule.get(clean_tag(tag))
+        if entry is None:
+            print(f"{tag}: never run")
+        else:
+            print(
+                f"{tag}: {entry.get('rate') or 0:.2f} tweets/min, next run {entry['nextRun']}, "
+                f"{entry['maxScrolls']} scrolls, {entry.get('failures', 0)} failures"
+            )
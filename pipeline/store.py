@@ -0,0 +1,200 @@
+'''
+Append-only, partitioned parquet store with a persistent key index, used
+for tweets and for extracted FAQs.
+
+A tag's rows live under ``<root>/tag=<tag>/postYear=/postMonth=/postDay=/``.
+The tag and the date parts only live in the path, never inside the files,
+so the files can be copied to LakeFS as they are and read as one hive
+dataset there.
+Every write appends new ``part-*.parquet`` files holding only rows whose key
+is not yet in the tag's SQLite key index (key -> partition), so the cost of
+an update depends on the new rows, not on the stored history.
+``compact_partitions`` later merges the small files of each partition.
+
+Keys are derived from the row's content, never from how it was scraped, so
+the same tweet gets the same key whether ``SCRAPE_MODE`` is "network" or
+"dom". An index built with an older key scheme (``KEY_VERSION``) is
+emptied when it is opened, and the caller refills it from the files.
+'''
+
+from pathlib import Path
+from uuid import uuid4
+import html
+import logging
+import os
+import re
+import sqlite3
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from run_metrics import span, inc
+
+logger = logging.getLogger(__name__)
+
+from paths import data_dir
+
+index_dir = data_dir / "index"
+
+PARTITION_COLS = ["postYear", "postMonth", "postDay"]
+# columns the path already holds; older files still have them inside
+PATH_COLS = ["tag"]
+KEY_COL = "tweetKey"
+# partitions with at least this many files get merged by compact_partitions
+COMPACT_MIN_FILES = int(os.getenv("COMPACT_MIN_FILES", 8))
+# sqlite limits the number of bound parameters per statement
+_LOOKUP_CHUNK = 500
+# bump whenever a key function changes, indexes of another version are rebuilt
+KEY_VERSION = 2
+
+# t.co links (SearchTimeline JSON) and shortened display links (rendered page)
+_LINK = re.compile(r"https?://\S+|\S+…")
+_SPACES = re.compile(r"\s+")
+
+
+def key_text(text: str) -> str:
+    """``text`` as both scrape modes see it: entities unescaped, links removed, spacing folded."""
+    return _SPACES.sub(" ", _LINK.sub(" ", html.unescape(str(text)))).strip()
+
+
+def tweet_key(df: pd.DataFrame) -> pd.Series:
+    """
+    Stable key per tweet: a 64-bit hash of (username, tweetText) with the
+    text passed through ``key_text``. Network and DOM scrapes of a tweet
+    get the same key.
+    """
+    content = pd.DataFrame({
+        "username": df["username"].astype(str).to_numpy(),
+        "tweetText": df["tweetText"].map(key_text).to_numpy(),
+    })
+    content_hash = pd.util.hash_pandas_object(content, index=False).to_numpy()
+    return pd.Series(np.char.mod("h%016x", content_hash), index=df.index, dtype=object)
+
+
+def partition_path(year, month, day) -> str:
+    return f"postYear={year}/postMonth={month}/postDay={day}"
+
+
+def open_key_index(collection: str, tag: str) -> sqlite3.Connection:
+    path = index_dir / collection / f"{tag}.sqlite"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("CREATE TABLE IF NOT EXISTS keys (key TEXT PRIMARY KEY, partition TEXT NOT NULL)")
+    conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT NOT NULL)")
+    row = conn.execute("SELECT value FROM meta WHERE name = 'key_version'").fetchone()
+    if row is None or row[0] != str(KEY_VERSION):
+        with conn:
+            dropped = conn.execute("DELETE FROM keys").rowcount
+            conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('key_version', ?)", (str(KEY_VERSION),))
+        if dropped:
+            logger.info(f"Key index {path} was built with other keys, it is rebuilt from the files")
+    return conn
+
+
+def known_keys(conn: sqlite3.Connection, keys) -> set:
+    """Batched membership check: which of ``keys`` are already in the index."""
+    keys = list(keys)
+    found = set()
+    for start in range(0, len(keys), _LOOKUP_CHUNK):
+        chunk = keys[start:start + _LOOKUP_CHUNK]
+        placeholders = ",".join("?" * len(chunk))
+        rows = conn.execute(f"SELECT key FROM keys WHERE key IN ({placeholders})", chunk)
+        found.update(row[0] for row in rows)
+    return found
+
+
+def add_keys(conn: sqlite3.Connection, keys, partitions):
+    with conn:
+        conn.executemany("INSERT OR IGNORE INTO keys (key, partition) VALUES (?, ?)", zip(keys, partitions))
+
+
+def _partition_of(file_path: Path, tag_dir: Path) -> str:
+    return file_path.parent.relative_to(tag_dir).as_posix()
+
+
+def rebuild_key_index(conn: sqlite3.Connection, tag_dir: Path, key_fn=tweet_key,
+                      key_columns=("username", "tweetText"), key_col: str = KEY_COL):
+    """
+    Fill an empty index from the files already under ``tag_dir`` (first run
+    after upgrading an existing store, or after the index was lost). Keys
+    are derived again from ``key_columns``, keys stored in the files may be
+    of an older version; only files without those columns use them.
+    """
+    files = sorted(Path(tag_dir).rglob("*.parquet"))
+    if not files:
+        return
+    logger.info(f"Building key index for {tag_dir} from {len(files)} files")
+    for file_path in files:
+        names = pq.read_schema(file_path).names
+        derive = all(c in names for c in key_columns)
+        columns = list(key_columns) if derive else [key_col]
+        df = pq.read_table(file_path, columns=columns, partitioning=None).to_pandas()
+        keys = key_fn(df) if derive else df[key_col]
+        add_keys(conn, keys, [_partition_of(file_path, tag_dir)] * len(keys))
+
+
+def append_partitions(tag_dir: Path, df: pd.DataFrame, conn: sqlite3.Connection, key_col: str = KEY_COL) -> pd.DataFrame:
+    """
+    Write the rows of ``df`` whose ``key_col`` is not in the index as new
+    files in their partitions, then record their keys. Returns the new rows.
+
+    Files are written before keys are committed: a crash in between can only
+    leave duplicate rows behind (dropped again by compaction), never lose any.
+    """
+    df = df.drop_duplicates(subset=[key_col])
+    existing = known_keys(conn, df[key_col])
+    new_df = df[~df[key_col].isin(existing)]
+    if new_df.empty:
+        return new_df
+
+    tag_dir.mkdir(parents=True, exist_ok=True)
+    written = []
+    new_df.drop(columns=PATH_COLS, errors="ignore").to_parquet(
+        path=tag_dir,
+        partition_cols=PARTITION_COLS,
+        engine="pyarrow",
+        compression="snappy",
+        index=False,
+        basename_template=f"part-{uuid4().hex}-{{i}}.parquet",
+        existing_data_behavior="overwrite_or_ignore",
+        file_visitor=written.append,
+    )
+    inc("bytes_written", sum(f.size or 0 for f in written), collection=Path(tag_dir).parent.name)
+    partitions = [partition_path(y, m, d) for y, m, d in new_df[PARTITION_COLS].itertuples(index=False)]
+    add_keys(conn, new_df[key_col], partitions)
+    return new_df
+
+
+def compact_partitions(tag_dir: Path, min_files: int = COMPACT_MIN_FILES, key_fn=tweet_key,
+                       key_col: str = KEY_COL) -> int:
+    """
+    Merge every partition under ``tag_dir`` that has at least ``min_files``
+    parquet files into a single file, dropping duplicate keys. Keys are
+    derived again with ``key_fn``, so rows stored under an older key scheme
+    are matched too. The merged file is written under a temporary name and
+    renamed into place before the old files are removed. Returns the number
+    of partitions compacted.
+    """
+    compacted = 0
+    partition_dirs = {f.parent for f in Path(tag_dir).rglob("*.parquet")}
+    for partition_dir in sorted(partition_dirs):
+        files = sorted(partition_dir.glob("*.parquet"))
+        if len(files) < min_files:
+            continue
+        with span("store.compact", collection=Path(tag_dir).parent.name):
+            tables = [pq.read_table(f, partitioning=None) for f in files]
+            df = pa.concat_tables(tables, promote_options="default").to_pandas()
+            df[key_col] = key_fn(df)
+            df = df.drop_duplicates(subset=[key_col]).drop(columns=PATH_COLS, errors="ignore")
+
+            tmp_path = partition_dir / f".compact-{uuid4().hex}.parquet.tmp"
+            df.to_parquet(tmp_path, engine="pyarrow", compression="snappy", index=False)
+            os.replace(tmp_path, partition_dir / f"part-{uuid4().hex}-0.parquet")
+            for f in files:
+                f.unlink()
+        compacted += 1
+        logger.info(f"Compacted {len(files)} files into one in {partition_dir}")
+    return compacted
@@ -0,0 +1,157 @@
+'''
+Long-running micro-batch mode: instead of the scheduled scrape and extract
+flows, one process keeps a BrowserPool (and its logged-in contexts) open
+and runs, side by side on one event loop:
+
+- a poller per tag that scrapes incrementally and stores new tweets, which
+  enqueues them on the work queue. Each tag's polling interval adapts to
+  what the last poll found: it halves after a busy poll (at least
+  ``STREAM_BUSY_TWEETS`` new tweets), grows by half after an empty one,
+  and stays between ``STREAM_MIN_INTERVAL`` and ``STREAM_MAX_INTERVAL``;
+- ``STREAM_EXTRACT_WORKERS`` extraction workers draining the work queue as
+  soon as jobs appear, so every batch is only as large as what arrived
+  since the last one;
+- a reporter that logs queue depth/lag and per-tweet latency (post to FAQ
+  commit and scrape to FAQ commit, p50/p99) and rewrites
+  ``data/metrics/stream.prom`` every ``STREAM_REPORT_SECONDS``;
+- a LakeFS sync every ``STREAM_SYNC_SECONDS``.
+
+Run it with ``python stream.py`` (Ctrl-C or SIGTERM stops it after the
+current step). Do not run scrape_tag_flow/extract_queue_flow against the
+same data directory at the same time.
+'''
+
+from datetime import datetime
+from pathlib import Path
+import argparse
+import asyncio
+import logging
+import os
+import random
+import signal
+import sys
+
+file_dir = Path(__file__).resolve().parent
+sys.path.append(str(file_dir))
+
+from update import update_tag_async, clean_tag, MAX_INCREMENTAL_SCROLLS
+from x_scrap import BrowserPool, SCRAPE_CONCURRENCY
+from extraction import extract
+from lakefs_sync import sync_to_lakefs
+from work_queue import drain, report_stats
+from scheduler import load_tags, record_run, planned_interval_seconds
+import run_metrics
+
+logger = logging.getLogger(__name__)
+
+STREAM_MIN_INTERVAL = float(os.getenv("STREAM_MIN_INTERVAL", 30))
+STREAM_MAX_INTERVAL = float(os.getenv("STREAM_MAX_INTERVAL", 600))
+STREAM_BUSY_TWEETS = int(os.getenv("STREAM_BUSY_TWEETS", 5))
+STREAM_EXTRACT_WORKERS = int(os.getenv("STREAM_EXTRACT_WORKERS", 1))
+STREAM_QUEUE_POLL = float(os.getenv("STREAM_QUEUE_POLL", 5))
+STREAM_REPORT_SECONDS = float(os.getenv("STREAM_REPORT_SECONDS", 60))
+STREAM_SYNC_SECONDS = float(os.getenv("STREAM_SYNC_SECONDS", 900))
+
+
+class PollInterval:
+    """Seconds to wait before polling a tag again, adapted to its last result."""
+
+    def __init__(self, minimum: float = STREAM_MIN_INTERVAL, maximum: float = STREAM_MAX_INTERVAL,
+                 busy_tweets: int = STREAM_BUSY_TWEETS, seconds: float = None):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.busy_tweets = busy_tweets
+        self.seconds = min(maximum, max(minimum, seconds or minimum))
+
+    def update(self, new_count) -> float:
+        """``new_count`` is None when the poll failed."""
+        if new_count is None:
+            self.seconds *= 2
+        elif new_count >= self.busy_tweets:
+            self.seconds /= 2
+        elif new_count == 0:
+            self.seconds *= 1.5
+        self.seconds = min(self.maximum, max(self.minimum, self.seconds))
+        return self.seconds
+
+    def next_wait(self) -> float:
+        # jitter keeps tags that settle on the same interval from polling in lockstep
+        return self.seconds * random.uniform(0.9, 1.1)
+
+
+async def _wait(stop: asyncio.Event, seconds: float) -> bool:
+    """Sleep ``seconds`` unless ``stop`` is set first; True when stopping."""
+    try:
+        await asyncio.wait_for(stop.wait(), timeout=seconds)
+    except asyncio.TimeoutError:
+        return False
+    return True
+
+
+async def poll_tag(pool: BrowserPool, tag: str, stop: asyncio.Event, interval: PollInterval = None):
+    # start from what the scheduler learned about the tag, within the stream's bounds
+    interval = interval or PollInterval(seconds=planned_interval_seconds(tag))
+    while not stop.is_set():
+        started_at = datetime.now()
+        new_count = await update_tag_async(pool, tag, max_scrolls=MAX_INCREMENTAL_SCROLLS, incremental=True)
+        # keeps the tag's velocity current for the scheduled flows
+        record_run(tag, new_count, started_at, MAX_INCREMENTAL_SCROLLS)
+        seconds = interval.update(new_count)
+        run_metrics.gauge("stream_poll_interval_seconds", seconds, tag=clean_tag(tag).lower())
+        logger.info(f"Polled {tag}: {new_count} new tweets, next poll in {seconds:.0f}s")
+        if await _wait(stop, interval.next_wait()):
+            break
+
+
+async def extract_worker(worker: str, stop: asyncio.Event):
+    while not stop.is_set():
+        # extract is blocking IO and LLM calls, keep it off the event loop
+        handled = await asyncio.to_thread(drain, extract, None, worker)
+        if handled == 0 and await _wait(stop, STREAM_QUEUE_POLL):
+            break
+
+
+def report():
+    report_stats()
+    latency = {row["stage"]: row for row in run_metrics.snapshot()["stages"] if row["stage"].startswith("tweet.")}
+    for stage, row in sorted(latency.items()):
+        logger.info(
+            f"Latency {stage}: p50 {row['p50_seconds']:.0f}s, p99 {row['p99_seconds']:.0f}s, "
+            f"max {row['max_seconds']:.0f}s over {row['count']} tweets"
+        )
+    run_metrics.write_prometheus(run_metrics.METRICS_DIR / "stream.prom", {"flow": "stream"})
+
+
+async def every(seconds: float, fn, stop: asyncio.Event):
+    while not await _wait(stop, seconds):
+        try:
+            await asyncio.to_thread(fn)
+        except Exception as e:
+            logger.error(f"{fn.__name__} failed: {e}", exc_info=True)
+
+
+async def stream(tags: list, concurrency: int = SCRAPE_CONCURRENCY, extract_workers: int = STREAM_EXTRACT_WORKERS):
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    logger.info(f"Streaming {len(tags)} tags with {concurrency} browser contexts and {extract_workers} extractors")
+    async with BrowserPool(size=concurrency) as pool:
+        await asyncio.gather(
+            *[poll_tag(pool, tag, stop) for tag in tags],
+            *[extract_worker(f"stream-extract-{i}", stop) for i in range(extract_workers)],
+            every(STREAM_REPORT_SECONDS, report, stop),
+            every(STREAM_SYNC_SECONDS, sync_to_lakefs, stop),
+        )
+    report()
+    logger.info("Stream stopped")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scrape and extract tags continuously.")
+    parser.add_argument("tags", nargs="*", help="defaults to the tags in config/tags.json")
+    parser.add_argument("--concurrency", type=int, default=SCRAPE_CONCURRENCY)
+    parser.add_argument("--extract-workers", type=int, default=STREAM_EXTRACT_WORKERS)
+    args = parser.parse_args()
+    asyncio.run(stream(args.tags or load_tags(), args.concurrency, args.extract_workers))
@@ -0,0 +1,190 @@
+'''
+Small per-tag JSON state kept next to the data, e.g. the scrape watermark
+that tells an incremental scrape where the previous run stopped.
+
+The scraper and the extraction worker update the same file at the same
+time, so every read-modify-write holds an exclusive lock on
+``<tag>.json.lock`` (``update_state``). ``tag_lock`` takes the same kind
+of lock for other per-tag files, e.g. the topic dictionary.
+'''
+
+from contextlib import contextmanager
+from copy import deepcopy
+from datetime import datetime, timedelta
+from hashlib import sha1
+from pathlib import Path
+from uuid import uuid4
+import fcntl
+import json
+import os
+import re
+
+import pandas as pd
+
+from paths import data_dir
+
+state_dir = data_dir / "state"
+state_dir.mkdir(parents=True, exist_ok=True)
+
+# how many of the newest tweet keys to remember per tag
+WATERMARK_KEYS = 500
+# how far back a tag's first incremental scrape goes
+INITIAL_LOOKBACK = timedelta(days=int(os.getenv("SCRAPE_INITIAL_LOOKBACK_DAYS", 1)))
+
+
+def clean_tag(tag: str) -> str:
+    return re.sub(r'[^a-zA-Z0-9ก-๙]', '', tag).lower()
+
+def state_path(tag: str) -> Path:
+    return state_dir / f"{clean_tag(tag)}.json"
+
+def load_state(tag: str) -> dict:
+    path = state_path(tag)
+    if not path.exists():
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def save_state(tag: str, state: dict):
+    """Write the tag's state atomically so a crash never leaves half a file."""
+    path = state_path(tag)
+    tmp_path = path.with_name(f"{path.name}.{uuid4().hex}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+@contextmanager
+def file_lock(path: Path):
+    """Exclusive ``flock`` on ``path`` for the block; threads and processes take turns."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+def tag_lock(tag: str, name: str):
+    """The per-tag lock ``name``. Not reentrant: a holder must not take it again."""
+    return file_lock(state_dir / f"{clean_tag(tag)}.{name}.lock")
+
+@contextmanager
+def update_state(tag: str):
+    """
+    Load the tag's state under its lock and save it back when the block
+    changed it. Threads and processes take turns, so no update is lost.
+    """
+    with file_lock(state_path(tag).with_suffix(".json.lock")):
+        state = load_state(tag)
+        before = deepcopy(state)
+        yield state
+        if state != before:
+            save_state(tag, state)
+
+
+def text_key(text: str) -> str:
+    return sha1(text.encode()).hexdigest()[:16]
+
+def load_watermark(tag: str) -> dict:
+    """
+    Return the scrape watermark for ``tag``: the newest post time seen and
+    the ids / text keys of the most recent tweets.
+    """
+    watermark = load_state(tag).get("watermark", {})
+    post_time = watermark.get("postTime")
+    if post_time:
+        post_time = datetime.fromisoformat(post_time)
+    else:
+        post_time = datetime.now() - INITIAL_LOOKBACK
+    return {
+        "postTime": post_time,
+        "tweetIds": set(watermark.get("tweetIds", [])),
+        "textKeys": set(watermark.get("textKeys", [])),
+    }
+
+def save_watermark(tag: str, tweet_df: pd.DataFrame):
+    """Advance the watermark with the tweets just stored for ``tag``."""
+    if tweet_df is None or tweet_df.empty:
+        return
+    newest = tweet_df.sort_values("postTime", ascending=False).head(WATERMARK_KEYS)
+    text_keys = [text_key(t) for t in newest["tweetText"]]
+    tweet_ids = newest["tweetId"].dropna().tolist() if "tweetId" in newest.columns else []
+
+    with update_state(tag) as state:
+        previous = state.get("watermark", {})
+        post_time = tweet_df["postTime"].max()
+        if previous.get("postTime"):
+            post_time = max(post_time, pd.Timestamp(previous["postTime"]))
+
+        state["watermark"] = {
+            "postTime": pd.Timestamp(post_time).isoformat(),
+            "tweetIds": (tweet_ids + previous.get("tweetIds", []))[:WATERMARK_KEYS],
+            "textKeys": (text_keys + previous.get("textKeys", []))[:WATERMARK_KEYS],
+        }
+
+def reached_watermark(watermark: dict, tweet_id=None, text: str = None, post_time=None,
+                      date_only: bool = False) -> bool:
+    """
+    True once a scraped tweet is one a previous run already stored or is older than the watermark.
+
+    ``date_only`` marks a ``post_time`` that only knows its day (X shows
+    "Mon DD" for posts older than a day, parsed to midnight): it is older
+    only when that day is before the watermark's.
+    """
+    if not watermark:
+        return False
+    if tweet_id is not None and tweet_id in watermark["tweetIds"]:
+        return True
+    if text is not None and text_key(text) in watermark["textKeys"]:
+        return True
+    if post_time is None or pd.isna(post_time):
+        return False
+    if date_only:
+        return pd.Timestamp(post_time).date() < pd.Timestamp(watermark["postTime"]).date()
+    return post_time < watermark["postTime"]
+
+
+def mark_dirty(tag: str, day):
+    """
+    Record that rows dated ``day`` (or later) were just written for ``tag``,
+    so the next extraction also scans that far back.
+    """
+    day = pd.Timestamp(day).date().isoformat()
+    with update_state(tag) as state:
+        extraction = state.setdefault("extraction", {})
+        if extraction.get("dirtySince") is None or day < extraction["dirtySince"]:
+            extraction["dirtySince"] = day
+
+def extraction_since(tag: str):
+    """
+    First day extraction has to scan for ``tag``: the older of the
+    processed-through watermark and the oldest day written since. None
+    means scan everything (no watermark yet).
+
+    Returns:
+        (since, dirty_since) where ``dirty_since`` must be handed back to
+        ``advance_extraction_watermark``.
+    """
+    extraction = load_state(tag).get("extraction", {})
+    processed_through = extraction.get("processedThrough")
+    dirty_since = extraction.get("dirtySince")
+    if processed_through is None:
+        return None, dirty_since
+    since = min(d for d in (processed_through, dirty_since) if d is not None)
+    return datetime.fromisoformat(since).date(), dirty_since
+
+def advance_extraction_watermark(tag: str, processed_through, dirty_since):
+    """
+    Move the processed-through watermark forward after a successful
+    extraction. ``dirtySince`` is only cleared if no scrape moved it in the
+    meantime.
+    """
+    with update_state(tag) as state:
+        extraction = state.setdefault("extraction", {})
+        if processed_through is not None:
+            processed_through = pd.Timestamp(processed_through).date().isoformat()
+            if extraction.get("processedThrough") is None or processed_through > extraction["processedThrough"]:
+                extraction["processedThrough"] = processed_through
+        if extraction.get("dirtySince") == dirty_since:
+            extraction["dirtySince"] = None
@@ -0,0 +1,145 @@
+'''
+Parsing of X's SearchTimeline GraphQL responses.
+
+The scraper's network capture mode feeds every SearchTimeline JSON body it
+intercepts through ``parse_search_timeline``. Nothing here touches
+Playwright, so the same code can be run offline against responses recorded
+as a HAR file or as plain JSON dumps (see ``load_fixture``).
+'''
+
+import base64
+import json
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+
+TIMELINE_URL_MARKER = "SearchTimeline"
+
+
+def _search_instructions(payload: dict) -> list:
+    timeline = (
+        payload.get("data", {})
+        .get("search_by_raw_query", {})
+        .get("search_timeline", {})
+        .get("timeline", {})
+    )
+    return timeline.get("instructions", [])
+
+
+def _timeline_entries(instructions: list) -> list:
+    entries = []
+    for instruction in instructions:
+        if instruction.get("type") == "TimelineAddEntries":
+            entries.extend(instruction.get("entries", []))
+        elif instruction.get("type") == "TimelineReplaceEntry":
+            entries.append(instruction.get("entry", {}))
+    return entries
+
+
+def _entry_tweet_results(entry: dict) -> list:
+    content = entry.get("content", {})
+    if content.get("entryType") == "TimelineTimelineItem":
+        items = [content.get("itemContent", {})]
+    elif content.get("entryType") == "TimelineTimelineModule":
+        items = [item.get("item", {}).get("itemContent", {}) for item in content.get("items", [])]
+    else:
+        # cursors and other non-tweet entries
+        return []
+    return [item.get("tweet_results", {}).get("result") for item in items if item.get("tweet_results")]
+
+
+def parse_created_at(created_at: str) -> datetime:
+    """
+    Convert X's ``created_at`` ("Wed Oct 10 20:19:24 +0000 2018") to a naive
+    local datetime, the same clock ``scrapeTime`` is recorded in.
+    """
+    return parsedate_to_datetime(created_at).astimezone().replace(tzinfo=None)
+
+
+def parse_tweet_result(result: dict):
+    """
+    Flatten one ``tweet_results.result`` object into a tweet record, or
+    return None for tombstones and unavailable tweets.
+    """
+    if not result:
+        return None
+    if result.get("__typename") == "TweetWithVisibilityResults":
+        result = result.get("tweet", {})
+    if result.get("__typename") not in (None, "Tweet"):
+        return None
+
+    legacy = result.get("legacy") or {}
+    tweet_id = result.get("rest_id") or legacy.get("id_str")
+    created_at = legacy.get("created_at")
+    if not tweet_id or not created_at:
+        return None
+
+    # long posts carry their full text in note_tweet, legacy.full_text is truncated
+    note = result.get("note_tweet", {}).get("note_tweet_results", {}).get("result", {})
+    text = note.get("text") or legacy.get("full_text", "")
+
+    user = result.get("core", {}).get("user_results", {}).get("result", {})
+    user_core = user.get("core") or {}
+    user_legacy = user.get("legacy") or {}
+    screen_name = user_core.get("screen_name") or user_legacy.get("screen_name", "")
+    name = user_core.get("name") or user_legacy.get("name", "")
+
+    return {
+        "tweetId": str(tweet_id),
+        # same "Display Name@handle" shape the DOM scraper produces
+        "username": f"{name}@{screen_name}",
+        "tweetText": text,
+        "postTime": parse_created_at(created_at).isoformat(),
+    }
+
+
+def parse_search_timeline(payload: dict) -> list:
+    """
+    Return the tweets in one SearchTimeline response, in timeline order.
+    """
+    tweets = []
+    for entry in _timeline_entries(_search_instructions(payload)):
+        for result in _entry_tweet_results(entry):
+            tweet = parse_tweet_result(result)
+            if tweet is not None:
+                tweets.append(tweet)
+    return tweets
+
+
+def load_fixture(path) -> list:
+    """
+    Load recorded SearchTimeline payloads from ``path``.
+
+    Accepts a HAR file (as saved by browser devtools or Playwright's
+    ``record_har_path``), a single JSON response body, or a JSON list of
+    response bodies.
+    """
+    with open(Path(path), "r", encoding="utf-8") as f:
+        data = json.load(f)
+
+    if isinstance(data, dict) and "log" in data:
+        payloads = []
+        for entry in data["log"].get("entries", []):
+            if TIMELINE_URL_MARKER not in entry.get("request", {}).get("url", ""):
+                continue
+            content = entry.get("response", {}).get("content", {})
+            text = content.get("text")
+            if not text:
+                continue
+            if content.get("encoding") == "base64":
+                text = base64.b64decode(text).decode("utf-8")
+            payloads.append(json.loads(text))
+        return payloads
+
+    if isinstance(data, list):
+        return data
+    return [data]
+
+
+def tweets_from_fixture(path) -> list:
+    """Parse every recorded payload in ``path`` and de-duplicate by tweet id."""
+    tweets = {}
+    for payload in load_fixture(path):
+        for tweet in parse_search_timeline(payload):
+            tweets.setdefault(tweet["tweetId"], tweet)
+    return list(tweets.values())
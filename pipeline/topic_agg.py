@@ -0,0 +1,91 @@
+'''
+Per-tag topic counts by day, kept next to the FAQ store so the dashboard
+never has to explode and recount the FAQ rows.
+
+``<agg_dir>/tag=<tag>/`` holds rows of (postDate, topic, count), the
+number of FAQ rows that carry that topic on that day; a tag's counts are
+the sum over all files in its directory. The tag only lives in the hive
+path, so the directory can be scanned as one dataset.
+
+``part.parquet`` is the base, rebuilt from the full FAQ table when it is
+missing and whenever the FAQ store is compacted. Each ``extract`` run adds
+a ``delta-<run>.parquet`` with the counts of only the rows it added; the
+file name is the run's id, so committing a run again rewrites the same
+delta instead of counting its rows twice. A rebuild lists the deltas
+before it reads the FAQ rows and only removes those, so a delta committed
+while the FAQ table is being read stays and its rows are still counted.
+'''
+
+from pathlib import Path
+from uuid import uuid4
+import os
+
+import pandas as pd
+import pyarrow as pa
+
+AGG_COLUMNS = ["postDate", "topic", "count"]
+AGG_SCHEMA = pa.schema([("postDate", pa.date32()), ("topic", pa.string()), ("count", pa.int64())])
+# rows are sorted by day, so small row groups let date-range scans skip most of a file
+AGG_ROW_GROUP_SIZE = 8192
+
+
+def topic_day_counts(faq_df: pd.DataFrame) -> pd.DataFrame:
+    """Count FAQ rows per (postDate, topic)."""
+    if faq_df.empty:
+        return pd.DataFrame(columns=AGG_COLUMNS)
+    topics = faq_df[["postTime", "topic"]].explode("topic").dropna(subset=["topic"])
+    topics["postDate"] = pd.to_datetime(topics["postTime"]).dt.date
+    return topics.groupby(["postDate", "topic"]).size().rename("count").reset_index()[AGG_COLUMNS]
+
+
+def agg_path(agg_dir: Path, tag: str) -> Path:
+    return Path(agg_dir) / f"tag={tag}" / "part.parquet"
+
+
+def _write_counts(path: Path, counts: pd.DataFrame) -> pd.DataFrame:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".parquet.tmp")
+    counts = counts.sort_values(["postDate", "topic"], ignore_index=True)
+    counts.to_parquet(tmp_path, engine="pyarrow", compression="snappy", index=False, schema=AGG_SCHEMA,
+                      row_group_size=AGG_ROW_GROUP_SIZE)
+    os.replace(tmp_path, path)
+    return counts
+
+
+def read_topic_counts(agg_dir: Path, tag: str, columns: list = AGG_COLUMNS) -> pd.DataFrame:
+    """Base and delta counts of ``tag``, summed per (postDate, topic) when both columns are read."""
+    files = sorted(agg_path(agg_dir, tag).parent.glob("*.parquet"))
+    if not files:
+        return pd.DataFrame(columns=columns)
+    counts = pd.concat([pd.read_parquet(f, columns=columns, partitioning=None) for f in files], ignore_index=True)
+    keys = [c for c in ("postDate", "topic") if c in columns]
+    return counts.groupby(keys, as_index=False)["count"].sum()
+
+
+def update_topic_counts(agg_dir: Path, tag: str, added_faq: pd.DataFrame, existing_faq=None, run_id: str = None):
+    """
+    Record the topics of ``added_faq`` as the delta of ``run_id``. When the
+    tag has no base counts yet they are first built from ``existing_faq``
+    (the FAQ rows stored before this run), which may be a callable so the
+    FAQ table is only read in that case.
+    """
+    path = agg_path(agg_dir, tag)
+    if not path.exists():
+        rebuild_topic_counts(agg_dir, tag, existing_faq if existing_faq is not None else added_faq.iloc[:0])
+    return _write_counts(path.parent / f"delta-{run_id or uuid4().hex}.parquet", topic_day_counts(added_faq))
+
+
+def rebuild_topic_counts(agg_dir: Path, tag: str, all_faq) -> pd.DataFrame:
+    """
+    Recount the tag's topics from its full FAQ table, replacing the base and
+    the deltas it covers. ``all_faq`` may be a callable, called only after
+    the deltas to replace are listed.
+    """
+    path = agg_path(agg_dir, tag)
+    deltas = list(path.parent.glob("delta-*.parquet"))
+    if callable(all_faq):
+        all_faq = all_faq()
+    counts = _write_counts(path, topic_day_counts(all_faq))
+    for delta in deltas:
+        delta.unlink()
+    return counts
@@ -0,0 +1,173 @@
+'''
+Per-tag topic dictionary: every topic label the LLM returns is mapped to an
+integer id with one canonical label, so near-duplicate Thai spellings do
+not split the counts.
+
+A label is first normalized (Unicode NFC, zero-width characters removed,
+common Thai typing variants folded, case and whitespace folded). An exact
+match on a known alias wins; otherwise the closest canonical label by
+character trigram Dice similarity is used when it scores at least
+``TOPIC_MERGE_THRESHOLD``, and the new spelling is remembered as an alias.
+Only then is a new id created. Lookups go through an inverted trigram
+index, so a label is only compared with topics it shares trigrams with.
+
+The dictionary is kept as ``data/topics/<tag>.json`` and written
+atomically. Extraction and compaction both add labels, so each holds
+``vocab_lock`` from ``load`` until it has saved; otherwise the later save
+would drop the labels of the other, and topic ids already written to the
+FAQ store would point at missing or reassigned labels.
+'''
+
+from collections import defaultdict
+from pathlib import Path
+import json
+import os
+import re
+import unicodedata
+
+from paths import data_dir
+from tag_state import tag_lock
+
+vocab_dir = data_dir / "topics"
+
+TOPIC_MERGE_THRESHOLD = float(os.getenv("TOPIC_MERGE_THRESHOLD", 0.8))
+NGRAM = 3
+
+_ZERO_WIDTH = re.compile("[\u200b\u200c\u200d\u2060\ufeff]")
+_EDGE_PUNCT = re.compile(r"^[\s\"'“”‘’.,:;!?()\[\]#-]+|[\s\"'“”‘’.,:;!?()\[\]#-]+$")
+_SPACES = re.compile(r"\s+")
+# variants that render the same but encode differently
+_THAI_FOLDS = [
+    ("เเ", "แ"),  # เ + เ typed for แ
+    ("ํา", "ำ"),  # nikhahit + sara aa typed for sara am
+]
+
+
+def clean_label(label: str) -> str:
+    """``label`` as it is shown: encoding variants folded, case kept."""
+    text = unicodedata.normalize("NFC", str(label))
+    text = _ZERO_WIDTH.sub("", text)
+    for variant, canonical in _THAI_FOLDS:
+        text = text.replace(variant, canonical)
+    text = _EDGE_PUNCT.sub("", text)
+    return _SPACES.sub(" ", text)
+
+
+def normalize_topic(label: str) -> str:
+    """Lookup form of ``label``."""
+    return clean_label(label).casefold()
+
+
+def vocab_lock(tag: str):
+    """Held by whoever loads, changes and saves the dictionary of ``tag``."""
+    return tag_lock(tag, "topics")
+
+
+def char_ngrams(text: str, n: int = NGRAM) -> set:
+    padded = f" {text} "
+    if len(padded) <= n:
+        return {padded}
+    return {padded[i:i + n] for i in range(len(padded) - n + 1)}
+
+
+class TopicVocab:
+    def __init__(self, path: Path, threshold: float = TOPIC_MERGE_THRESHOLD):
+        self.path = Path(path)
+        self.threshold = threshold
+        self.labels = []        # id -> canonical label
+        self.aliases = {}       # normalized label -> id
+        self._grams = []        # id -> trigrams of the canonical label
+        self._postings = defaultdict(set)  # trigram -> ids
+        self.dirty = False
+
+    @classmethod
+    def load(cls, tag: str, threshold: float = TOPIC_MERGE_THRESHOLD) -> "TopicVocab":
+        vocab = cls(vocab_dir / f"{tag}.json", threshold)
+        if vocab.path.exists():
+            with open(vocab.path, "r", encoding="utf-8") as f:
+                stored = json.load(f)
+            for topic in sorted(stored["topics"], key=lambda t: t["id"]):
+                vocab._add(topic["label"])
+                for alias in topic["aliases"]:
+                    vocab.aliases[alias] = topic["id"]
+            vocab.dirty = False
+        return vocab
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+    def _add(self, label: str) -> int:
+        topic_id = len(self.labels)
+        self.labels.append(label)
+        grams = char_ngrams(normalize_topic(label))
+        self._grams.append(grams)
+        for gram in grams:
+            self._postings[gram].add(topic_id)
+        self.aliases[normalize_topic(label)] = topic_id
+        self.dirty = True
+        return topic_id
+
+    def closest(self, normalized: str):
+        """Best (id, similarity) among topics sharing a trigram with ``normalized``."""
+        grams = char_ngrams(normalized)
+        shared = defaultdict(int)
+        for gram in grams:
+            for topic_id in self._postings.get(gram, ()):
+                shared[topic_id] += 1
+        best_id, best_score = None, 0.0
+        for topic_id, count in shared.items():
+            score = 2 * count / (len(grams) + len(self._grams[topic_id]))
+            if score > best_score or (score == best_score and topic_id < best_id):
+                best_id, best_score = topic_id, score
+        return best_id, best_score
+
+    def resolve(self, label: str) -> int:
+        """Id of ``label``, merging it into a close existing topic or adding it."""
+        normalized = normalize_topic(label)
+        if normalized in self.aliases:
+            return self.aliases[normalized]
+        topic_id, score = self.closest(normalized)
+        if topic_id is not None and score >= self.threshold:
+            self.aliases[normalized] = topic_id
+            self.dirty = True
+            return topic_id
+        return self._add(clean_label(label))
+
+    def resolve_all(self, labels) -> list:
+        """Ids of ``labels`` in order, without repeats."""
+        ids = []
+        for label in labels if labels is not None else []:
+            if label is None or not normalize_topic(label):
+                continue
+            topic_id = self.resolve(label)
+            if topic_id not in ids:
+                ids.append(topic_id)
+        return ids
+
+    def canonical(self, labels) -> list:
+        return [self.labels[topic_id] for topic_id in self.resolve_all(labels)]
+
+    def canonical_counts(self, counts) -> dict:
+        """Fold a label -> count mapping onto canonical labels, most frequent labels first."""
+        folded = defaultdict(int)
+        for label, count in sorted(counts.items(), key=lambda item: (-item[1], item[0])):
+            for canonical in self.canonical([label]):
+                folded[canonical] += count
+        return dict(folded)
+
+    def save(self):
+        if not self.dirty:
+            return
+        aliases = defaultdict(list)
+        for alias, topic_id in self.aliases.items():
+            aliases[topic_id].append(alias)
+        topics = [
+            {"id": topic_id, "label": label, "aliases": sorted(aliases[topic_id])}
+            for topic_id, label in enumerate(self.labels)
+        ]
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".json.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"topics": topics}, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, self.path)
+        self.dirty = False
@@ -5,6 +5,7 @@ import sys
 import os
 import re
 import pandas as pd
+import asyncio
 
 # Configure logging
 logging.basicConfig(
@@ -19,10 +20,7 @@ def setup_paths():
     file_dir = Path(__file__).parent
     sys.path.append(str(file_dir))
 
-    if Path('data/').exists():
-        data_dir = Path('data/')
-    else:
-        data_dir = file_dir / ".." / "data"
+    from paths import data_dir
 
     tweet_dest_dir = data_dir / "tweets"
     return tweet_dest_dir
@@ -30,74 +28,106 @@ def setup_paths():
 tweet_dest_dir = setup_paths()
 
 from x_scrap import *
+from tag_state import load_watermark, save_watermark, mark_dirty
+from store import (
+    KEY_COL, PARTITION_COLS, COMPACT_MIN_FILES, tweet_key, open_key_index, rebuild_key_index,
+    append_partitions, compact_partitions, partition_path,
+)
+from work_queue import get_queue
+from run_metrics import span, inc
+
+# safety cap on scrolls for an incremental (watermark-driven) scrape
+MAX_INCREMENTAL_SCROLLS = int(os.getenv("MAX_INCREMENTAL_SCROLLS", 30))
 
 
 def clean_tag(tag):
     return re.sub(r'[^a-zA-Z0-9ก-๙]', '', tag)
 
-def get_existing_partitions(tag_dir, years, months, days):
-    all_existing_partitions = []
-    for year in years:
-        for month in months:
-            for day in days:
-                partition = f"postYear={year}/postMonth={month}/postDay={day}"
-                full_path = tag_dir / partition
-                if full_path.exists():
-                    all_existing_partitions.append(full_path)
-    return all_existing_partitions
-
-def update_tag(tag: str, max_scrolls: int = 1):
+def store_tag(tag: str, scraped_df: pd.DataFrame):
+    """
+    Append freshly scraped tweets for ``tag`` to its partitions under
+    ``tweet_dest_dir``. Only tweets whose key is not yet in the tag's key
+    index are written, as new files; existing files are never rewritten.
+    New tweets are handed to extraction through the work queue.
+    Returns the number of tweets that were new.
+    """
+    tag_clean = clean_tag(tag)
+    tag_clean = tag_clean.lower()
+
+    if scraped_df is None or scraped_df.empty:
+        logging.info(f"No tweets scraped for tag: {tag}")
+        return 0
+
+    unparsed = scraped_df['postTime'].isna()
+    if unparsed.any():
+        logging.warning(f"Dropping {unparsed.sum()} tweets with unparseable post time")
+    scraped_df = scraped_df[~unparsed].copy()
+
+    scraped_df['scrapeTime'] = pd.to_datetime(scraped_df['scrapeTime'])
+    scraped_df[KEY_COL] = tweet_key(scraped_df)
+    tag_dir = tweet_dest_dir / f"tag={tag_clean}"
+
+    with span("store.append", collection="tweets"):
+        conn = open_key_index("tweets", tag_clean)
+        try:
+            if conn.execute("SELECT 1 FROM keys LIMIT 1").fetchone() is None:
+                rebuild_key_index(conn, tag_dir)
+            new_df = append_partitions(tag_dir, scraped_df, conn)
+        finally:
+            conn.close()
+    inc("rows_written", len(new_df), collection="tweets", tag=tag_clean)
+
+    logging.info(f"Found {len(new_df)} new tweets to add.")
+    if not new_df.empty:
+        mark_dirty(tag_clean, new_df['postTime'].min())
+        logging.info(f"New tweets appended under {tag_dir}")
+        partitions = {partition_path(*p) for p in new_df[PARTITION_COLS].drop_duplicates().itertuples(index=False)}
+        get_queue().enqueue(tag_clean, len(new_df), partitions, new_df['postTime'].min().isoformat())
+    return len(new_df)
+
+def compact_tag(tag: str, min_files: int = COMPACT_MIN_FILES):
+    """Merge the small append files in each of the tag's partitions."""
+    tag_clean = clean_tag(tag).lower()
+    return compact_partitions(tweet_dest_dir / f"tag={tag_clean}", min_files=min_files)
+
+def update_tag(tag: str, max_scrolls: int = 1, incremental: bool = False):
+    """
+    Scrape ``tag`` and merge the result into the tweet store.
+
+    With ``incremental=True`` the scrape keeps scrolling until it reaches a
+    tweet stored by a previous run or passes the tag's time watermark, and
+    ``max_scrolls`` is only a safety cap.
+    """
+    try:
+        tag_clean = clean_tag(tag)
+        tag_clean = tag_clean.lower()
+        logging.info(f"Scraping tag: {tag} (clean: {tag_clean}) with max_scrolls={max_scrolls}")
+
+        watermark = load_watermark(tag) if incremental else None
+        scraped_df = scrape_tag(tag, max_scrolls=max_scrolls, watermark=watermark)
+        new_count = store_tag(tag, scraped_df)
+        save_watermark(tag, scraped_df)
+        return new_count
+
+    except Exception as e:
+        logging.error(f"Error updating tag '{tag}': {e}", exc_info=True)
+
+async def update_tag_async(pool: BrowserPool, tag: str, max_scrolls: int = 1, incremental: bool = False):
+    """
+    Same as ``update_tag`` but scrapes through a shared BrowserPool, so many
+    tags can be in flight on one browser at once.
+    """
     try:
         tag_clean = clean_tag(tag)
         tag_clean = tag_clean.lower()
         logging.info(f"Scraping tag: {tag} (clean: {tag_clean}) with max_scrolls={max_scrolls}")
 
-        scraped_df = scrape_tag(tag, max_scrolls=max_scrolls)
-        scraped_df = scraped_df.set_index(["tweetText", "postTime"])
-        tag_dir = tweet_dest_dir / f"tag={tag_clean}"
-
-        if not os.path.exists(tag_dir):
-            os.makedirs(tag_dir)
-            logging.info(f"Created directory: {tag_dir}")
-
-        all_year = scraped_df['postYear'].unique()
-        all_month = scraped_df['postMonth'].unique()
-        all_day = scraped_df['postDay'].unique()
-
-        all_existing_partitions = get_existing_partitions(tag_dir, all_year, all_month, all_day)
-
-        if len(all_existing_partitions) == 0:
-            updated_df = scraped_df.copy()
-            logging.info("No existing partitions found. Using scraped data as updated data.")
-        else:
-            all_parquets_paths = [p for p_files in all_existing_partitions for p in p_files.glob("*.parquet")]
-
-            existed_df = pd.concat([pd.read_parquet(p) for p in all_parquets_paths], ignore_index=True)
-            existed_df = existed_df.set_index(["tweetText", "postTime"])
-
-            new_text = list(set(scraped_df.index) - set(existed_df.index))
-            new_df = scraped_df.loc[new_text]
-
-            updated_df = pd.concat([existed_df, new_df])
-            logging.info(f"Found {len(new_df)} new tweets to add.")
-            
-        updated_df.reset_index(inplace=True)
-        updated_df['scrapeTime'] = pd.to_datetime(updated_df['scrapeTime'])
-        updated_df['postTime'] = updated_df.apply(
-            lambda row: transform_post_time(row['postTimeRaw'], row['scrapeTime']), axis=1)
-        updated_df['postDay'] = updated_df['postTime'].dt.day
-        updated_df['postMonth'] = updated_df['postTime'].dt.month
-        updated_df['postYear'] = updated_df['postTime'].dt.year
-        print(updated_df.head())
-        updated_df.to_parquet(
-            partition_cols=["postYear", "postMonth", "postDay"],
-            path=tag_dir,
-            engine="pyarrow",
-            compression="snappy",
-            # index=False,
-            existing_data_behavior="delete_matching"
-        )
-        logging.info(f"Updated parquet files written to {tag_dir}")
+        watermark = load_watermark(tag) if incremental else None
+        scraped_df = await scrape_tag_async(pool, tag, max_scrolls=max_scrolls, watermark=watermark)
+        # parquet merge is blocking IO, keep it off the event loop
+        new_count = await asyncio.to_thread(store_tag, tag, scraped_df)
+        save_watermark(tag, scraped_df)
+        return new_count
 
     except Exception as e:
         logging.error(f"Error updating tag '{tag}': {e}", exc_info=True)
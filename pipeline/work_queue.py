@@ -0,0 +1,225 @@
+'''
+Durable local queue between the scrape and extract stages.
+
+Every ``store_tag`` that writes new tweets enqueues a job describing them
+(tag, row count, partitions, oldest post time). Extraction workers claim
+work one tag at a time: a claim takes every pending job of the tag that
+has waited longest, because ``extract`` processes all of a tag's new
+tweets in one go, and no other worker gets that tag until the claim is
+completed, failed or its lease runs out. Jobs of a failed claim go back to
+pending until they have been tried ``QUEUE_MAX_ATTEMPTS`` times.
+
+The queue is one SQLite file (``data/queue/extract.sqlite``) in WAL mode,
+so scrape and extract flows running as separate processes can use it at
+the same time. ``stats`` reports depth and lag per tag.
+'''
+
+from pathlib import Path
+from uuid import uuid4
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from run_metrics import gauge, observe
+
+logger = logging.getLogger(__name__)
+
+from paths import data_dir
+
+queue_path = data_dir / "queue" / "extract.sqlite"
+
+QUEUE_LEASE_SECONDS = int(os.getenv("QUEUE_LEASE_SECONDS", 1800))
+QUEUE_MAX_ATTEMPTS = int(os.getenv("QUEUE_MAX_ATTEMPTS", 3))
+QUEUE_RETENTION_DAYS = int(os.getenv("QUEUE_RETENTION_DAYS", 7))
+
+
+class WorkQueue:
+    def __init__(self, path: Path = queue_path, lease_seconds: int = QUEUE_LEASE_SECONDS,
+                 max_attempts: int = QUEUE_MAX_ATTEMPTS, clock=time.time):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, tag TEXT NOT NULL, rows INTEGER NOT NULL, "
+            "partitions TEXT NOT NULL, oldest_post TEXT, enqueued_at REAL NOT NULL, "
+            "status TEXT NOT NULL DEFAULT 'pending', attempts INTEGER NOT NULL DEFAULT 0, "
+            "claim TEXT, claimed_at REAL, finished_at REAL, error TEXT)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, tag, id)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_claim ON jobs (claim)")
+        self._conn.commit()
+
+    def enqueue(self, tag: str, rows: int, partitions=(), oldest_post=None) -> int:
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "INSERT INTO jobs (tag, rows, partitions, oldest_post, enqueued_at) VALUES (?, ?, ?, ?, ?)",
+                (tag, int(rows), json.dumps(sorted(partitions)), oldest_post, self.clock()),
+            )
+        return cursor.lastrowid
+
+    def _expire_leases(self, now: float):
+        # workers that died mid-claim: retry their jobs, or give up on them
+        self._conn.execute(
+            "UPDATE jobs SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+            "claim = NULL, error = 'lease expired' WHERE status = 'running' AND claimed_at <= ?",
+            (self.max_attempts, now - self.lease_seconds),
+        )
+
+    def claim(self, worker: str = None):
+        """
+        Claim every pending job of the tag that has waited longest and is not
+        being worked on. Returns None when there is nothing to do, else a
+        dict with the claim token, tag, job ids, row count and the time the
+        oldest job was enqueued.
+        """
+        token = f"{worker or 'worker'}-{uuid4().hex[:12]}"
+        with self._lock, self._conn:
+            now = self.clock()
+            self._expire_leases(now)
+            # one statement, so two processes can never claim the same tag
+            self._conn.execute(
+                "UPDATE jobs SET status = 'running', claim = ?, claimed_at = ?, attempts = attempts + 1 "
+                "WHERE status = 'pending' AND tag = ("
+                "  SELECT tag FROM jobs WHERE status = 'pending' "
+                "  AND tag NOT IN (SELECT tag FROM jobs WHERE status = 'running') "
+                "  ORDER BY id LIMIT 1)",
+                (token, now),
+            )
+            rows = self._conn.execute(
+                "SELECT id, tag, rows, enqueued_at FROM jobs WHERE claim = ? ORDER BY id", (token,)
+            ).fetchall()
+        if not rows:
+            return None
+        return {
+            "claim": token,
+            "tag": rows[0][1],
+            "jobs": [row[0] for row in rows],
+            "rows": sum(row[2] for row in rows),
+            "enqueuedAt": min(row[3] for row in rows),
+        }
+
+    def complete(self, claim: dict):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE jobs SET status = 'done', finished_at = ?, error = NULL WHERE claim = ?",
+                (self.clock(), claim["claim"]),
+            )
+
+    def fail(self, claim: dict, error: str):
+        """Release a claim after an error; jobs out of attempts are marked failed."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE jobs SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                "claim = NULL, finished_at = ?, error = ? WHERE claim = ?",
+                (self.max_attempts, self.clock(), str(error)[:1000], claim["claim"]),
+            )
+
+    def stats(self) -> dict:
+        """
+        Queue depth and lag: pending/running/failed job counts and pending
+        rows, overall and per tag, with the age in seconds of the oldest
+        pending job as the lag.
+        """
+        with self._lock:
+            now = self.clock()
+            rows = self._conn.execute(
+                "SELECT tag, status, COUNT(*), SUM(rows), MIN(enqueued_at) FROM jobs "
+                "WHERE status != 'done' GROUP BY tag, status"
+            ).fetchall()
+        totals = {"pending": 0, "running": 0, "failed": 0, "pendingRows": 0, "lagSeconds": 0.0}
+        tags = {}
+        for tag, status, count, row_count, oldest in rows:
+            per_tag = tags.setdefault(tag, {"pending": 0, "running": 0, "failed": 0, "pendingRows": 0,
+                                            "lagSeconds": 0.0})
+            per_tag[status] = count
+            totals[status] += count
+            if status == "pending":
+                per_tag["pendingRows"] = row_count
+                per_tag["lagSeconds"] = round(now - oldest, 1)
+                totals["pendingRows"] += row_count
+                totals["lagSeconds"] = max(totals["lagSeconds"], per_tag["lagSeconds"])
+        return {**totals, "tags": tags}
+
+    def prune(self, retention_days: int = QUEUE_RETENTION_DAYS) -> int:
+        """Delete completed jobs older than ``retention_days``."""
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "DELETE FROM jobs WHERE status = 'done' AND finished_at < ?",
+                (self.clock() - retention_days * 86400,),
+            )
+        return cursor.rowcount
+
+    def close(self):
+        self._conn.close()
+
+
+_queue = None
+
+
+def get_queue() -> WorkQueue:
+    """The shared queue of this process, opened on first use."""
+    global _queue
+    if _queue is None:
+        _queue = WorkQueue()
+    return _queue
+
+
+def report_stats(queue: WorkQueue = None) -> dict:
+    """Log the queue's depth and lag and record them as metrics gauges."""
+    stats = (queue or get_queue()).stats()
+    for status in ("pending", "running", "failed"):
+        gauge("queue_jobs", stats[status], status=status)
+    gauge("queue_lag_seconds", stats["lagSeconds"])
+    for tag, per_tag in stats["tags"].items():
+        gauge("queue_pending_rows", per_tag["pendingRows"], tag=tag)
+        gauge("queue_tag_lag_seconds", per_tag["lagSeconds"], tag=tag)
+    logger.info(
+        f"Extract queue: {stats['pending']} pending jobs ({stats['pendingRows']} tweets), "
+        f"{stats['running']} running, {stats['failed']} failed, lag {stats['lagSeconds']:.0f}s"
+    )
+    return stats
+
+
+def drain(handle, queue: WorkQueue = None, worker: str = None, max_claims: int = None) -> int:
+    """
+    Claim and run ``handle(tag)`` until the queue has no claimable work (or
+    ``max_claims`` claims were made). Returns the number of claims handled.
+    """
+    queue = queue or get_queue()
+    handled = 0
+    while max_claims is None or handled < max_claims:
+        claim = queue.claim(worker)
+        if claim is None:
+            break
+        observe("queue.wait", queue.clock() - claim["enqueuedAt"])
+        logger.info(f"{claim['claim']}: tag {claim['tag']}, {len(claim['jobs'])} jobs, {claim['rows']} tweets")
+        try:
+            handle(claim["tag"])
+        except Exception as e:
+            logger.error(f"{claim['claim']}: tag {claim['tag']} failed: {e}", exc_info=True)
+            queue.fail(claim, repr(e))
+        else:
+            queue.complete(claim)
+        handled += 1
+    return handled
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Inspect the extract queue.")
+    parser.add_argument("command", choices=["stats", "prune"])
+    args = parser.parse_args()
+    if args.command == "stats":
+        print(json.dumps(get_queue().stats(), indent=2, ensure_ascii=False))
+    else:
+        print(f"Pruned {get_queue().prune()} completed jobs")
@@ -2,11 +2,7 @@ from playwright.sync_api import sync_playwright
 from pathlib import Path 
 import os
 
-file_dir = Path(__file__).parent
-if Path('config/').exists():
-    config_dir = Path('config/')
-else:
-    config_dir = file_dir / ".." / "config"
+from paths import config_dir
 
 with sync_playwright() as p:
     browser = p.chromium.launch(headless=False)  # headless=False so you can log in manually
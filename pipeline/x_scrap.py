@@ -6,18 +6,18 @@ For docker volume mount, make sure to run the following command:
 - data
 '''
 
-from playwright.sync_api import sync_playwright
-import time
-from pprint import pprint
+from playwright.async_api import async_playwright
+from contextlib import asynccontextmanager
+import asyncio
 import json
 import os
-from datetime import datetime  # <-- NEW IMPORT
+from datetime import datetime
 from pathlib import Path
 import pandas as pd
+import numpy as np
 import re
 import urllib.parse
 import logging
-import re
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -31,82 +31,158 @@ logger.addHandler(console_handler)
 
 file_dir = Path(__file__).resolve().parent
 
-if Path('data/').exists() and Path('config/').exists():
-    config_dir = Path('config/')
-    data_dir = Path('data/')
-else:
-    data_dir = file_dir/ ".." / "data"
-    config_dir = file_dir / ".." / "config"
+import sys 
+sys.path.append(str(file_dir))
+
+from paths import data_dir, config_dir
 
 tweet_dest_dir = data_dir / "tweets"
 
-import sys 
-sys.path.append(str(file_dir))
+from timeline import TIMELINE_URL_MARKER, parse_search_timeline
+from tag_state import reached_watermark
+from run_metrics import span, inc, timed
 
 
 
 os.makedirs(tweet_dest_dir, exist_ok=True)
-def scrape_all_tweet_texts(url: str, max_scrolls: int = 5):
+
+SCRAPE_CONCURRENCY = int(os.getenv("SCRAPE_CONCURRENCY", 4))
+VIEWPORT = {"width": 1280, "height": 1024}
+# "network" reads SearchTimeline responses, "dom" reads rendered tweet text
+SCRAPE_MODE = os.getenv("SCRAPE_MODE", "network")
+RESPONSE_TIMEOUT = float(os.getenv("SCRAPE_RESPONSE_TIMEOUT", 10))
+
+
+class BrowserPool:
     """
-    Scrapes all tweet texts from a given Twitter URL by scrolling down.
+    Long-lived Chromium shared by concurrent scrapes.
+
+    ``twitter_auth.json`` is read once and ``size`` browser contexts are
+    created from it up front. Each scrape borrows a context, opens a fresh
+    page in it and hands the context back when done, so ``size`` is also the
+    concurrency bound for one worker.
+    """
+
+    def __init__(self, size: int = SCRAPE_CONCURRENCY, headless: bool = True):
+        self.size = max(1, size)
+        self.headless = headless
+        self._playwright = None
+        self._browser = None
+        self._contexts = None
+
+    async def start(self):
+        with open(config_dir / "twitter_auth.json", "r") as f:
+            storage_state = json.load(f)
+
+        self._playwright = await async_playwright().start()
+        self._browser = await self._playwright.chromium.launch(headless=self.headless)
+        self._contexts = asyncio.Queue()
+        for _ in range(self.size):
+            context = await self._browser.new_context(storage_state=storage_state, viewport=VIEWPORT)
+            self._contexts.put_nowait(context)
+        logger.info(f"Browser pool started with {self.size} contexts.")
+        return self
+
+    async def close(self):
+        logger.info("Closing browser pool.")
+        if self._browser is not None:
+            await self._browser.close()
+        if self._playwright is not None:
+            await self._playwright.stop()
+        self._browser = None
+        self._playwright = None
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    @asynccontextmanager
+    async def page(self):
+        """Borrow a context from the pool and yield a new page in it."""
+        context = await self._contexts.get()
+        page = await context.new_page()
+        try:
+            yield page
+        finally:
+            await page.close()
+            self._contexts.put_nowait(context)
+
+
+async def scrape_all_tweet_texts_async(pool: BrowserPool, url: str, max_scrolls: int = 5, watermark: dict = None):
+    """
+    Scrapes all tweet texts from a given Twitter URL by scrolling down,
+    using a page borrowed from ``pool``.
 
     Args:
+        pool: A started BrowserPool.
         url: The Twitter URL to scrape (e.g., a user profile or search results).
         max_scrolls: The maximum number of times to scroll down the page.
+        watermark: Optional scrape watermark (see tag_state.load_watermark).
+            Scrolling stops once a known or too-old tweet is reached, and
+            max_scrolls becomes a safety cap.
 
     Returns:
         A list of dicts with keys: username, tweetText, scrapeTime.
     """
-    all_tweet_entries = []  
+    all_tweet_entries = []
     seen_pairs = set()  # To keep track of unique (username, tweetText)
 
-    with sync_playwright() as p:
-        browser = p.chromium.launch(headless=True)
-        context = browser.new_context(storage_state=os.path.join(config_dir, "twitter_auth.json"), viewport={"width": 1280, "height": 1024})
-        page = context.new_page()
-
+    async with pool.page() as page:
         try:
-            # logger.info(f"Navigating to {url}...")
-            page.goto(url, wait_until='networkidle', timeout=60000)
+            with span("scrape.page_load", mode="dom"):
+                await page.goto(url, wait_until='networkidle', timeout=60000)
             logger.info("Page loaded. Waiting for initial tweets...")
 
             try:
-                page.wait_for_selector("[data-testid='tweet']", timeout=30000)
+                await page.wait_for_selector("[data-testid='tweet']", timeout=30000)
                 logger.info("Initial tweets found.")
             except Exception as e:
                 logger.info(f"Could not find initial tweets: {e}")
                 try:
-                    page.wait_for_selector("[data-testid='tweetText']", timeout=10000)
+                    await page.wait_for_selector("[data-testid='tweetText']", timeout=10000)
                     logger.info("Initial tweet text found.")
                 except Exception as e2:
                     logger.error(f"Could not find initial tweet text either: {e2}")
-                    page.screenshot(path="debug_screenshot_no_tweets.png")
+                    await page.screenshot(path="debug_screenshot_no_tweets.png")
                     return all_tweet_entries
 
             logger.info(f"Scrolling down {max_scrolls} times...")
-            last_height = page.evaluate("document.body.scrollHeight")
+            last_height = await page.evaluate("document.body.scrollHeight")
 
             for i in range(max_scrolls):
                 logger.info(f"Scroll attempt {i+1}/{max_scrolls}")
-                page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
-                time.sleep(3)
-                new_height = page.evaluate("document.body.scrollHeight")
+                with span("scrape.scroll", mode="dom"):
+                    await page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
+                    await asyncio.sleep(3)
+                new_height = await page.evaluate("document.body.scrollHeight")
                 if new_height == last_height:
                     logger.info("Reached bottom of page or no new content loaded.")
                     break
                 last_height = new_height
 
-                tweet_elements = page.query_selector_all("[data-testid='tweetText']")
-                user_names = page.query_selector_all("[data-testid='User-Name']")
+                tweet_elements = await page.query_selector_all("[data-testid='tweetText']")
+                user_names = await page.query_selector_all("[data-testid='User-Name']")
                 now = datetime.now()
+                hit_watermark = False
 
                 for user, text in zip(user_names, tweet_elements):
-                    username = user.text_content()
-                    tweet_text = text.text_content()
+                    username = await user.text_content()
+                    tweet_text = await text.text_content()
                     if username and tweet_text:
                         key = (username, tweet_text)
                         if key not in seen_pairs:
                             seen_pairs.add(key)
+                            raw_time = username.split('·')[-1]
+                            if watermark and reached_watermark(
+                                watermark,
+                                text=tweet_text,
+                                post_time=transform_post_time(raw_time, now),
+                                date_only=is_date_only(raw_time),
+                            ):
+                                hit_watermark = True
+                                continue
                             all_tweet_entries.append({
                                 "username": username,
                                 "tweetText": tweet_text,
@@ -114,15 +190,112 @@ def scrape_all_tweet_texts(url: str, max_scrolls: int = 5):
                             })
 
                 logger.info(f"Total tweets collected so far: {len(all_tweet_entries)}")
+                if hit_watermark:
+                    logger.info("Reached tweets from a previous run, stopping.")
+                    break
 
         except Exception as e:
             logger.error(f"An error occurred during scraping: {e}")
+
+    return all_tweet_entries
+
+
+async def capture_timeline_async(pool: BrowserPool, url: str, max_scrolls: int = 5, watermark: dict = None):
+    """
+    Collects tweets from the SearchTimeline JSON responses the page fetches
+    while scrolling, instead of reading the rendered DOM.
+
+    Every scroll waits only until the next timeline batch arrives (bounded by
+    RESPONSE_TIMEOUT) rather than sleeping a fixed interval.
+
+    Args:
+        pool: A started BrowserPool.
+        url: The search URL to load.
+        max_scrolls: The maximum number of times to scroll down the page.
+        watermark: Optional scrape watermark, as in scrape_all_tweet_texts_async.
+
+    Returns:
+        A list of dicts with keys: tweetId, username, tweetText, postTime, scrapeTime.
+    """
+    all_tweet_entries = []
+    seen_ids = set()
+    batches = asyncio.Queue()
+
+    def on_response(response):
+        if TIMELINE_URL_MARKER in response.url and response.ok:
+            batches.put_nowait(response)
+
+    async with pool.page() as page:
+        page.on("response", on_response)
+        try:
+            with span("scrape.page_load", mode="network"):
+                await page.goto(url, wait_until='domcontentloaded', timeout=60000)
+            logger.info("Page loaded. Waiting for the first timeline batch...")
+
+            for i in range(max_scrolls + 1):
+                try:
+                    with span("scrape.scroll", mode="network"):
+                        response = await asyncio.wait_for(batches.get(), timeout=RESPONSE_TIMEOUT)
+                except asyncio.TimeoutError:
+                    logger.info("No new timeline batch arrived, stopping.")
+                    break
+
+                tweets = parse_search_timeline(await response.json())
+                now = datetime.now()
+                new_count = 0
+                hit_watermark = False
+                for tweet in tweets:
+                    if tweet["tweetId"] in seen_ids:
+                        continue
+                    seen_ids.add(tweet["tweetId"])
+                    if watermark and reached_watermark(
+                        watermark,
+                        tweet_id=tweet["tweetId"],
+                        text=tweet["tweetText"],
+                        post_time=datetime.fromisoformat(tweet["postTime"]),
+                    ):
+                        hit_watermark = True
+                        continue
+                    tweet["scrapeTime"] = now.isoformat()
+                    all_tweet_entries.append(tweet)
+                    new_count += 1
+
+                logger.info(f"Batch {i+1}: {new_count} new tweets, {len(all_tweet_entries)} collected so far")
+                if not tweets:
+                    logger.info("Reached the end of the timeline.")
+                    break
+                if hit_watermark:
+                    logger.info("Reached tweets from a previous run, stopping.")
+                    break
+                if i < max_scrolls:
+                    await page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
+
+        except Exception as e:
+            logger.error(f"An error occurred during capture: {e}")
         finally:
-            logger.info("Closing browser.")
-            browser.close()
+            page.remove_listener("response", on_response)
 
     return all_tweet_entries
 
+
+def scrape_all_tweet_texts(url: str, max_scrolls: int = 5):
+    """
+    Synchronous wrapper around ``scrape_all_tweet_texts_async`` that starts
+    and stops a single-context BrowserPool for one URL.
+    """
+    async def _run():
+        async with BrowserPool(size=1) as pool:
+            return await scrape_all_tweet_texts_async(pool, url, max_scrolls=max_scrolls)
+
+    return asyncio.run(_run())
+
+ISO_TIME_PATTERN = re.compile(r"^\d{4}-\d{2}-\d{2}T")
+# "May 3" / "Jan 5, 2024": the page shows no time of day for these
+DATE_ONLY_PATTERN = re.compile(r"^\s*[A-Z][a-z]{2} \d{1,2}(, \d{4})?\s*$")
+
+def is_date_only(post_time) -> bool:
+    return isinstance(post_time, str) and DATE_ONLY_PATTERN.match(post_time) is not None
+
 def transform_post_time(post_time, scrape_time):
     try:
         twitter_full_time_format = "%b %d, %Y"
@@ -130,6 +303,9 @@ def transform_post_time(post_time, scrape_time):
         
         if post_time_dt is not pd.NaT:
             pass
+        elif ISO_TIME_PATTERN.match(post_time):
+            # exact timestamp from network capture
+            post_time_dt = pd.Timestamp(post_time)
         elif 'h' in post_time:
             hour = int(post_time[:-1])
             post_time_dt =  scrape_time - pd.Timedelta(hours=hour)
@@ -140,9 +316,12 @@ def transform_post_time(post_time, scrape_time):
             second = int(post_time[:-1])
             post_time_dt = scrape_time - pd.Timedelta(seconds=second)
         else:
+            # "Mon DD" is within the past year: the scrape's year unless that
+            # lands after the scrape (or on a Feb 29 it does not have)
             current_year = scrape_time.year
-            post_time = f"{current_year} {post_time}"
-            post_time_dt = pd.to_datetime(post_time, format='%Y %b %d')
+            post_time_dt = pd.to_datetime(f"{current_year} {post_time}", format='%Y %b %d', errors='coerce')
+            if post_time_dt is pd.NaT or post_time_dt > scrape_time:
+                post_time_dt = pd.to_datetime(f"{current_year - 1} {post_time}", format='%Y %b %d')
 
         if post_time_dt > pd.Timestamp.now():
             post_time_dt = post_time_dt - pd.DateOffset(years=1)
@@ -150,40 +329,110 @@ def transform_post_time(post_time, scrape_time):
     except Exception as e:
         logger.error(f"Error transforming post time: {e}")
         return pd.NaT
-      
 
-    
-    
-def scrape_tag(tag:str, max_scrolls:int = 1) -> pd.DataFrame:
-    encoded = urllib.parse.quote(tag, safe='')
-    target_url = f"https://x.com/search?q={encoded}&src=typeahead_click&f=live"
-    
-    tweet_data = scrape_all_tweet_texts(target_url, max_scrolls=max_scrolls)
+RELATIVE_TIME_PATTERN = r"^\s*([+-]?\d+)\s*([hms])$"
+RELATIVE_UNIT_SECONDS = {"h": 3600, "m": 60, "s": 1}
 
+def parse_post_time(post_time_raw: pd.Series, scrape_time: pd.Series) -> pd.Series:
+    """
+    Vectorized ``transform_post_time`` over whole columns.
+
+    The raw strings repeat heavily ("2h", "May 3", ...), so each distinct
+    value is classified and parsed once and the results are broadcast back
+    with the factorize codes. Only the relative ("5h/3m/20s") and "Mon DD"
+    forms depend on the row's scrape time; "Mon DD" takes the year that
+    puts it on or before the scrape.
 
-    logger.info("\n--- Scraped Tweet Data ---")
+    Args:
+        post_time_raw: Raw post time strings as shown by X.
+        scrape_time: Scrape timestamps aligned with ``post_time_raw``.
+
+    Returns:
+        A datetime64 Series with the same index, NaT where unparseable.
+    """
+    scrape_time = pd.to_datetime(pd.Series(scrape_time, index=post_time_raw.index))
+    codes, uniques = pd.factorize(post_time_raw)
+    uniques = pd.Series(uniques, dtype=object)
+    valid = codes >= 0
+    safe_codes = np.where(valid, codes, 0)
+
+    def broadcast(values):
+        return np.asarray(values)[safe_codes]
+
+    is_text = uniques.map(lambda x: isinstance(x, str)).to_numpy(dtype=bool)
+    text = uniques.where(is_text)
+
+    # absolute dates and exact timestamps do not depend on the row
+    absolute = pd.to_datetime(text, format="%b %d, %Y", errors="coerce")
+    is_iso = text.str.match(ISO_TIME_PATTERN.pattern).fillna(False).to_numpy(dtype=bool)
+    iso = pd.to_datetime(text.where(is_iso & absolute.isna().to_numpy()), format="ISO8601", errors="coerce")
+    absolute = absolute.fillna(iso)
+
+    # relative "5h" / "3m" / "20s"; any other string with h/m/s is unparseable
+    relative = text.str.extract(RELATIVE_TIME_PATTERN)
+    offset_seconds = pd.to_numeric(relative[0], errors="coerce") * relative[1].map(RELATIVE_UNIT_SECONDS)
+    has_unit = text.str.contains("[hms]", regex=True).fillna(False).to_numpy(dtype=bool)
+    is_month_day = is_text & ~has_unit & ~is_iso & absolute.isna().to_numpy()
+
+    absolute_rows = pd.Series(broadcast(absolute.to_numpy(dtype="datetime64[ns]")), index=post_time_raw.index)
+    offset_rows = pd.to_timedelta(broadcast(offset_seconds.to_numpy(dtype=float)), unit="s")
+    result = absolute_rows.fillna(scrape_time - offset_rows)
+
+    month_day_rows = valid & broadcast(is_month_day)
+    if month_day_rows.any():
+        rows = post_time_raw[month_day_rows]
+        scraped = scrape_time[month_day_rows]
+        years = scraped.dt.year.astype("Int64")
+        parsed = pd.to_datetime(years.astype(str) + " " + rows, format="%Y %b %d", errors="coerce")
+        last_year = parsed.isna() | (parsed > scraped)
+        parsed[last_year] = pd.to_datetime(
+            (years[last_year] - 1).astype(str) + " " + rows[last_year], format="%Y %b %d", errors="coerce"
+        )
+        result[month_day_rows] = parsed
+
+    result[~valid | ~broadcast(is_text)] = pd.NaT
+
+    future = result > pd.Timestamp.now()
+    if future.any():
+        result[future] = result[future] - pd.DateOffset(years=1)
+    return result
+
+
+def tag_url(tag: str) -> str:
+    encoded = urllib.parse.quote(tag, safe='')
+    return f"https://x.com/search?q={encoded}&src=typeahead_click&f=live"
+
+def build_tweet_df(tweet_data: list, tag: str) -> pd.DataFrame:
+    """
+    Turn raw scraped entries into the tweet store schema
+    (username, tweetText, scrapeTime, tag, postTimeRaw, postTime and partitions).
+    """
     if tweet_data:
-        pprint(tweet_data)
-        logger.info(f"\nTotal unique tweet entries scraped: {len(tweet_data)}")
+        logger.debug(f"Scraped tweet data: {tweet_data}")
+        logger.info(f"Total unique tweet entries scraped: {len(tweet_data)}")
     else:
-        
         logger.info("No tweet texts were scraped.")
         return
-        
+
     tweet_df = pd.DataFrame(tweet_data)
     tweet_df['scrapeTime'] = datetime.now()
     
     clean_tag = lambda x: re.sub(r'[^a-zA-Z0-9ก-๙]', '', x)
     tweet_df['tag'] = tag
     tweet_df['tag'] = tweet_df['tag'].apply(clean_tag)
+    inc("tweets_scraped", len(tweet_df), tag=tweet_df['tag'].iloc[0])
     
 
-    userId = tweet_df['username'].str.split('·').str[0]
-    postTime = tweet_df['username'].str.split('·').str[-1]
+    if 'tweetId' in tweet_df.columns:
+        # network capture already has exact timestamps
+        tweet_df['postTimeRaw'] = tweet_df['postTime']
+    else:
+        userId = tweet_df['username'].str.split('·').str[0]
+        postTime = tweet_df['username'].str.split('·').str[-1]
 
-    tweet_df['postTimeRaw'] = postTime
-    tweet_df['username'] = userId
-    tweet_df['postTime'] = tweet_df.apply(lambda x: transform_post_time(x['postTimeRaw'], x['scrapeTime']), axis=1)
+        tweet_df['postTimeRaw'] = postTime
+        tweet_df['username'] = userId
+    tweet_df['postTime'] = parse_post_time(tweet_df['postTimeRaw'], tweet_df['scrapeTime'])
     tweet_df['postYear'] = tweet_df['postTime'].dt.year
     tweet_df['postMonth'] = tweet_df['postTime'].dt.month
     tweet_df['postDay'] = tweet_df['postTime'].dt.day
@@ -191,6 +440,21 @@ def scrape_tag(tag:str, max_scrolls:int = 1) -> pd.DataFrame:
     
     return tweet_df
 
+@timed("scrape")
+async def scrape_tag_async(pool: BrowserPool, tag: str, max_scrolls: int = 1, mode: str = SCRAPE_MODE, watermark: dict = None) -> pd.DataFrame:
+    if mode == "network":
+        tweet_data = await capture_timeline_async(pool, tag_url(tag), max_scrolls=max_scrolls, watermark=watermark)
+    else:
+        tweet_data = await scrape_all_tweet_texts_async(pool, tag_url(tag), max_scrolls=max_scrolls, watermark=watermark)
+    return build_tweet_df(tweet_data, tag)
+
+def scrape_tag(tag:str, max_scrolls:int = 1, mode: str = SCRAPE_MODE, watermark: dict = None) -> pd.DataFrame:
+    async def _run():
+        async with BrowserPool(size=1) as pool:
+            return await scrape_tag_async(pool, tag, max_scrolls=max_scrolls, mode=mode, watermark=watermark)
+
+    return asyncio.run(_run())
+
 
 if __name__ == "__main__":
     tag = "#DSI321"
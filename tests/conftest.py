@@ -0,0 +1,18 @@
+'''
+The pipeline modules resolve ``data/`` and ``config/`` against the working
+directory when they are imported, so the tests run from a scratch
+directory that has both, set up before any of them is imported.
+'''
+
+from pathlib import Path
+import os
+import sys
+import tempfile
+
+repo_dir = Path(__file__).resolve().parent / ".."
+sys.path.append(str(repo_dir / "pipeline"))
+
+workdir = Path(tempfile.mkdtemp(prefix="dsi321-tests-"))
+(workdir / "data").mkdir()
+(workdir / "config").mkdir()
+os.chdir(workdir)
@@ -0,0 +1,105 @@
+from pathlib import Path
+import json
+import os
+
+import fsspec
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+
+import backfill
+from backfill import checkpoint_path, send_file
+from result_load import repo, branch
+
+day = "postYear=2026/postMonth=3/postDay={}"
+
+
+@pytest.fixture
+def local_fs(tmp_path, monkeypatch):
+    # data/ and the remote <repo>/<branch>/ are both relative to the working directory
+    monkeypatch.chdir(tmp_path)
+    return fsspec.filesystem("file", auto_mkdir=True)
+
+
+def write(rel_path: str, df: pd.DataFrame) -> Path:
+    path = Path("data") / rel_path
+    path.parent.mkdir(parents=True, exist_ok=True)
+    df.to_parquet(path, index=False)
+    return path
+
+
+def remote(rel_path: str) -> Path:
+    return Path(repo) / branch / rel_path
+
+
+def test_modes(local_fs):
+    plain = f"tweets/tag=x/{day.format(1)}/part-a.parquet"
+    write(plain, pd.DataFrame({"tweetText": ["a", "b"]}))
+    result = send_file(plain, fs=local_fs)
+    assert (result["mode"], result["keys"]) == ("copy", [plain])
+    assert remote(plain).read_bytes() == (Path("data") / plain).read_bytes()
+
+    # written before the store stopped keeping the tag inside the files
+    embedded = f"tweets/tag=x/{day.format(2)}/part-b.parquet"
+    write(embedded, pd.DataFrame({"tweetText": ["c"], "tag": ["x"]}))
+    result = send_file(embedded, fs=local_fs)
+    assert (result["mode"], result["keys"]) == ("strip", [embedded])
+    assert pq.read_schema(remote(embedded)).names == ["tweetText"]
+
+    snapshot = "faq/tag=x/part.parquet"
+    write(snapshot, pd.DataFrame({
+        "text": ["q1", "q2", "q3"], "postYear": [2026, 2026, 2026], "postMonth": [3, 3, 4], "postDay": [1, 1, 2],
+    }))
+    result = send_file(snapshot, fs=local_fs)
+    assert result["mode"] == "reencode"
+    assert sorted(result["keys"]) == [
+        "faq/tag=x/postYear=2026/postMonth=3/postDay=1/part-0.parquet",
+        "faq/tag=x/postYear=2026/postMonth=4/postDay=2/part-0.parquet",
+    ]
+    faq = pd.read_parquet(remote("faq"))
+    assert sorted(faq["text"]) == ["q1", "q2", "q3"]
+    assert set(faq["tag"].astype(str)) == {"x"}
+
+    counts = "faq_agg/x.parquet"
+    write(counts, pd.DataFrame({"topic": ["t"], "count": [3]}))
+    assert send_file(counts, fs=local_fs)["mode"] == "copy"
+
+    # the whole collection reads back as one hive dataset
+    tweets = pd.read_parquet(remote("tweets"))
+    assert sorted(tweets["tweetText"]) == ["a", "b", "c"]
+
+
+def test_reencode_needs_every_partition_value(local_fs):
+    write("faq/tag=x/part.parquet", pd.DataFrame({"text": ["q"]}))
+    with pytest.raises(ValueError):
+        send_file("faq/tag=x/part.parquet", fs=local_fs)
+
+
+def test_checkpoint_resume(local_fs):
+    paths = [write(f"tweets/tag=x/{day.format(d)}/part-{d}.parquet", pd.DataFrame({"tweetText": [str(d)]}))
+             for d in range(1, 5)]
+    # an earlier run finished the first file and crashed while writing the next line
+    stat = paths[0].stat()
+    checkpoint_path("tweets").parent.mkdir(parents=True, exist_ok=True)
+    checkpoint_path("tweets").write_text(
+        json.dumps({"path": paths[0].relative_to("data").as_posix(), "size": stat.st_size,
+                    "mtime_ns": stat.st_mtime_ns}) + "\n" + '{"path": "tweets/tag=x/po'
+    )
+
+    summary = backfill.backfill("tweets", max_workers=2, fs=local_fs)
+    assert (summary["copy"], summary["skipped"]) == (3, 1)
+    assert not remote(paths[0].relative_to("data")).exists()
+    assert all(remote(p.relative_to("data")).exists() for p in paths[1:])
+
+    summary = backfill.backfill("tweets", max_workers=2, fs=local_fs)
+    assert (summary["copy"], summary["skipped"]) == (0, 4)
+
+    # a file that changed since is sent again
+    stat = paths[2].stat()
+    os.utime(paths[2], ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    summary = backfill.backfill("tweets", max_workers=2, fs=local_fs)
+    assert (summary["copy"], summary["skipped"]) == (1, 3)
+
+    summary = backfill.backfill("tweets", max_workers=2, reset=True, fs=local_fs)
+    assert (summary["copy"], summary["skipped"]) == (4, 0)
+    assert remote(paths[0].relative_to("data")).exists()
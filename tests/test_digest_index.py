@@ -0,0 +1,111 @@
+from hashlib import sha256
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import digest_index
+import extraction
+from digest_index import DIGEST_DTYPE, BloomFilter, DigestIndex, text_digests
+
+
+def random_digests(n: int, seed: int) -> np.ndarray:
+    return np.random.default_rng(seed).integers(0, 2 ** 64, n, dtype=np.uint64).astype(DIGEST_DTYPE)
+
+
+def test_text_digests_are_stable():
+    digests = text_digests(["ลงทะเบียนยังไงคะ", "hello", "ลงทะเบียนยังไงคะ"])
+    assert digests.dtype == DIGEST_DTYPE
+    assert digests[0] == digests[2] != digests[1]
+    # the key is fixed, so digests written by earlier runs keep matching
+    assert text_digests(["hello"])[0] == pd.util.hash_array(np.array(["hello"], dtype=object),
+                                                             hash_key=digest_index.HASH_KEY)[0]
+
+
+def test_bloom_filter_has_no_false_negatives():
+    digests = random_digests(5000, seed=0)
+    bloom = BloomFilter(capacity=len(digests))
+    bloom.add(digests)
+    assert bloom.might_contain(digests).all()
+    assert bloom.might_contain(np.zeros(0, dtype=DIGEST_DTYPE)).shape == (0,)
+
+
+def test_bloom_filter_false_positive_rate():
+    # 10 bits and 7 hashes per key: (1 - e^-0.7)^7, about 0.8%
+    for n in (1000, 50_000):
+        bloom = BloomFilter(capacity=n)
+        bloom.add(random_digests(n, seed=1))
+        rate = bloom.might_contain(random_digests(200_000, seed=2)).mean()
+        assert rate < 0.0125, (n, rate)
+
+
+def test_membership(tmp_path):
+    index = DigestIndex(tmp_path / "tag")
+    assert not index.exists and len(index) == 0
+    stored, others = random_digests(3000, seed=3), random_digests(3000, seed=4)
+    assert index.append(stored[:2000]) == 2000
+    index.compact()
+    assert index.append(stored) == 1000
+
+    # 2000 in the sorted file, 1000 in the log
+    assert len(index) == 3000
+    assert index.contains(stored).all()
+    assert not index.contains(others).any()
+    assert index.contains(np.concatenate([others[:5], stored[:5]])).tolist() == [False] * 5 + [True] * 5
+    assert index.append(stored) == 0
+
+
+def test_membership_without_bloom_filter(tmp_path):
+    index = DigestIndex(tmp_path / "tag", use_bloom=False)
+    index.append(np.array([1, 5, 9], dtype=DIGEST_DTYPE))
+    index.compact()
+    index.append(np.array([3], dtype=DIGEST_DTYPE))
+    # below, between and above the sorted values
+    assert index.contains(np.array([0, 1, 3, 4, 9, 10], dtype=DIGEST_DTYPE)).tolist() == \
+        [False, True, True, False, True, False]
+
+
+def test_persistence_round_trip(tmp_path, monkeypatch):
+    monkeypatch.setattr(digest_index, "COMPACT_LOG_SIZE", 1000)
+    digests = random_digests(2500, seed=5)
+    index = DigestIndex(tmp_path / "tag")
+    for chunk in np.array_split(digests, 5):
+        index.append(chunk)
+    # the log was folded into the sorted file once it reached 1000
+    assert Path(f"{tmp_path / 'tag'}.u64").stat().st_size >= 1000 * DIGEST_DTYPE.itemsize
+
+    reopened = DigestIndex(tmp_path / "tag")
+    assert len(reopened) == 2500
+    assert reopened.contains(digests).all()
+    assert np.array_equal(np.asarray(reopened._sorted), np.sort(np.asarray(reopened._sorted)))
+
+
+def test_torn_log_append_is_ignored(tmp_path):
+    index = DigestIndex(tmp_path / "tag")
+    index.append(np.array([7, 8], dtype=DIGEST_DTYPE))
+    with open(index.log_path, "ab") as f:
+        f.write(b"\x01\x02\x03")
+    reopened = DigestIndex(tmp_path / "tag")
+    assert len(reopened) == 2
+    assert reopened.contains(np.array([7, 8], dtype=DIGEST_DTYPE)).all()
+
+
+def test_migration_from_legacy_hash_file(monkeypatch):
+    tag = "legacy"
+    texts = ["ทำยังไงคะ", "สอบวันไหน", "ไม่เคยส่ง", "ทำยังไงคะ"]
+    tweets_path = extraction.tweets_dir / f"tag={tag}" / "postYear=2026" / "postMonth=3" / "postDay=1" / "part-0.parquet"
+    tweets_path.parent.mkdir(parents=True, exist_ok=True)
+    pd.DataFrame({"tweetText": texts}).to_parquet(tweets_path, index=False)
+    legacy_path = extraction.hash_tag_dir / f"{tag}.txt"
+    legacy_path.parent.mkdir(parents=True, exist_ok=True)
+    legacy_path.write_text("".join(sha256(t.encode()).hexdigest() + "\n" for t in texts[:2]))
+
+    index = extraction.recall_processed(tag)
+    assert index.contains(text_digests(texts)).tolist() == [True, True, False, True]
+    assert not legacy_path.exists()
+    assert legacy_path.with_suffix(".txt.migrated").exists()
+
+    # the text file is read once, later loads only open the index
+    monkeypatch.setattr(extraction, "_migrate_legacy_hashes", lambda *args: pytest.fail("migrated twice"))
+    assert len(extraction.recall_processed(tag)) == 2
@@ -0,0 +1,78 @@
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+import extraction
+import prefilter
+from extraction_log import ExtractionLog
+from fake_genai import FakeClient
+from llm_engine import RateLimiter
+from topic_agg import read_topic_counts
+
+data_dir = Path("data")
+
+
+@pytest.fixture
+def offline(monkeypatch):
+    monkeypatch.setattr(extraction, "rate_limiter", RateLimiter(rpm=10 ** 9, tpm=10 ** 12))
+    monkeypatch.setattr(prefilter, "PREFILTER_ENABLED", False)
+    extraction.set_client(FakeClient(faq_ratio=1.0))
+
+
+def store_tweets(tag: str, start: int, rows: int, day: str):
+    post_time = pd.Timestamp(day) + pd.to_timedelta(range(rows), unit="min")
+    df = pd.DataFrame({
+        "tweetText": [f"ลงทะเบียนเรียนต้องทำยังไงคะ ข้อ {i}" for i in range(start, start + rows)],
+        "postTime": post_time,
+        "scrapeTime": pd.Timestamp.now().floor("s"),
+        "postYear": post_time.year,
+        "postMonth": post_time.month,
+        "postDay": post_time.day,
+    })
+    df.to_parquet(data_dir / "tweets" / f"tag={tag}", partition_cols=["postYear", "postMonth", "postDay"])
+
+
+def stored_topic_assignments(tag: str) -> int:
+    return len(extraction.read_faq(tag, columns=["topic"])["topic"].explode().dropna())
+
+
+def counted_topic_assignments(tag: str) -> int:
+    return int(read_topic_counts(extraction.faq_agg_dir, tag)["count"].sum())
+
+
+@pytest.mark.parametrize("step", ["update_topic_counts", "update_hash", "advance_extraction_watermark"])
+def test_run_after_crash_during_commit_keeps_counts(offline, monkeypatch, step):
+    tag = f"crash{step.replace('_', '')}"
+    store_tweets(tag, 0, 40, "2026-01-05")
+
+    def crash(*args, **kwargs):
+        raise RuntimeError("crash")
+
+    with monkeypatch.context() as m:
+        m.setattr(extraction, step, crash)
+        with pytest.raises(RuntimeError):
+            extraction.extract(tag)
+    interrupted = ExtractionLog.open(tag)
+    assert interrupted.committed_keys is not None
+
+    store_tweets(tag, 40, 25, "2026-01-06")
+    extraction.extract(tag)
+
+    assert len(extraction.read_faq(tag)) == 65
+    assert counted_topic_assignments(tag) == stored_topic_assignments(tag) > 0
+    assert extraction.get_tweet_data(tag).empty
+    assert not interrupted.path.exists() and not interrupted.faq_path.exists()
+
+
+def test_interrupted_commit_is_replayed_without_new_tweets(offline, monkeypatch):
+    tag = "crashnonew"
+    store_tweets(tag, 0, 30, "2026-01-05")
+    with monkeypatch.context() as m:
+        m.setattr(extraction, "update_hash", lambda *args, **kwargs: (_ for _ in ()).throw(RuntimeError("crash")))
+        with pytest.raises(RuntimeError):
+            extraction.extract(tag)
+
+    assert extraction.extract(tag) is None
+    assert counted_topic_assignments(tag) == stored_topic_assignments(tag) > 0
+    assert extraction.get_tweet_data(tag).empty
@@ -0,0 +1,191 @@
+'''
+``sync_to_lakefs`` against a local directory standing in for the LakeFS S3
+gateway: ``<repo>/<branch>/<path>`` under the test's working directory,
+with a stub ``lakefs.Repository`` whose branches are copies of those
+directories.
+'''
+
+from pathlib import Path
+from types import SimpleNamespace
+import shutil
+
+import fsspec
+import pandas as pd
+import pytest
+from lakefs.exceptions import NotFoundException
+
+import lakefs_sync
+import result_load
+from result_load import repo, branch
+
+
+class StubBranch:
+    def __init__(self, lake, name):
+        self.lake = lake
+        self.name = name
+        self.path = Path(repo) / name
+
+    def delete(self):
+        if not self.path.exists():
+            raise NotFoundException(404, "branch not found")
+        shutil.rmtree(self.path)
+
+    def create(self, source_reference, exist_ok=False):
+        if self.path.exists():
+            if not exist_ok:
+                raise AssertionError(f"branch {self.name} exists")
+            return self
+        source = Path(repo) / source_reference
+        if source.exists():
+            shutil.copytree(source, self.path)
+        else:
+            self.path.mkdir(parents=True)
+        return self
+
+    def commit(self, message, metadata=None):
+        self.lake.commits.append({"branch": self.name, "message": message, "metadata": metadata})
+        commit_id = f"c{len(self.lake.commits)}"
+        return SimpleNamespace(get_commit=lambda: SimpleNamespace(id=commit_id))
+
+    def merge_into(self, destination):
+        shutil.rmtree(destination.path, ignore_errors=True)
+        shutil.copytree(self.path, destination.path)
+        self.lake.merges.append((self.name, destination.name))
+        return "merged"
+
+
+class StubLakeFS:
+    def __init__(self):
+        self.commits = []
+        self.merges = []
+
+    def Repository(self, name, client=None):
+        assert name == repo
+        return SimpleNamespace(branch=lambda branch_name: StubBranch(self, branch_name))
+
+
+@pytest.fixture
+def local_lakefs(tmp_path, monkeypatch):
+    # data/, the manifest and the remote are all relative to the working directory
+    monkeypatch.chdir(tmp_path)
+    lake = StubLakeFS()
+    monkeypatch.setattr(lakefs_sync.lakefs, "Repository", lake.Repository)
+    monkeypatch.setattr(lakefs_sync, "lakefs_client", lambda: None)
+    fs = fsspec.filesystem("file", auto_mkdir=True)
+    result_load.set_fs(fs)
+    yield SimpleNamespace(fs=fs, lake=lake)
+    result_load.set_fs(None)
+
+
+def write_tweets(tag, day, texts, name="part-0.parquet"):
+    path = Path("data/tweets") / f"tag={tag}" / f"postYear=2026/postMonth=3/postDay={day}" / name
+    path.parent.mkdir(parents=True, exist_ok=True)
+    pd.DataFrame({"tweetText": texts}).to_parquet(path, index=False)
+    return path
+
+
+def remote(target=branch, collection="tweets"):
+    return pd.read_parquet(Path(repo) / target / collection)
+
+
+def remote_files(target=branch):
+    root = Path(repo) / target
+    return sorted(p.relative_to(root).as_posix() for p in root.rglob("*") if p.is_file())
+
+
+def test_diff_manifest():
+    previous = {"a": {"md5": "1"}, "b": {"md5": "2"}, "c": {"md5": "3"}}
+    current = {"a": {"md5": "1"}, "b": {"md5": "9"}, "d": {"md5": "4"}}
+    assert lakefs_sync.diff_manifest(previous, current) == (["b", "d"], ["c"])
+    assert lakefs_sync.diff_manifest({}, {}) == ([], [])
+
+
+def test_scan_local_reuses_md5_of_unchanged_files(local_lakefs, monkeypatch):
+    path = write_tweets("x", 1, ["a"])
+    first = lakefs_sync.scan_local(("tweets",))
+    rel_path = path.relative_to("data").as_posix()
+    assert first[rel_path]["md5"] == lakefs_sync.file_md5(path)
+
+    monkeypatch.setattr(lakefs_sync, "file_md5", lambda path: pytest.fail("md5 recomputed"))
+    assert lakefs_sync.scan_local(("tweets",), first) == first
+
+
+def test_incremental_sync_uploads_changes_and_deletes(local_lakefs):
+    fs = local_lakefs.fs
+    write_tweets("x", 1, ["a", "b"])
+    stale = write_tweets("x", 2, ["c"])
+    summary = lakefs_sync.sync_to_lakefs(collections=("tweets",), fs=fs, commit=False)
+    assert summary["uploaded"] == 2 and summary["deleted"] == 0
+    assert sorted(remote()["tweetText"]) == ["a", "b", "c"]
+
+    assert lakefs_sync.sync_to_lakefs(collections=("tweets",), fs=fs, commit=False)["uploaded"] == 0
+
+    stale.unlink()
+    write_tweets("x", 3, ["d"])
+    summary = lakefs_sync.sync_to_lakefs(collections=("tweets",), fs=fs, commit=False)
+    assert (summary["uploaded"], summary["deleted"]) == (1, 1)
+    assert sorted(remote()["tweetText"]) == ["a", "b", "d"]
+
+
+def test_first_sync_replaces_legacy_objects_only(local_lakefs):
+    fs = local_lakefs.fs
+    df = pd.DataFrame({"tweetText": ["a", "b"], "tag": ["x", "x"], "postYear": 2026, "postMonth": 3, "postDay": 1})
+    # what the old full upload wrote, under pyarrow's own file names
+    result_load.to_lakefs(df, "tweets")
+    untouched = Path(repo) / branch / "reports" / "summary.parquet"
+    untouched.parent.mkdir(parents=True)
+    untouched.write_bytes(b"not synced")
+
+    kept = write_tweets("x", 1, ["a", "b"])
+    summary = lakefs_sync.sync_to_lakefs(collections=("tweets",), fs=fs, commit=False)
+
+    assert summary["uploaded"] == 1 and summary["deleted"] == 1
+    assert sorted(remote()["tweetText"]) == ["a", "b"]
+    assert remote_files() == ["reports/summary.parquet", kept.relative_to("data").as_posix()]
+
+    # with a manifest nothing unknown is removed any more
+    extra = Path(repo) / branch / "tweets" / "tag=y" / "postYear=2026" / "postMonth=3" / "postDay=1" / "other.parquet"
+    extra.parent.mkdir(parents=True)
+    pd.DataFrame({"tweetText": ["z"]}).to_parquet(extra)
+    write_tweets("x", 2, ["c"])
+    lakefs_sync.sync_to_lakefs(collections=("tweets",), fs=fs, commit=False)
+    assert extra.exists()
+
+
+def test_commit_merges_a_fresh_staging_branch(local_lakefs):
+    fs, lake = local_lakefs.fs, local_lakefs.lake
+    write_tweets("x", 1, ["a"])
+    summary = lakefs_sync.sync_to_lakefs(collections=("tweets",), fs=fs)
+    assert summary["commit"] == "c1"
+    assert lake.merges == [(lakefs_sync.staging_branch, branch)]
+    assert lake.commits[0]["metadata"] == {"uploaded": "1", "deleted": "0"}
+    assert list(remote()["tweetText"]) == ["a"]
+
+    # a failed run left an object on staging that main never got
+    leftover = Path(repo) / lakefs_sync.staging_branch / "tweets" / "tag=x" / "postYear=2026" / "postMonth=3" \
+        / "postDay=9" / "failed-run.parquet"
+    leftover.parent.mkdir(parents=True, exist_ok=True)
+    pd.DataFrame({"tweetText": ["from a failed run"]}).to_parquet(leftover)
+
+    write_tweets("x", 2, ["b"])
+    summary = lakefs_sync.sync_to_lakefs(collections=("tweets",), fs=fs)
+    assert summary["commit"] == "c2"
+    assert sorted(remote()["tweetText"]) == ["a", "b"]
+
+
+def test_failed_merge_is_retried(local_lakefs, monkeypatch):
+    fs = local_lakefs.fs
+    write_tweets("x", 1, ["a"])
+
+    def fail(self, destination):
+        raise RuntimeError("merge failed")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(StubBranch, "merge_into", fail)
+        with pytest.raises(RuntimeError):
+            lakefs_sync.sync_to_lakefs(collections=("tweets",), fs=fs)
+    assert lakefs_sync.load_manifest() == {}
+
+    summary = lakefs_sync.sync_to_lakefs(collections=("tweets",), fs=fs)
+    assert summary["uploaded"] == 1
+    assert list(remote()["tweetText"]) == ["a"]
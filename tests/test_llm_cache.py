@@ -0,0 +1,100 @@
+from types import SimpleNamespace
+
+import pytest
+
+import extraction
+import llm_cache
+from fake_genai import FakeClient
+from llm_cache import ResponseCache, prompt_version
+from llm_engine import RateLimiter
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        self.now += 1
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(llm_cache, "time", SimpleNamespace(time=clock))
+    return clock
+
+
+def test_key_is_stable():
+    key = ResponseCache.key("gemini-2.0-flash", "abc123", [3, 1, 2])
+    # the same on every run and machine, or a deploy would miss every cached batch
+    assert key == "05bdb518647b1ce03d7e4edba61b15b5f9ff9e814026d7677396f97c086e9c5f"
+    assert ResponseCache.key("gemini-2.0-flash", "abc123", ["2", "3", "1"]) == key
+    assert ResponseCache.key("gemini-2.5-flash", "abc123", [3, 1, 2]) != key
+    assert ResponseCache.key("gemini-2.0-flash", "abc124", [3, 1, 2]) != key
+    assert ResponseCache.key("gemini-2.0-flash", "abc123", [3, 1]) != key
+
+
+def test_prompt_version():
+    assert prompt_version("instruction", "template") == prompt_version("instruction", "template")
+    assert len(prompt_version("instruction", "template")) == 12
+    assert prompt_version("instruction", "template") != prompt_version("instruction", "template ")
+    assert prompt_version("ab", "c") != prompt_version("a", "bc")
+
+
+def test_hit_and_miss(tmp_path):
+    cache = ResponseCache(tmp_path / "llm.sqlite")
+    key = ResponseCache.key("m", "v", [1, 2])
+    assert cache.get(key) is None
+    value = {"faq": [{"hash": 1, "topic": ["ลงทะเบียน"]}]}
+    cache.put(key, value)
+    assert cache.get(key) == value
+    assert cache.get(ResponseCache.key("m", "v", [1])) is None
+    cache.close()
+
+    reopened = ResponseCache(tmp_path / "llm.sqlite")
+    assert reopened.get(key) == value
+    reopened.close()
+
+
+def test_evicts_least_recently_used(tmp_path, clock):
+    value = {"faq": ["x" * 90]}
+    size = len(llm_cache.json.dumps(value, ensure_ascii=False).encode())
+    cache = ResponseCache(tmp_path / "llm.sqlite", max_bytes=int(size * 3.5))
+    for key in "abc":
+        cache.put(key, value)
+    # reading "a" makes "b" the least recently used
+    assert cache.get("a") == value
+    cache.put("d", value)
+    assert cache.get("b") is None
+    assert all(cache.get(key) == value for key in "acd")
+
+    cache.put("e", value)
+    assert cache.get("a") is None
+    total = cache._conn.execute("SELECT SUM(size) FROM responses").fetchone()[0]
+    assert total <= cache.max_bytes
+    cache.close()
+
+
+def test_extraction_answers_repeated_batches_from_the_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(extraction, "response_cache", ResponseCache(tmp_path / "llm.sqlite"))
+    monkeypatch.setattr(extraction, "rate_limiter", RateLimiter(rpm=10 ** 9, tpm=10 ** 12))
+    client = FakeClient(faq_ratio=1.0)
+    extraction.set_client(client)
+    rows = [{"index": i, "hash": 100 + i, "tweetText": f"ลงทะเบียนเรียน ข้อ {i} ทำยังไงคะ"} for i in range(3)]
+
+    response, hit = extraction.cached_topic_extraction(rows)
+    assert not hit and client.calls == 1
+    assert sorted(item["index"] for item in response["faq"]) == [0, 1, 2]
+
+    # a later run gives the same tweets other indexes
+    later = [{**row, "index": 10 + i} for i, row in enumerate(reversed(rows))]
+    cached, hit = extraction.cached_topic_extraction(later)
+    assert hit and client.calls == 1
+    topics = {item["index"]: item["topic"] for item in response["faq"]}
+    assert {item["index"]: item["topic"] for item in cached["faq"]} == {
+        10 + i: topics[row["index"]] for i, row in enumerate(reversed(rows))
+    }
+
+    _, hit = extraction.cached_topic_extraction(rows[:2])
+    assert not hit and client.calls == 2
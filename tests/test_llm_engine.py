@@ -0,0 +1,150 @@
+import threading
+
+import pytest
+
+from fake_genai import FakeAPIError, FakeClient
+from llm_engine import RateLimiter, call_with_backoff, run_batches
+
+
+class FakeClock:
+    """Time that only moves when somebody sleeps."""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def test_rpm_waits_for_the_window():
+    clock = FakeClock()
+    limiter = RateLimiter(rpm=3, tpm=10 ** 9, clock=clock, sleep=clock.sleep)
+    for _ in range(3):
+        limiter.acquire()
+    assert clock.now == 0
+
+    limiter.acquire()
+    # the fourth request goes once the first one leaves the one-minute window
+    assert clock.now == pytest.approx(60)
+    clock.now += 1
+    limiter.acquire()
+    limiter.acquire()
+    assert clock.now == pytest.approx(61)
+
+
+def test_tpm_waits_for_tokens():
+    clock = FakeClock()
+    limiter = RateLimiter(rpm=100, tpm=1000, clock=clock, sleep=clock.sleep)
+    limiter.acquire(600)
+    clock.now = 10
+    limiter.acquire(400)
+    assert clock.now == 10
+
+    limiter.acquire(1)
+    assert clock.now == pytest.approx(60)
+    # only the first request has left the window, 400 + 1 are still in it
+    limiter.acquire(599)
+    assert clock.now == pytest.approx(60)
+    limiter.acquire(1)
+    assert clock.now == pytest.approx(70)
+
+
+def test_request_larger_than_budget_does_not_wait_forever():
+    clock = FakeClock()
+    limiter = RateLimiter(rpm=10, tpm=100, clock=clock, sleep=clock.sleep)
+    limiter.acquire(10_000)
+    assert clock.now == 0
+
+
+def flaky(codes):
+    """A call that raises ``FakeAPIError`` with each of ``codes`` in turn, then succeeds."""
+    calls = []
+
+    def call(value):
+        calls.append(value)
+        if len(calls) <= len(codes):
+            raise FakeAPIError(codes[len(calls) - 1])
+        return value * 2
+
+    return call, calls
+
+
+@pytest.mark.parametrize("code", [429, 500, 503])
+def test_backoff_retries_rate_limits_and_server_errors(code):
+    clock = FakeClock()
+    call, calls = flaky([code, code, code])
+    assert call_with_backoff(call, 21, max_retries=5, base_delay=2.0, sleep=clock.sleep) == 42
+    assert len(calls) == 4
+    # jittered exponential backoff: base * 2**attempt * [0.5, 1]
+    for attempt, delay in enumerate(clock.sleeps):
+        assert 2.0 * 2 ** attempt * 0.5 <= delay <= 2.0 * 2 ** attempt
+
+
+def test_backoff_delay_is_capped():
+    clock = FakeClock()
+    call, _ = flaky([429] * 6)
+    call_with_backoff(call, 1, max_retries=6, base_delay=2.0, max_delay=10.0, sleep=clock.sleep)
+    assert max(clock.sleeps) <= 10.0
+
+
+def test_backoff_gives_up_after_max_retries():
+    clock = FakeClock()
+    call, calls = flaky([503] * 10)
+    with pytest.raises(FakeAPIError) as error:
+        call_with_backoff(call, 1, max_retries=3, sleep=clock.sleep)
+    assert error.value.code == 503
+    assert len(calls) == 4
+    assert len(clock.sleeps) == 3
+
+
+def test_backoff_does_not_retry_client_errors():
+    clock = FakeClock()
+    call, calls = flaky([400])
+    with pytest.raises(FakeAPIError):
+        call_with_backoff(call, 1, sleep=clock.sleep)
+    assert len(calls) == 1
+    assert clock.sleeps == []
+
+
+def test_backoff_against_the_fake_client():
+    clock = FakeClock()
+    client = FakeClient(error_rate=1.0)
+    with pytest.raises(FakeAPIError):
+        call_with_backoff(client.models.generate_content, model="m", contents="1: hi", max_retries=2,
+                          sleep=clock.sleep)
+    assert client.calls == 3
+
+    client = FakeClient(faq_ratio=1.0)
+    response = call_with_backoff(client.models.generate_content, model="m", contents="1: hi", sleep=clock.sleep)
+    assert '"index": 1' in response.text
+
+
+def test_run_batches_keeps_batch_order_when_calls_finish_out_of_order():
+    batches = [[i] for i in range(5)]
+    done = [threading.Event() for _ in batches]
+    finished = []
+
+    def call(batch):
+        i = batch[0]
+        # every batch waits for the one after it, so they finish last to first
+        if i + 1 < len(batches):
+            assert done[i + 1].wait(timeout=5)
+        finished.append(i)
+        done[i].set()
+        return {"batch": i, "faq": [f"answer {i}"]}
+
+    results = run_batches(batches, call, max_workers=len(batches))
+    assert finished == [4, 3, 2, 1, 0]
+    assert [r["batch"] for r in results] == [0, 1, 2, 3, 4]
+    assert [faq for r in results for faq in r["faq"]] == [f"answer {i}" for i in range(5)]
+
+
+def test_run_batches_single_worker_runs_in_order():
+    order = []
+    results = run_batches([[1], [2], [3]], lambda batch: order.append(batch[0]) or batch[0], max_workers=1)
+    assert order == results == [1, 2, 3]
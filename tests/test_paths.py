@@ -0,0 +1,22 @@
+from pathlib import Path
+
+import extraction
+import paths
+import store
+import tag_state
+import work_queue
+
+
+def test_modules_share_the_working_directory_data():
+    # conftest runs the tests from a directory that has data/ and config/
+    assert paths.data_dir == Path("data")
+    assert paths.config_dir == Path("config")
+    for module in (extraction, store, tag_state, work_queue):
+        assert module.data_dir == paths.data_dir
+
+
+def test_resolve_dir_falls_back_to_the_repository(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    assert paths.resolve_dir("data") == paths.root_dir / "data"
+    (tmp_path / "data").mkdir()
+    assert paths.resolve_dir("data") == Path("data")
@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+# x_scrap drives the browser, its parsers come with it
+pytest.importorskip("playwright")
+from x_scrap import is_date_only, parse_post_time, transform_post_time
+
+T = pd.Timestamp
+
+# (raw, scrape time, expected post time)
+CASES = [
+    ("5h", T("2025-06-10 12:00"), T("2025-06-10 07:00")),
+    ("12m", T("2025-06-10 12:00"), T("2025-06-10 11:48")),
+    ("30s", T("2025-06-10 12:00"), T("2025-06-10 11:59:30")),
+    ("25h", T("2025-06-10 12:00"), T("2025-06-09 11:00")),
+    ("Jun 3", T("2025-06-10 12:00"), T("2025-06-03")),
+    ("Jun 10", T("2025-06-10 12:00"), T("2025-06-10")),
+    # "Mon DD" after the scrape date is from the year before
+    ("Dec 31", T("2025-01-02 08:00"), T("2024-12-31")),
+    ("Jan 1", T("2025-01-02 08:00"), T("2025-01-01")),
+    ("Jun 11", T("2025-06-10 12:00"), T("2024-06-11")),
+    ("Feb 29", T("2024-03-01 09:00"), T("2024-02-29")),
+    ("Feb 29", T("2025-01-15 09:00"), T("2024-02-29")),
+    ("Jan 5, 2024", T("2025-06-10 12:00"), T("2024-01-05")),
+    ("Feb 29, 2024", T("2025-06-10 12:00"), T("2024-02-29")),
+    ("2025-06-09T22:15:30", T("2025-06-10 12:00"), T("2025-06-09 22:15:30")),
+    ("yesterday", T("2025-06-10 12:00"), pd.NaT),
+    ("Foo 12", T("2025-06-10 12:00"), pd.NaT),
+    ("5 hours", T("2025-06-10 12:00"), pd.NaT),
+    ("", T("2025-06-10 12:00"), pd.NaT),
+    (np.nan, T("2025-06-10 12:00"), pd.NaT),
+    (None, T("2025-06-10 12:00"), pd.NaT),
+]
+
+
+@pytest.mark.parametrize("raw, scrape_time, expected", CASES)
+def test_transform_post_time(raw, scrape_time, expected):
+    result = transform_post_time(raw, scrape_time)
+    assert (pd.isna(result) and pd.isna(expected)) or result == expected
+
+
+def test_vectorized_parser_matches_row_wise():
+    raw = pd.Series([c[0] for c in CASES], dtype=object)
+    scrape_time = pd.Series([c[1] for c in CASES])
+    row_wise = pd.to_datetime(pd.Series([transform_post_time(r, s) for r, s in zip(raw, scrape_time)]))
+    vectorized = parse_post_time(raw, scrape_time)
+    pd.testing.assert_series_equal(vectorized, row_wise, check_names=False, check_dtype=False)
+    pd.testing.assert_series_equal(vectorized, pd.to_datetime(pd.Series([c[2] for c in CASES])),
+                                   check_names=False, check_dtype=False)
+
+
+def test_vectorized_parser_keeps_the_index():
+    raw = pd.Series(["5h", "5h", "Mar 1"], index=[10, 3, 7])
+    scrape_time = pd.Series([T("2025-06-10 12:00"), T("2025-06-10 13:00"), T("2025-06-10 12:00")], index=[10, 3, 7])
+    result = parse_post_time(raw, scrape_time)
+    assert result.index.tolist() == [10, 3, 7]
+    assert result.tolist() == [T("2025-06-10 07:00"), T("2025-06-10 08:00"), T("2025-03-01")]
+
+
+def test_is_date_only():
+    assert is_date_only("Mar 5") and is_date_only("Dec 31, 2024")
+    assert not any(is_date_only(raw) for raw in ["5h", "12m", "2025-06-09T22:15:30", "yesterday", np.nan, None])
@@ -0,0 +1,109 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import prefilter
+from prefilter import (
+    PrefilterModel, calibrate_threshold, near_duplicate_key, rule_reasons, train,
+)
+
+
+@pytest.fixture(autouse=True)
+def enabled(monkeypatch):
+    monkeypatch.setattr(prefilter, "PREFILTER_ENABLED", True)
+    monkeypatch.setattr(prefilter, "PREFILTER_THRESHOLD", None)
+
+
+def tweets(*texts) -> pd.DataFrame:
+    return pd.DataFrame({"tweetText": list(texts)})
+
+
+def test_rules():
+    reasons = rule_reasons(tweets(
+        "RT @dsi: ลงทะเบียนเรียนต้องทำยังไงคะ",
+        "555555 ขำมาก",
+        "ช่วยด้วย",
+        "ลงทะเบียนเรียนต้องทำยังไงคะ https://t.co/abc",
+        "ลงทะเบียนเรียน ต้องทำยังไงคะ!! @friend #DSI321",
+        "วันนี้อากาศดีมากเลยไปเดินเล่นที่สวนมา",
+    ))
+    assert reasons.tolist() == ["retweet", "short", "", "", "duplicate", ""]
+
+
+def test_numbers_keep_questions_apart():
+    assert near_duplicate_key("ข้อ 20 ทำยังไงคะ") != near_duplicate_key("ข้อ 21 ทำยังไงคะ")
+    assert near_duplicate_key("ข้อ ๒๐ ทำยังไงคะ") != near_duplicate_key("ข้อ ๒๑ ทำยังไงคะ")
+    reasons = rule_reasons(tweets(
+        "การบ้านข้อ 20 ทำยังไงคะ",
+        "การบ้านข้อ 21 ทำยังไงคะ",
+        "วิชา DSI321 สอบวันไหนครับ",
+        "วิชา DSI324 สอบวันไหนครับ",
+        "สอบวันที่ 12/3 ใช่ไหม",
+        "สอบวันที่ 13/3 ใช่ไหม",
+        "การบ้านข้อ 20 ทำยังไงคะ ??",
+    ))
+    assert reasons.tolist() == ["", "", "", "", "", "", "duplicate"]
+
+
+def test_empty_or_short_keys_are_not_duplicates():
+    assert near_duplicate_key("😭😭😭 ?") == ""
+    assert near_duplicate_key("https://t.co/abc ?") == ""
+    reasons = rule_reasons(tweets(
+        "😭😭😭 ?",
+        "https://t.co/abc ?",
+        "#DSI321 ?",
+        "ทำไม?",
+        "ทำไม??",
+    ))
+    assert reasons.tolist() == [""] * 5
+
+
+def test_migration_run_keeps_distinct_questions():
+    questions = [f"ห้อง {room} อยู่ตึกไหนครับ" for room in range(401, 411)]
+    assert (rule_reasons(tweets(*questions)) == "").all()
+
+
+def labelled(n: int = 400) -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    faq = [f"ลงทะเบียนเรียนวิชา {i} ต้องทำยังไงคะ ช่วยด้วย" for i in range(n // 2)]
+    other = [f"วันนี้ไปกินข้าวร้าน {i} อร่อยมากเลยยย" for i in range(n // 2)]
+    df = pd.DataFrame({"tweetText": faq + other, "isFaq": [True] * len(faq) + [False] * len(other)})
+    df["hash"] = rng.integers(0, 2 ** 63, len(df), dtype=np.int64).astype(np.uint64)
+    return df
+
+
+def test_calibrate_threshold():
+    scores = np.array([0.9, 0.8, 0.7, 0.6, 0.1, 0.2])
+    labels = np.array([1, 1, 1, 1, 0, 0])
+    assert calibrate_threshold(scores, labels, 1.0) == 0.6
+    assert calibrate_threshold(scores, labels, 0.75) == 0.7
+    assert calibrate_threshold(scores, labels, 0.5) == 0.8
+    with pytest.raises(ValueError):
+        calibrate_threshold(scores, np.zeros(6), 0.9)
+
+
+def test_model_threshold():
+    model = train(labelled(), recall=0.98, epochs=100)
+    assert 0 < model.threshold < 1 and model.recall == 0.98
+
+    df = tweets("สอบถามเรื่องลงทะเบียนเรียนวิชาเลือกค่ะ ทำยังไง", "ไปกินข้าวร้านใหม่มา อร่อยมากเลยยยยย")
+    scores = model.scores(df["tweetText"].tolist())
+    assert scores[0] > scores[1]
+    assert prefilter.prefilter(df, model=model, threshold=0.0).tolist() == ["", ""]
+    assert prefilter.prefilter(df, model=model, threshold=1.01).tolist() == ["model", "model"]
+    between = float(scores.mean())
+    assert prefilter.prefilter(df, model=model, threshold=between).tolist() == ["", "model"]
+
+
+def test_model_round_trip(tmp_path):
+    model = PrefilterModel(np.linspace(-1, 1, 1 << 10), 0.25, threshold=0.3, recall=0.95, bits=10)
+    model.save(tmp_path / "model.npz")
+    loaded = PrefilterModel.load(tmp_path / "model.npz")
+    texts = ["ทำยังไงคะ", "hello world"]
+    assert np.allclose(loaded.scores(texts), model.scores(texts), atol=1e-6)
+    assert (loaded.threshold, loaded.recall, loaded.bits) == (0.3, 0.95, 10)
+
+
+def test_disabled_keeps_everything(monkeypatch):
+    monkeypatch.setattr(prefilter, "PREFILTER_ENABLED", False)
+    assert prefilter.prefilter(tweets("RT @a: x", "x")).tolist() == ["", ""]
@@ -0,0 +1,31 @@
+import pytest
+
+import run_metrics
+
+
+@pytest.fixture(autouse=True)
+def clean_metrics():
+    run_metrics.reset()
+    yield
+    run_metrics.reset()
+
+
+def test_prometheus_values_are_not_rounded():
+    run_metrics.inc("bytes_uploaded", 1234567, collection="sync")
+    run_metrics.inc("bytes_uploaded", 98765432109, collection="faq")
+    run_metrics.gauge("queue_depth", 0.125)
+    run_metrics.gauge("lag_seconds", 1234567.891)
+
+    lines = run_metrics.to_prometheus().splitlines()
+    assert 'pipeline_bytes_uploaded_total{collection="sync"} 1234567' in lines
+    assert 'pipeline_bytes_uploaded_total{collection="faq"} 98765432109' in lines
+    assert "pipeline_queue_depth 0.125" in lines
+    assert "pipeline_lag_seconds 1234567.891" in lines
+
+
+def test_prometheus_special_values():
+    run_metrics.gauge("ratio", float("nan"))
+    run_metrics.gauge("limit", float("inf"))
+    lines = run_metrics.to_prometheus().splitlines()
+    assert "pipeline_ratio NaN" in lines
+    assert "pipeline_limit +Inf" in lines
@@ -0,0 +1,117 @@
+from datetime import datetime, timedelta
+import json
+import multiprocessing
+
+import pytest
+
+import scheduler
+from scheduler import (
+    SCHEDULE_MAX_MINUTES, SCHEDULE_MAX_SCROLLS, SCHEDULE_MIN_MINUTES, SCHEDULE_TARGET_TWEETS,
+    due_tags, load_schedule, load_tags, plan_interval, record_run, scroll_cap,
+)
+from tag_state import INITIAL_LOOKBACK
+
+START = datetime(2026, 3, 1, 12, 0)
+
+
+def minutes_until(entry, now):
+    return (datetime.fromisoformat(entry["nextRun"]) - now).total_seconds() / 60
+
+
+def test_plan_interval_is_bounded():
+    assert plan_interval(0) == plan_interval(None) == SCHEDULE_MAX_MINUTES
+    assert plan_interval(1e-6) == SCHEDULE_MAX_MINUTES
+    assert plan_interval(1e6) == SCHEDULE_MIN_MINUTES
+    rate = SCHEDULE_TARGET_TWEETS / 60
+    assert plan_interval(rate) == pytest.approx(60)
+
+
+def test_scroll_cap_is_bounded():
+    assert scroll_cap(0) == 1
+    assert scroll_cap(scheduler.TWEETS_PER_SCROLL * 2) == 3
+    assert scroll_cap(1e9) == SCHEDULE_MAX_SCROLLS
+
+
+def test_velocity_moving_average():
+    tag = "#velocity"
+    lookback_minutes = INITIAL_LOOKBACK.total_seconds() / 60
+    first = record_run(tag, 144, START, 30, now=START)
+    assert first["rate"] == pytest.approx(144 / lookback_minutes)
+    assert minutes_until(first, START) == pytest.approx(plan_interval(first["rate"]), abs=1)
+    assert first["maxScrolls"] == scroll_cap(first["rate"] * plan_interval(first["rate"]))
+
+    # one half-life later the new observation gets half the weight
+    later = START + timedelta(hours=scheduler.SCHEDULE_HALF_LIFE_HOURS)
+    observed = 72 / (scheduler.SCHEDULE_HALF_LIFE_HOURS * 60)
+    second = record_run(tag, 72, later, 30, now=later)
+    assert second["rate"] == pytest.approx((first["rate"] + observed) / 2)
+    assert second["lastRun"] == later.isoformat(timespec="seconds")
+    assert second["lastNew"] == 72
+
+
+def test_quiet_tag_waits_the_longest():
+    entry = record_run("#quiet", 0, START, 30, now=START)
+    assert entry["rate"] == 0
+    assert minutes_until(entry, START) == pytest.approx(SCHEDULE_MAX_MINUTES)
+    assert entry["maxScrolls"] == 1
+
+
+def test_saturated_run_never_lowers_the_rate():
+    tag = "#busy"
+    record_run(tag, 10, START, 30, now=START)
+    later = START + timedelta(hours=1)
+    entry = record_run(tag, 30 * scheduler.TWEETS_PER_SCROLL, later, 30, now=later)
+    # 600 tweets in an hour, and the scroll cap stopped the run
+    assert entry["rate"] == pytest.approx(10)
+    assert minutes_until(entry, later) == pytest.approx(SCHEDULE_MIN_MINUTES)
+
+
+def test_failures_back_off_and_reset():
+    tag = "#flaky"
+    first = record_run(tag, 20, START, 30, now=START)
+    waits = []
+    for i in range(8):
+        now = START + timedelta(minutes=i)
+        entry = record_run(tag, None, now, 30, now=now)
+        waits.append(minutes_until(entry, now))
+        # a failed run tells nothing about the rate
+        assert entry["rate"] == first["rate"] and entry["lastRun"] == first["lastRun"]
+    assert waits[:3] == [SCHEDULE_MIN_MINUTES * 2, SCHEDULE_MIN_MINUTES * 4, SCHEDULE_MIN_MINUTES * 8]
+    assert waits == sorted(waits) and waits[-1] == SCHEDULE_MAX_MINUTES
+    assert entry["failures"] == 8
+
+    later = START + timedelta(hours=2)
+    assert record_run(tag, 5, later, 30, now=later)["failures"] == 0
+
+
+def test_due_tags():
+    record_run("#due_soon", 0, START, 30, now=START)
+    assert due_tags(["#due_soon", "#never_run"], now=START) == [("#never_run", SCHEDULE_MAX_SCROLLS)]
+    later = START + timedelta(minutes=SCHEDULE_MAX_MINUTES)
+    assert due_tags(["#due_soon"], now=later) == [("#due_soon", 1)]
+
+
+def test_load_tags(tmp_path):
+    path = tmp_path / "tags.json"
+    path.write_text(json.dumps({"tags": ["#a", {"tag": "#b", "enabled": False}, {"tag": "#c"}, "#a"]}))
+    assert load_tags(path) == ["#a", "#c"]
+
+
+def record_many(worker: int):
+    for i in range(15):
+        record_run(f"#process{worker}x{i}", i, START, 30, now=START)
+
+
+def test_processes_do_not_lose_each_others_runs():
+    """Each deployment worker records its runs in the one schedule file."""
+    context = multiprocessing.get_context("fork")
+    workers = [context.Process(target=record_many, args=(w,)) for w in range(6)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(timeout=60)
+        assert worker.exitcode == 0
+
+    schedule = load_schedule()
+    assert {f"process{w}x{i}" for w in range(6) for i in range(15)} <= set(schedule)
+    assert not list(scheduler.schedule_path.parent.glob("schedule.json.*.tmp"))
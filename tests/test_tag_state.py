@@ -0,0 +1,61 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+import tag_state
+from tag_state import (
+    advance_extraction_watermark, load_state, load_watermark, mark_dirty, reached_watermark, save_watermark,
+    state_path,
+)
+
+
+def scraped(i: int) -> pd.DataFrame:
+    return pd.DataFrame({
+        "tweetId": [f"t{i}"],
+        "tweetText": [f"tweet {i}"],
+        "postTime": [pd.Timestamp("2026-01-01") + pd.Timedelta(minutes=i)],
+    })
+
+
+def test_concurrent_updates_are_not_lost():
+    """The scraper and the extractor update one tag's state at the same time."""
+    tag = "#concurrent"
+    days = pd.date_range("2026-01-01", periods=40, freq="D")
+
+    def scrape(i):
+        save_watermark(tag, scraped(i))
+        mark_dirty(tag, days[-1 - i % len(days)])
+
+    def extract(i):
+        advance_extraction_watermark(tag, days[i % len(days)], dirty_since="never set")
+
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        futures = [pool.submit(scrape, i) for i in range(200)] + [pool.submit(extract, i) for i in range(200)]
+        for future in futures:
+            future.result()
+
+    watermark = load_watermark(tag)
+    assert watermark["tweetIds"] == {f"t{i}" for i in range(200)}
+    assert watermark["postTime"] == pd.Timestamp("2026-01-01") + pd.Timedelta(minutes=199)
+    extraction = load_state(tag)["extraction"]
+    assert extraction["processedThrough"] == days[-1].date().isoformat()
+    assert extraction["dirtySince"] == days[0].date().isoformat()
+    assert not list(tag_state.state_dir.glob(f"{state_path(tag).name}.*.tmp"))
+
+
+def test_reached_watermark():
+    watermark = {"postTime": pd.Timestamp("2026-03-05 14:30"), "tweetIds": {"t1"}, "textKeys": set()}
+    assert reached_watermark(watermark, tweet_id="t1")
+    assert not reached_watermark(watermark, tweet_id="t2", post_time=pd.Timestamp("2026-03-05 15:00"))
+    assert reached_watermark(watermark, post_time=pd.Timestamp("2026-03-05 14:00"))
+    assert not reached_watermark(watermark, post_time=pd.NaT)
+    assert not reached_watermark({}, post_time=pd.Timestamp("2020-01-01"))
+
+
+def test_date_only_post_time_compares_days():
+    """A "Mar 5" post parses to midnight but may be from after the watermark that day."""
+    watermark = {"postTime": pd.Timestamp("2026-03-05 14:30"), "tweetIds": set(), "textKeys": set()}
+    assert not reached_watermark(watermark, post_time=pd.Timestamp("2026-03-05"), date_only=True)
+    assert not reached_watermark(watermark, post_time=pd.Timestamp("2026-03-06"), date_only=True)
+    assert reached_watermark(watermark, post_time=pd.Timestamp("2026-03-04"), date_only=True)
+    assert reached_watermark(watermark, post_time=pd.Timestamp("2026-03-05"))
@@ -0,0 +1,51 @@
+from pathlib import Path
+
+from timeline import load_fixture, parse_created_at, parse_search_timeline, tweets_from_fixture
+
+fixtures = Path(__file__).resolve().parent / "fixtures"
+
+
+def test_parse_search_timeline():
+    [payload] = load_fixture(fixtures / "search_timeline.json")
+    tweets = parse_search_timeline(payload)
+
+    # the tombstone and both cursors yield nothing
+    assert [t["tweetId"] for t in tweets] == [
+        "1830000000000000001", "1830000000000000002", "1830000000000000003",
+    ]
+    assert tweets[0] == {
+        "tweetId": "1830000000000000001",
+        "username": "นักศึกษา ปี 1@dsi_freshman",
+        "tweetText": "ลงทะเบียนเรียนต้องทำยังไงคะ #DSI321",
+        "postTime": parse_created_at("Mon Sep 02 03:15:00 +0000 2024").isoformat(),
+    }
+    # a long post: the full text from note_tweet, not the truncated full_text
+    assert tweets[1]["tweetText"].endswith("ยังไม่ได้กดยืนยันรายวิชาเลย #DSI321")
+    assert "https://t.co" not in tweets[1]["tweetText"]
+    # TweetWithVisibilityResults is unwrapped, the user has the older legacy layout
+    assert tweets[2]["username"] == "DSI Office@dsi_office"
+    assert tweets[2]["tweetText"] == "ประกาศ: เปิดให้ยื่นคำร้องถึงวันศุกร์ #DSI321"
+
+
+def test_parse_search_timeline_without_tweets():
+    assert parse_search_timeline({}) == []
+    assert parse_search_timeline({"data": {"search_by_raw_query": {"search_timeline": {"timeline": {
+        "instructions": [{"type": "TimelineAddEntries", "entries": [{
+            "entryId": "cursor-bottom-0",
+            "content": {"entryType": "TimelineTimelineCursor", "value": "abc", "cursorType": "Bottom"},
+        }]}],
+    }}}}}) == []
+
+
+def test_tweets_from_har():
+    # only the SearchTimeline responses are read, the first one base64-encoded
+    payloads = load_fixture(fixtures / "search_timeline.har")
+    assert len(payloads) == 2
+    assert payloads[0] == load_fixture(fixtures / "search_timeline.json")[0]
+
+    tweets = tweets_from_fixture(fixtures / "search_timeline.har")
+    # the tweet repeated on the second page is kept once, module items are read
+    assert [t["tweetId"] for t in tweets] == [
+        "1830000000000000001", "1830000000000000002", "1830000000000000003", "1829999999999999990",
+    ]
+    assert tweets[-1]["tweetText"] == "ถอนรายวิชาได้ถึงวันไหนครับ #DSI321"
@@ -0,0 +1,42 @@
+from pathlib import Path
+
+import pandas as pd
+
+from topic_agg import agg_path, read_topic_counts, rebuild_topic_counts, update_topic_counts
+
+agg_dir = Path("data") / "faq_agg_test"
+
+
+def faq(rows: int, topic: str, day: str = "2026-03-01") -> pd.DataFrame:
+    return pd.DataFrame({"postTime": [pd.Timestamp(day)] * rows, "topic": [[topic]] * rows})
+
+
+def counts(tag: str) -> dict:
+    df = read_topic_counts(agg_dir, tag, columns=["topic", "count"])
+    return dict(zip(df["topic"], df["count"]))
+
+
+def test_deltas_add_up_and_rerun_replaces():
+    tag = "deltas"
+    update_topic_counts(agg_dir, tag, faq(2, "ทุน"), existing_faq=lambda: faq(3, "ทุน"), run_id="run-1")
+    update_topic_counts(agg_dir, tag, faq(1, "สอบ"), run_id="run-2")
+    # committing run-2 again rewrites its delta
+    update_topic_counts(agg_dir, tag, faq(1, "สอบ"), run_id="run-2")
+    assert counts(tag) == {"ทุน": 5, "สอบ": 1}
+
+
+def test_delta_committed_during_rebuild_is_kept():
+    tag = "interleaved"
+    update_topic_counts(agg_dir, tag, faq(2, "ทุน"), existing_faq=faq(0, "ทุน"), run_id="before")
+    stored = faq(2, "ทุน")
+
+    def read_store():
+        # an extract run commits while compaction is reading the FAQ store:
+        # its rows are not in what was read, only in its delta
+        update_topic_counts(agg_dir, tag, faq(4, "สอบ"), run_id="during")
+        return stored
+
+    rebuild_topic_counts(agg_dir, tag, read_store)
+    assert counts(tag) == {"ทุน": 2, "สอบ": 4}
+    files = sorted(p.name for p in agg_path(agg_dir, tag).parent.glob("*.parquet"))
+    assert files == ["delta-during.parquet", "part.parquet"]
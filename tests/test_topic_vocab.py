@@ -0,0 +1,30 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from topic_vocab import TopicVocab, vocab_lock
+
+
+def test_merges_spelling_variants():
+    vocab = TopicVocab.load("#variants")
+    first = vocab.resolve("การลงทะเบียนเรียน")
+    assert vocab.resolve(" การลงทะเบียนเรียน​ ") == first
+    assert vocab.resolve("การลงทะเบียนเรียน?") == first
+    assert vocab.resolve("ทุนการศึกษา") != first
+    assert vocab.resolve_all(["ทุนการศึกษา", None, "", "ทุนการศึกษา"]) == [1]
+
+
+def test_concurrent_load_save_keeps_every_label():
+    """Extraction and compaction load, extend and save the same dictionary."""
+    tag = "#shared"
+
+    def add(i):
+        with vocab_lock(tag):
+            vocab = TopicVocab.load(tag)
+            vocab.resolve(f"topic {i:03d} {'ก' * (i % 7)}xyz{i}")
+            vocab.save()
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(add, range(60)))
+
+    vocab = TopicVocab.load(tag)
+    assert len(vocab) == 60
+    assert sorted(vocab.labels) == sorted(f"topic {i:03d} {'ก' * (i % 7)}xyz{i}" for i in range(60))